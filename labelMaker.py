@@ -9,6 +9,7 @@ import platform
 import sys
 import xlrd
 import glob 
+import hashlib
 from functools import partial 
 from PIL import Image   
 
@@ -16,7 +17,7 @@ from PyQt5.QtCore import QSize, Qt, QPoint, QByteArray, QTimer, QFileInfo, QPoin
 from PyQt5.QtGui import QImage, QCursor, QPixmap, QImageReader
 from PyQt5.QtWidgets import QMainWindow, QListWidget, QVBoxLayout, QToolButton, QHBoxLayout, QDockWidget, QWidget, \
     QSlider, QGraphicsOpacityEffect, QMessageBox, QListView, QScrollArea, QWidgetAction, QApplication, QLabel, QGridLayout, \
-    QFileDialog, QListWidgetItem, QComboBox, QDialog
+    QFileDialog, QListWidgetItem, QComboBox, QDialog, QProgressDialog
 
 __dir__ = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,6 +27,8 @@ sys.path.append("..")
 sys.path.insert(0, './')
 
 from ocr import PaddleOCR 
+from tools.infer.ocr_server import OCRClient
+from ppocr.utils.reading_order import reading_order
 from libs.constants import *
 from libs.utils import *
 from libs.labelColor import label_colormap
@@ -42,13 +45,17 @@ from libs.hashableQListWidgetItem import HashableQListWidgetItem
 from libs.editinlist import EditInList
 from libs.unique_label_qlist_widget import UniqueLabelQListWidget
 from libs.keyDialog import KeyDialog
+from libs.labelIndex import LazyLabels
+from libs.projectStore import ProjectStore
+from libs.labelJournal import COMPACT_RECORDS
+from libs.fileListModel import FileListModel
+from libs.imageCache import ImageCache
+from libs.thumbnailCache import ThumbnailCache
+from libs.imagePyramid import ImagePyramid, PYRAMID_PIXELS
+from libs.exportEngine import ExportEngine, DetTarget, DetMMTarget, KieTarget, RecTarget, RecLmdbTarget
+from libs.exportWorker import ExportWorker
 
-from libs.augment import ( 
-    Contrast, Brightness, JpegCompression, Pixelate, 
-    GlassBlur, GaussianNoise, ShotNoise, ImpulseNoise, SpeckleNoise,
-    AutoContrast, Sharpness, Color, Stretch, Distort, 
-    Fog, Frost, Snow, Rain, Shadow, Curve, Distortion_Sin, Distortion_Cos   
-)  
+from libs.recAugment import RecAugmentGenerator, DEFAULT_RECIPE
 
 
 __appname__ = 'labelMaker'
@@ -65,7 +72,8 @@ class MainWindow(QMainWindow):
                  kie_mode=True,
                  default_filename=None,
                  default_predefined_class_file=None,
-                 default_save_dir=None):
+                 default_save_dir=None,
+                 ocr_server=None):
         super(MainWindow, self).__init__()
         self.setWindowTitle(__appname__)
         self.setWindowState(Qt.WindowMaximized)  # set window max
@@ -97,12 +105,17 @@ class MainWindow(QMainWindow):
         self.key_dialog_tip = getStr('keyDialogTip')
 
         self.defaultSaveDir = default_save_dir
-        self.ocr = PaddleOCR(use_angle_cls=False,
-                             det=True,
-                             cls=False,
-                             use_gpu=True,
-                             lang=lang,
-                             show_log=False) 
+        if ocr_server:
+            # share the warm models of tools/infer/ocr_server.py
+            self.ocr = OCRClient(ocr_server)
+        else:
+            self.ocr = PaddleOCR(use_angle_cls=False,
+                                 det=True,
+                                 cls=False,
+                                 use_gpu=True,
+                                 lang=lang,
+                                 show_log=False,
+                                 use_ocr_cache=True) 
 
         # For loading all image under a directory
         self.mImgList = []
@@ -112,6 +125,7 @@ class MainWindow(QMainWindow):
         self.lastOpenDir = None
         self.result_dic = []
         self.result_dic_locked = []
+        self.recHashes = {}  # crop hash -> rec result of re-recognitions of the current image
         self.changeFileFolder = False
         self.haveAutoReced = False
         self.labelFile = None
@@ -140,17 +154,38 @@ class MainWindow(QMainWindow):
         self.noLabelText = getStr('nullLabel')
         self.model = 'paddle'
         self.PPreader = None
-        self.autoSaveNum = 5
+        # confirmations after which Label.txt is rewritten in the background
+        self.autoSaveNum = COMPACT_RECORDS
+        self.projectStore = None
+        # decoded images around the current one, see libs/imageCache.py
+        self.imageCache = ImageCache()
+        self.prefetchNum = 3
+        # icon strip thumbnails, made on worker threads
+        self.thumbnailCache = ThumbnailCache(parent=self)
+        self.thumbnailCache.thumbnailReady.connect(self.setThumbnail)
+        # exports run on this, see libs/exportEngine.py
+        self.exportWorker = None
+        # crop encoding of exportRecLmdb: jpg, png or raw
+        self.lmdbEncoding = 'jpg'
+        # makeRecData: (augmentation, outputs per crop), master seed and
+        # 'files' or 'lmdb', see libs/recAugment.py
+        self.augmentRecipe = list(DEFAULT_RECIPE)
+        self.augmentSeed = 0
+        self.augmentOutput = 'files'
 
         #  ================== File List  ==================
 
         filelistLayout = QVBoxLayout()
         filelistLayout.setContentsMargins(0, 0, 0, 0)
 
-        self.fileListWidget = QListWidget()
-        self.fileListWidget.itemClicked.connect(self.fileitemDoubleClicked)
-        self.fileListWidget.setIconSize(QSize(25, 25))
-        filelistLayout.addWidget(self.fileListWidget)
+        # rows are rendered on demand, so large folders open instantly
+        self.fileListModel = FileListModel(newIcon('done'), newIcon('close'), self)
+        self.fileListView = QListView()
+        self.fileListView.setModel(self.fileListModel)
+        self.fileListView.setUniformItemSizes(True)
+        self.fileListView.clicked.connect(self.fileitemDoubleClicked)
+        self.fileListView.setIconSize(QSize(25, 25))
+        filelistLayout.addWidget(self.fileListView)
 
         fileListContainer = QWidget()
         fileListContainer.setLayout(filelistLayout)
@@ -491,9 +526,14 @@ class MainWindow(QMainWindow):
                             '', 'save', getStr('exportDetMM'), enabled=False)
         exportRecMM = action(getStr('exportRecMM'), self.exportRecMM,
                          '', 'save', getStr('exportRecMM'), enabled=False)
+        exportRecLmdb = action(getStr('exportRecLmdb'), self.exportRecLmdb,
+                         '', 'save', getStr('exportRecLmdb'), enabled=False)
         
         exportKieMM = action(getStr('exportKieMM'), self.exportKieMM,
                             '', 'save', getStr('exportKieMM'), enabled=False)
+
+        exportAll = action(getStr('exportAll'), self.exportAll,
+                            '', 'save', getStr('exportAll'), enabled=False)
         
         makeRecData = action(getStr('makeRecData'), self.makeRecData,
                             '', 'save', getStr('makeRecData'), enabled=False)
@@ -514,6 +554,9 @@ class MainWindow(QMainWindow):
         undo = action(getStr("undo"), self.undoShapeEdit,
                       'Ctrl+Z', "undo", getStr("undo"), enabled=False)
 
+        redo = action(getStr("redo"), self.redoShapeEdit,
+                      'Ctrl+Y', "undo", getStr("redo"), enabled=False)
+
         change_cls = action(getStr("keyChange"), self.change_box_key,
                             'Ctrl+X', "edit", getStr("keyChange"), enabled=False)
 
@@ -583,13 +626,13 @@ class MainWindow(QMainWindow):
                               zoom=zoom, zoomIn=zoomIn, zoomOut=zoomOut, zoomOrg=zoomOrg,
                               fitWindow=fitWindow, fitWidth=fitWidth,
                               zoomActions=zoomActions, saveLabel=saveLabel, change_cls=change_cls,
-                              undo=undo, undoLastPoint=undoLastPoint, open_dataset_dir=open_dataset_dir,
+                              undo=undo, redo=redo, undoLastPoint=undoLastPoint, open_dataset_dir=open_dataset_dir,
                               rotateLeft=rotateLeft, rotateRight=rotateRight, lock=lock, exportKie=exportKie, exportDet=exportDet, 
-                              exportRecMM=exportRecMM, exportDetMM=exportDetMM, exportKieMM=exportKieMM, 
+                              exportRecMM=exportRecMM, exportRecLmdb=exportRecLmdb, exportDetMM=exportDetMM, exportKieMM=exportKieMM, exportAll=exportAll, 
                               makeRecData=makeRecData, 
                               fileMenuActions=(opendir, open_dataset_dir, saveLabel, exportKie, exportDet, resetAll, quit),
                               beginner=(), advanced=(),
-                              editMenu=(createpoly, edit, copy, delete, singleRere, singleExport, None, undo, undoLastPoint,
+                              editMenu=(createpoly, edit, copy, delete, singleRere, singleExport, None, undo, redo, undoLastPoint,
                                         None, rotateLeft, rotateRight, None, color1, self.drawSquaresOption, lock,
                                         None, change_cls),
 
@@ -629,11 +672,14 @@ class MainWindow(QMainWindow):
         self.autoSaveOption.setCheckable(True)
         self.autoSaveOption.setChecked(settings.get(SETTING_PAINT_LABEL, False))
         self.autoSaveOption.triggered.connect(self.autoSaveFunc)
+        if self.autoSaveOption.isChecked():
+            self.autoSaveNum = 1
 
         addActions(self.menus.file,
                    (opendir, open_dataset_dir, 
-                    None, saveLabel, exportDet, exportRec, exportKie, 
+                    None, saveLabel, exportDet, exportRec, exportRecLmdb, exportKie, 
                     None, exportDetMM, exportRecMM, exportKieMM, 
+                    None, exportAll, 
                     None, makeRecData, 
                     None, self.autoSaveOption, 
                     None, resetAll, exportCropImg,
@@ -659,6 +705,7 @@ class MainWindow(QMainWindow):
 
         # Application state.
         self.image = QImage()
+        self.cvImage = None
         self.filePath = ustr(default_filename)
         self.lastOpenDir = None
         self.recentFiles = []
@@ -781,6 +828,7 @@ class MainWindow(QMainWindow):
         self.BoxList.clear()
         self.filePath = None
         self.imageData = None
+        self.cvImage = None
         self.labelFile = None
         self.canvas.resetState()
         self.labelCoordinates.clear()
@@ -950,6 +998,7 @@ class MainWindow(QMainWindow):
         if box != [(int(p.x()), int(p.y())) for p in shape.points]:
             # shape.points = box
             shape.points = [QPointF(p[0], p[1]) for p in box]
+            self.canvas.updateIndex([shape])
 
             # QPointF(x,y)
             # shape.line_color = generateColorByText(shape.label)
@@ -1000,6 +1049,7 @@ class MainWindow(QMainWindow):
             text = [(int(p.x()), int(p.y())) for p in shape.points]
             item.setText(str(text))
         self.actions.undo.setEnabled(True)
+        self.actions.redo.setEnabled(False)
         self.setDirty()
 
     def indexTo5Files(self, currIndex):
@@ -1011,8 +1061,8 @@ class MainWindow(QMainWindow):
             return self.mImgList[currIndex - 2: currIndex + 3]
 
     # Tzutalin 20160906 : Add file list and dock to move faster
-    def fileitemDoubleClicked(self, item=None):
-        self.currIndex = self.mImgList.index(ustr(os.path.join(os.path.abspath(self.dirname), item.text())))
+    def fileitemDoubleClicked(self, index=None):
+        self.currIndex = index.row()
         filename = self.mImgList[self.currIndex]
         if filename:
             self.mImgList5 = self.indexTo5Files(self.currIndex)
@@ -1020,7 +1070,7 @@ class MainWindow(QMainWindow):
             self.loadFile(filename)
 
     def iconitemDoubleClicked(self, item=None):
-        self.currIndex = self.mImgList.index(ustr(os.path.join(item.toolTip())))
+        self.currIndex = self.fileListModel.row(ustr(item.toolTip()))
         filename = self.mImgList[self.currIndex]
         if filename:
             self.mImgList5 = self.indexTo5Files(self.currIndex)
@@ -1041,6 +1091,7 @@ class MainWindow(QMainWindow):
             shape.selected = True
             self.shapesToItems[shape].setSelected(True)
             self.shapesToItemsbox[shape].setSelected(True)
+        self.canvas.invalidateLayer()
 
         self.labelList.scrollToItem(self.currentItem())  # QAbstractItemView.EnsureVisible
         self.BoxList.scrollToItem(self.currentBox())
@@ -1073,6 +1124,7 @@ class MainWindow(QMainWindow):
 
     def addLabel(self, shape):
         shape.paintLabel = self.displayLabelOption.isChecked()
+        self.canvas.invalidateLayer()
         item = HashableQListWidgetItem(shape.label)
         item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
         item.setCheckState(Qt.Unchecked) if shape.difficult else item.setCheckState(Qt.Checked)
@@ -1242,7 +1294,9 @@ class MainWindow(QMainWindow):
         shape = self.itemsToShapes[item]
         label = item.text()
         if label != shape.label:
-            shape.label = item.text()
+            self.canvas.editLabels([shape], [label])
+            self.actions.undo.setEnabled(True)
+            self.actions.redo.setEnabled(False)
             # shape.line_color = generateColorByText(shape.label)
             self.setDirty()
         elif not ((item.checkState() == Qt.Unchecked) ^ (not shape.difficult)):
@@ -1292,6 +1346,7 @@ class MainWindow(QMainWindow):
                 self.actions.createpoly.setEnabled(True)
                 self.actions.undoLastPoint.setEnabled(False)
                 self.actions.undo.setEnabled(True)
+                self.actions.redo.setEnabled(False)
             else:
                 self.actions.editMode.setEnabled(True)
             self.setDirty()
@@ -1308,6 +1363,7 @@ class MainWindow(QMainWindow):
         shape.fill_color = QColor(r, g, b, 128)
         shape.select_line_color = QColor(255, 255, 255)
         shape.select_fill_color = QColor(r, g, b, 155)
+        self.canvas.invalidateLayer()
 
     def _get_rgb_by_label(self, label, kie_mode):
         shift_auto_shape_color = 2  # use for random color
@@ -1419,12 +1475,12 @@ class MainWindow(QMainWindow):
         # Tzutalin 20160906 : Add file list and dock to move faster
         # Highlight the file item
 
-        if unicodeFilePath and self.fileListWidget.count() > 0:
-            if unicodeFilePath in self.mImgList:
-                index = self.mImgList.index(unicodeFilePath)
-                fileWidgetItem = self.fileListWidget.item(index)
+        if unicodeFilePath and self.fileListModel.rowCount() > 0:
+            index = self.fileListModel.row(unicodeFilePath)
+            if index >= 0:
+                self.currIndex = index
                 print('unicodeFilePath is', unicodeFilePath)
-                fileWidgetItem.setSelected(True)
+                self.fileListView.setCurrentIndex(self.fileListModel.index(index))
                 self.iconlist.clear()
                 self.additems5(None)
 
@@ -1437,7 +1493,7 @@ class MainWindow(QMainWindow):
                         self.iconlist.scrollToItem(titem)
                         break
             else:
-                self.fileListWidget.clear()
+                self.fileListModel.clear()
                 self.mImgList.clear()
                 self.iconlist.clear()
 
@@ -1446,20 +1502,39 @@ class MainWindow(QMainWindow):
 
         if unicodeFilePath and os.path.exists(unicodeFilePath):
             self.canvas.verified = False
-            cvimg = cv2.imdecode(np.fromfile(unicodeFilePath, dtype=np.uint8), 1)
-            height, width, depth = cvimg.shape
-            cvimg = cv2.cvtColor(cvimg, cv2.COLOR_BGR2RGB)
-            image = QImage(cvimg.data, width, height, width * depth, QImage.Format_RGB888)
-
-            if image.isNull():
-                self.errorMessage(u'Error opening file',
-                                  u"<p>Make sure <i>%s</i> is a valid image file." % unicodeFilePath)
-                self.status("Error reading %s" % unicodeFilePath)
-                return False
+            # huge scans are shown tile by tile from disk backed levels, see
+            # libs/imagePyramid.py; a cached pyramid needs no decode at all
+            pyramid = ImagePyramid.cached(unicodeFilePath)
+            cvimg = image = None
+            if pyramid is None:
+                decoded = self.imageCache.get(unicodeFilePath)
+                if decoded is not None:
+                    cvimg, image = decoded
+                if decoded is None or image.isNull():
+                    self.errorMessage(u'Error opening file',
+                                      u"<p>Make sure <i>%s</i> is a valid image file." % unicodeFilePath)
+                    self.status("Error reading %s" % unicodeFilePath)
+                    return False
+                if image.width() * image.height() > PYRAMID_PIXELS:
+                    # the levels are written in the background, no decoded
+                    # copy is kept here
+                    pyramid = ImagePyramid(unicodeFilePath, cvimg)
+                    self.imageCache.discard(unicodeFilePath)
+                    cvimg = image = decoded = None
             self.status("Loaded %s" % os.path.basename(unicodeFilePath))
-            self.image = image
+            if unicodeFilePath != self.filePath:
+                self.recHashes.clear()
+            if isinstance(self.image, ImagePyramid):
+                self.image.close()
             self.filePath = unicodeFilePath
-            self.canvas.loadPixmap(QPixmap.fromImage(image))
+            # BGR page kept for re-recognition, pyramids give it by level(0)
+            self.cvImage = cvimg
+            if pyramid is not None:
+                self.image = pyramid
+                self.canvas.loadPixmap(pyramid)
+            else:
+                self.image = image
+                self.canvas.loadPixmap(QPixmap.fromImage(image))
 
             if self.validFilestate(filePath) is True:
                 self.setClean()
@@ -1485,18 +1560,26 @@ class MainWindow(QMainWindow):
                 self.labelList.item(self.labelList.count() - 1).setSelected(True)
 
             # show file list image count
-            select_indexes = self.fileListWidget.selectedIndexes()
-            if len(select_indexes) > 0:
-                self.fileDock.setWindowTitle(self.fileListName + f" ({select_indexes[0].row() + 1}"
-                                                                 f"/{self.fileListWidget.count()})")
+            row = self.fileListModel.row(unicodeFilePath)
+            if row >= 0:
+                self.fileDock.setWindowTitle(self.fileListName + f" ({row + 1}"
+                                                                 f"/{self.fileListModel.rowCount()})")
             # update show counting
             self.BoxListDock.setWindowTitle(self.BoxListDockName + f" ({self.BoxList.count()})")
             self.labelListDock.setWindowTitle(self.labelListDockName + f" ({self.labelList.count()})")
 
             self.canvas.setFocus(True)
+            if row >= 0:
+                self.prefetchImages(row)
             return True
         return False
 
+    def prefetchImages(self, row):
+        # next images first, annotators mostly move forward
+        rows = [row + i for i in range(1, self.prefetchNum + 1)]
+        rows += [row - i for i in range(1, self.prefetchNum + 1)]
+        self.imageCache.prefetch([self.mImgList[i] for i in rows if 0 <= i < len(self.mImgList)])
+
     def showBoundingBoxFromPPlabel(self, filePath):
         width, height = self.image.width(), self.image.height()
         imgidx = self.getImglabelidx(filePath)
@@ -1512,7 +1595,9 @@ class MainWindow(QMainWindow):
                 shapes.append(('锁定框：待检测', [[s[0] * width, s[1] * height] for s in box['ratio']],
                                DEFAULT_LOCK_COLOR, key_cls, box['difficult']))
         if imgidx in self.PPlabel.keys():
-            for box in self.PPlabel[imgidx]:
+            boxes = self.PPlabel[imgidx]
+            for idx in reading_order([box['points'] for box in boxes]):
+                box = boxes[idx]
                 key_cls = 'None' if not self.kie_mode else box.get('key_cls', 'None')
                 shapes.append((box['transcription'], box['points'], None, key_cls, box.get('difficult', False)))
 
@@ -1596,6 +1681,10 @@ class MainWindow(QMainWindow):
                 self.saveLabelFile()
             except:
                 pass
+            if self.projectStore is not None:
+                self.projectStore.close()
+            self.imageCache.close()
+            self.thumbnailCache.close()
 
     def loadRecent(self, filename):
         if self.mayContinue():
@@ -1651,11 +1740,15 @@ class MainWindow(QMainWindow):
         if not self.kie_mode:
             return
         # load key_cls
-        for image, info in label_dict.items():
-            for box in info:
-                if "key_cls" not in box:
-                    box.update({"key_cls": "None"})
-                self.existed_key_cls_set.add(box["key_cls"])
+        if isinstance(label_dict, LazyLabels):
+            # from the key_classes table, without parsing every label
+            self.existed_key_cls_set.update(label_dict.keyClasses())
+        else:
+            for image, info in label_dict.items():
+                for box in info:
+                    if "key_cls" not in box:
+                        box.update({"key_cls": "None"})
+                    self.existed_key_cls_set.add(box["key_cls"])
         if len(self.existed_key_cls_set) > 0:
             for key_text in self.existed_key_cls_set:
                 if not self.keyList.findItemsByLabel(key_text):
@@ -1684,13 +1777,17 @@ class MainWindow(QMainWindow):
             self.saveLabelFile()
 
         if not isDelete:
+            if self.projectStore is not None:
+                self.projectStore.close()
+            # project.db holds the labels, see libs/projectStore.py
+            self.projectStore = ProjectStore(dirpath, compactRecords=self.autoSaveNum)
             self.loadFilestate(dirpath)
             self.PPlabelpath = dirpath + '/Label.txt'
-            self.PPlabel = self.loadLabelFile(self.PPlabelpath)
+            self.PPlabel = self.loadLabelFile('labels')
             self.Cachelabelpath = dirpath + '/Cache.cach'
-            self.Cachelabel = self.loadLabelFile(self.Cachelabelpath)
+            self.Cachelabel = self.loadLabelFile('cache')
             if self.Cachelabel:
-                self.PPlabel = dict(self.Cachelabel, **self.PPlabel)
+                self.PPlabel = LazyLabels.merge(self.Cachelabel, self.PPlabel)
 
             self.init_key_list(self.PPlabel)
 
@@ -1703,25 +1800,18 @@ class MainWindow(QMainWindow):
         self.statusBar().show()
 
         self.filePath = None
-        self.fileListWidget.clear()
+        self.imageCache.clear()
         self.mImgList = self.scanAllImages(dirpath)
         self.mImgList5 = self.mImgList[:5]
+        self.fileListModel.setImages(self.mImgList, self.fileStatedict)
         self.openNextImg()
-        doneicon = newIcon('done')
-        closeicon = newIcon('close')
-        for imgPath in self.mImgList:
-            filename = os.path.basename(imgPath)
-            if self.validFilestate(imgPath) is True:
-                item = QListWidgetItem(doneicon, filename)
-            else:
-                item = QListWidgetItem(closeicon, filename)
-            self.fileListWidget.addItem(item)
 
         print('DirPath in importDirImages is', dirpath)
         self.iconlist.clear()
         self.additems5(dirpath)
         self.changeFileFolder = True
         self.haveAutoReced = False
+        self.recHashes.clear()
         self.AutoRecognition.setEnabled(True)
         self.AutoCurRecognition.setEnabled(True) 
         self.reRecogButton.setEnabled(True)
@@ -1731,8 +1821,8 @@ class MainWindow(QMainWindow):
         self.actions.rotateLeft.setEnabled(True)
         self.actions.rotateRight.setEnabled(True)
 
-        self.fileListWidget.setCurrentRow(0)  # set list index to first
-        self.fileDock.setWindowTitle(self.fileListName + f" (1/{self.fileListWidget.count()})")  # show image count
+        self.fileListView.setCurrentIndex(self.fileListModel.index(0))  # set list index to first
+        self.fileDock.setWindowTitle(self.fileListName + f" (1/{self.fileListModel.rowCount()})")  # show image count
 
     def openPrevImg(self, _value=False):
         if len(self.mImgList) <= 0:
@@ -1741,7 +1831,7 @@ class MainWindow(QMainWindow):
         if self.filePath is None:
             return
 
-        currIndex = self.mImgList.index(self.filePath)
+        currIndex = self.fileListModel.row(self.filePath)
         self.mImgList5 = self.mImgList[:5]
         if currIndex - 1 >= 0:
             filename = self.mImgList[currIndex - 1]
@@ -1761,7 +1851,7 @@ class MainWindow(QMainWindow):
             filename = self.mImgList[0]
             self.mImgList5 = self.mImgList[:5]
         else:
-            currIndex = self.mImgList.index(self.filePath)
+            currIndex = self.fileListModel.row(self.filePath)
             if currIndex + 1 < len(self.mImgList):
                 filename = self.mImgList[currIndex + 1]
                 self.mImgList5 = self.indexTo5Files(currIndex + 1)
@@ -1791,6 +1881,7 @@ class MainWindow(QMainWindow):
             if s.line_color == DEFAULT_LOCK_COLOR:
                 self.canvas.selectedShapes.remove(s)
                 self.canvas.shapes.remove(s)
+                self.canvas.invalidateIndex()
 
     def _saveFile(self, annotationFilePath, mode='Manual'):
         if len(self.canvas.lockedShapes) != 0:
@@ -1798,7 +1889,6 @@ class MainWindow(QMainWindow):
 
         if mode == 'Manual':
             self.result_dic_locked = []
-            img = cv2.imread(self.filePath)
             width, height = self.image.width(), self.image.height()
             for shape in self.canvas.lockedShapes:
                 box = [[int(p[0] * width), int(p[1] * height)] for p in shape['ratio']]
@@ -1812,27 +1902,27 @@ class MainWindow(QMainWindow):
                 self.setClean()
                 self.statusBar().showMessage('Saved to  %s' % annotationFilePath)
                 self.statusBar().show()
-                currIndex = self.mImgList.index(self.filePath)
-                item = self.fileListWidget.item(currIndex)
-                item.setIcon(newIcon('done'))
-
                 self.fileStatedict[self.filePath] = 1
-                if len(self.fileStatedict) % self.autoSaveNum == 0:
-                    self.saveFilestate()
-                    self.savePPlabel(mode='Auto')
+                self.fileListModel.updateState(self.filePath)
+                if self.projectStore is not None:
+                    # one upsert and one journal line per confirmed image,
+                    # the text files are rewritten on save and close
+                    self.projectStore.confirm(self.filePath, annotationFilePath,
+                                              self.PPlabel.get(annotationFilePath, []))
 
-                self.fileListWidget.insertItem(int(currIndex), item)
                 if not self.canvas.isInTheSameImage:
                     self.openNextImg()
                 
                 self.actions.saveLabel.setEnabled(True) 
                 self.actions.exportDet.setEnabled(True)
                 self.actions.exportRec.setEnabled(True) 
+                self.actions.exportRecLmdb.setEnabled(True)
                 self.actions.exportKie.setEnabled(True)  
 
                 self.actions.exportDetMM.setEnabled(True)
                 self.actions.exportRecMM.setEnabled(True) 
                 self.actions.exportKieMM.setEnabled(True) 
+                self.actions.exportAll.setEnabled(True)
                 
                 self.actions.makeRecData.setEnabled(True) 
                 
@@ -1995,12 +2085,14 @@ class MainWindow(QMainWindow):
             self.lineColor = color
             Shape.line_color = color
             self.canvas.setDrawingColor(color)
+            self.canvas.invalidateLayer()
             self.canvas.update()
             self.setDirty()
 
     def deleteSelectedShape(self):
         self.remLabels(self.canvas.deleteSelected())
         self.actions.undo.setEnabled(True)
+        self.actions.redo.setEnabled(False)
         self.setDirty()
         if self.noShapes():
             for action in self.actions.onShapesPresent:
@@ -2013,6 +2105,7 @@ class MainWindow(QMainWindow):
                                           default=DEFAULT_LINE_COLOR)
         if color:
             for shape in self.canvas.selectedShapes: shape.line_color = color
+            self.canvas.invalidateLayer()
             self.canvas.update()
             self.setDirty()
 
@@ -2021,6 +2114,7 @@ class MainWindow(QMainWindow):
                                           default=DEFAULT_FILL_COLOR)
         if color:
             for shape in self.canvas.selectedShapes: shape.fill_color = color
+            self.canvas.invalidateLayer()
             self.canvas.update()
             self.setDirty()
 
@@ -2046,23 +2140,21 @@ class MainWindow(QMainWindow):
     def togglePaintLabelsOption(self):
         for shape in self.canvas.shapes:
             shape.paintLabel = self.displayLabelOption.isChecked()
+        self.canvas.invalidateLayer()
 
     def toogleDrawSquare(self):
         self.canvas.setDrawingShapeToSquare(self.drawSquaresOption.isChecked())
 
     def additems(self, dirpath):
         for file in self.mImgList:
-            pix = QPixmap(file)
             _, filename = os.path.split(file)
             filename, _ = os.path.splitext(filename)
-            item = QListWidgetItem(QIcon(pix.scaled(100, 100, Qt.IgnoreAspectRatio, Qt.FastTransformation)),
-                                   filename[:10])
+            item = QListWidgetItem(self.thumbnailIcon(file), filename[:10])
             item.setToolTip(file)
             self.iconlist.addItem(item)
 
     def additems5(self, dirpath):
         for file in self.mImgList5:
-            pix = QPixmap(file)
             _, filename = os.path.split(file)
             filename, _ = os.path.splitext(filename)
             pfilename = filename[:10]
@@ -2071,7 +2163,7 @@ class MainWindow(QMainWindow):
                 prelen = lentoken // 2
                 bfilename = prelen * " " + pfilename + (lentoken - prelen) * " "
             # item = QListWidgetItem(QIcon(pix.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)),filename[:10])
-            item = QListWidgetItem(QIcon(pix.scaled(100, 100, Qt.IgnoreAspectRatio, Qt.FastTransformation)), pfilename)
+            item = QListWidgetItem(self.thumbnailIcon(file), pfilename)
             # item.setForeground(QBrush(Qt.white))
             item.setToolTip(file)
             self.iconlist.addItem(item)
@@ -2082,6 +2174,19 @@ class MainWindow(QMainWindow):
             owidth += itemwidget.width()
         self.iconlist.setMinimumWidth(owidth + 50)
 
+    def thumbnailIcon(self, file):
+        # a placeholder until the thumbnail is ready, see setThumbnail
+        image = self.thumbnailCache.request(file)
+        if image is None:
+            return newIcon('file')
+        return QIcon(QPixmap.fromImage(image))
+
+    def setThumbnail(self, file, image):
+        for index in range(self.iconlist.count()):
+            item = self.iconlist.item(index)
+            if item.toolTip() == file:
+                item.setIcon(QIcon(QPixmap.fromImage(image)))
+
     def gen_quad_from_poly(self, poly):
         """
         Generate min area quad from poly.
@@ -2127,7 +2232,7 @@ class MainWindow(QMainWindow):
         assert self.mImgList is not None
         # print('Using model from ', self.model)
 
-        uncheckedList = [i for i in self.mImgList if i not in self.fileStatedict.keys()]
+        uncheckedList = self.projectStore.uncheckedImages(self.mImgList)
         self.autoDialog = AutoDialog(parent=self, ocr=self.ocr, mImgList=uncheckedList, lenbar=len(uncheckedList))
         self.autoDialog.popUp()
         self.currIndex = len(self.mImgList) - 1
@@ -2154,55 +2259,85 @@ class MainWindow(QMainWindow):
         # self.AutoCurRecognition.setEnabled(False)
         # self.actions.AutoCurRec.setEnabled(False)
         self.setDirty()
-        with open(self.Cachelabelpath, 'w', encoding='utf-8') as f:
-            for key in self.Cachelabel:
-                f.write(key + '\t')
-                f.write(json.dumps(self.Cachelabel[key], ensure_ascii=False) + '\n')
+        self.saveCacheLabel()
 
         self.init_key_list(self.Cachelabel) 
 
+    def recognizeShapes(self, shapes):
+        """
+        Re-recognize shapes of the current image with one batched rec call.
+        Returns a (box, (text, score)) pair per shape, with None instead of the
+        rec result for shapes whose box and crop pixels have not changed since
+        their last recognition, or None if a box can not be cropped.
+        """
+        img = self.cvImage
+        if img is None and isinstance(self.image, ImagePyramid):
+            img = self.image.level(0)
+        if img is None:
+            img = cv2.imdecode(np.fromfile(self.filePath, dtype=np.uint8), 1)
+        boxes, digests, img_crops = [], [], []
+        for shape in shapes:
+            box = [[int(p.x()), int(p.y())] for p in shape.points]
+            if len(box) > 4:
+                box = self.gen_quad_from_poly(np.array(box))
+            assert len(box) == 4
+
+            img_crop = get_rotate_crop_image(img, np.array(box, np.float32))
+            if img_crop is None:
+                msg = 'Can not recognise the detection box in ' + self.filePath + '. Please change manually'
+                QMessageBox.information(self, "Information", msg)
+                return None
+            digest = hashlib.sha1(np.array(box, np.float32).tobytes())
+            digest.update(str(img_crop.shape).encode())
+            digest.update(img_crop.tobytes())
+            boxes.append(box)
+            digests.append(digest.hexdigest())
+            img_crops.append(img_crop)
+
+        todo = [i for i, digest in enumerate(digests) if digest not in self.recHashes]
+        results = [None] * len(shapes)
+        if todo:
+            rec_res = self.ocr.ocr([img_crops[i] for i in todo], cls=True, det=False)
+            for i, res in zip(todo, rec_res):
+                results[i] = tuple(res)
+                self.recHashes[digests[i]] = results[i]
+        return list(zip(boxes, results))
+
     def reRecognition(self):
-        img = cv2.imread(self.filePath)
         # org_box = [dic['points'] for dic in self.PPlabel[self.getImglabelidx(self.filePath)]]
         if self.canvas.shapes:
             self.result_dic = []
             self.result_dic_locked = []  # result_dic_locked stores the ocr result of self.canvas.lockedShapes
             rec_flag = 0
-            for shape in self.canvas.shapes:
-                box = [[int(p.x()), int(p.y())] for p in shape.points]
-
-                if len(box) > 4:
-                    box = self.gen_quad_from_poly(np.array(box))
-                assert len(box) == 4
-
-                img_crop = get_rotate_crop_image(img, np.array(box, np.float32))
-                if img_crop is None:
-                    msg = 'Can not recognise the detection box in ' + self.filePath + '. Please change manually'
-                    QMessageBox.information(self, "Information", msg)
-                    return
-                result = self.ocr.ocr(img_crop, cls=True, det=False)
-                if result[0][0] != '':
+            results = self.recognizeShapes(self.canvas.shapes)
+            if results is None:
+                return
+            for shape, (box, result) in zip(self.canvas.shapes, results):
+                if result is None:
+                    # box and pixels unchanged since the last recognition, keep the current label
+                    print('label no change')
                     if shape.line_color == DEFAULT_LOCK_COLOR:
-                        shape.label = result[0][0]
-                        result.insert(0, box)
-                        self.result_dic_locked.append(result)
+                        self.result_dic_locked.append([box, (shape.label, 0)])
                     else:
-                        result.insert(0, box)
-                        self.result_dic.append(result)
-                else:
-                    print('Can not recognise the box')
+                        self.result_dic.append([box, (shape.label, 0)])
+                elif result[0] != '':
                     if shape.line_color == DEFAULT_LOCK_COLOR:
-                        shape.label = result[0][0]
-                        self.result_dic_locked.append([box, (self.noLabelText, 0)])
+                        shape.label = result[0]
+                        self.result_dic_locked.append([box, result])
                     else:
-                        self.result_dic.append([box, (self.noLabelText, 0)])
-                try:
-                    if self.noLabelText == shape.label or result[1][0] == shape.label:
+                        self.result_dic.append([box, result])
+                    if self.noLabelText == shape.label or result[0] == shape.label:
                         print('label no change')
                     else:
                         rec_flag += 1
-                except IndexError as e:
+                else:
                     print('Can not recognise the box')
+                    if shape.line_color == DEFAULT_LOCK_COLOR:
+                        shape.label = result[0]
+                        self.result_dic_locked.append([box, (self.noLabelText, 0)])
+                    else:
+                        self.result_dic.append([box, (self.noLabelText, 0)])
+            self.canvas.invalidateLayer()
             if (len(self.result_dic) > 0 and rec_flag > 0) or self.canvas.lockedShapes:
                 self.canvas.isInTheSameImage = True
                 self.saveFile(mode='Auto')
@@ -2220,428 +2355,147 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Information", "Draw a box!")
 
     def singleRerecognition(self):
-        img = cv2.imread(self.filePath)
-        for shape in self.canvas.selectedShapes:
-            box = [[int(p.x()), int(p.y())] for p in shape.points]
-            if len(box) > 4:
-                box = self.gen_quad_from_poly(np.array(box))
-            assert len(box) == 4
-            img_crop = get_rotate_crop_image(img, np.array(box, np.float32))
-            if img_crop is None:
-                msg = 'Can not recognise the detection box in ' + self.filePath + '. Please change manually'
-                QMessageBox.information(self, "Information", msg)
-                return
-            result = self.ocr.ocr(img_crop, cls=True, det=False)
-            if result[0][0] != '':
-                result.insert(0, box)
-                print('result in reRec is ', result)
-                if result[1][0] == shape.label:
+        shapes = list(self.canvas.selectedShapes)
+        results = self.recognizeShapes(shapes)
+        if results is None:
+            return
+        for shape, (box, result) in zip(shapes, results):
+            if result is None:
+                print('label no change')
+                continue
+            if result[0] != '':
+                print('result in reRec is ', [box, result])
+                if result[0] == shape.label:
                     print('label no change')
                 else:
-                    shape.label = result[1][0]
+                    self.canvas.editLabels([shape], [result[0]])
             else:
                 print('Can not recognise the box')
                 if self.noLabelText == shape.label:
                     print('label no change')
                 else:
-                    shape.label = self.noLabelText
+                    self.canvas.editLabels([shape], [self.noLabelText])
+            self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
             self.singleLabel(shape)
             self.setDirty()
 
     #-------------------------------------------------- 
-    # Export into PaddleOCR format 
-    def exportKie(self):
-        '''
-            export Label and CSV to JSON
-        '''  
-        lbl_file = os.path.join(self.lastOpenDir, 'Label.txt') 
-        if os.name == 'nt': 
-            img_dir = ("\\").join(self.lastOpenDir.split("\\")[:-1])  
-        else: 
-            img_dir = ('/').join(self.lastOpenDir.split('/')[:-1])   
-
-        output1 = os.path.join(self.lastOpenDir, 'kie_label.json')   
-        output2 = os.path.join(self.lastOpenDir, 'kie_label_last.json')  
-
-        if not os.path.isfile(lbl_file): 
-            QMessageBox.warning(self, "Information", "라벨파일(Label.txt)이 없습니다. 먼저 [라벨 내보내기]를 실행하세요.") 
-            return 
-
-        # 먼저 라벨파일 저장처리 
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
+    # Export into PaddleOCR / MMOCR format, see libs/exportEngine.py 
 
-        # SER Dataset 생성/저장 처리 
-        self.make_kie_dataset(lbl_file, img_dir, output1, output2)
-        
-        msg = 'KIE JSON 파일 저장 완료: \n- {} \n- {}'.format(output1, output2)
-        QMessageBox.information(self, "Information", msg)
-
-    
-    def exportDet(self):
+    def exportTargets(self, formats):
+        '''
+            export targets with the messages shown when they are done
+        '''
+        save_dir = os.path.dirname(self.PPlabelpath)
+        crop_img_dir = save_dir + '/crop_img/'
+        targets = []
+        for fmt in formats:
+            if fmt == 'det':
+                output = os.path.join(save_dir, 'det_label.json')
+                targets.append((DetTarget(output), 'Det Label JSON 파일 저장 완료: \n- {target.output}'))
+            elif fmt == 'detMM':
+                output = os.path.join(save_dir, 'det_label_mm.json' if 'det' in formats else 'det_label.json')
+                imageSizes = self.projectStore.imageSizes if self.projectStore is not None else None
+                targets.append((DetMMTarget(output, imageSizes), 'Detection Label 파일 저장 완료: \n- {target.output}'))
+            elif fmt in ('kie', 'kieMM'):
+                # both formats are the same file
+                if any(isinstance(target, KieTarget) for target, _ in targets):
+                    continue
+                output = os.path.join(save_dir, 'kie_label.json')
+                targets.append((KieTarget(output), 'KIE JSON 파일 저장 완료: \n- {target.output}'))
+            elif fmt == 'rec':
+                targets.append((RecTarget(save_dir + '/rec_label.txt', crop_img_dir, infix='_crop_'),
+                                "Crop 이미지들이 저장되었습니다(디렉토리): " + crop_img_dir))
+            elif fmt == 'recMM':
+                targets.append((RecTarget(save_dir + '/rec_label.json', crop_img_dir, infix='_', mm=True),
+                                "Rec. 이미지들이 저장되었습니다(디렉토리): \n" + crop_img_dir))
+            elif fmt == 'recLmdb':
+                targets.append((RecLmdbTarget(save_dir + '/rec_lmdb/', encoding=self.lmdbEncoding),
+                                "Rec LMDB가 저장되었습니다({target.count}개): \n{target.output}"))
+        return targets
+
+    def runExport(self, formats):
+        '''
+            export the checked images into formats in one pass on a
+            background thread
         '''
-            export Detection Labels to JSON
-        '''  
-        lbl_file = os.path.join(self.lastOpenDir, 'Label.txt') 
-        if os.name == 'nt': 
-            img_dir = ("\\").join(self.lastOpenDir.split("\\")[:-1])  
-        else: 
-            img_dir = ('/').join(self.lastOpenDir.split('/')[:-1])   
-
-        output1 = os.path.join(self.lastOpenDir, 'det_label.json')    
-
-        if not os.path.isfile(lbl_file): 
-            QMessageBox.warning(self, "Information", "라벨파일(Label.txt)이 없습니다. 먼저 [라벨 내보내기]를 실행하세요.") 
-            return 
-
-        # 먼저 라벨파일 저장처리 
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
- 
-        self.make_det_dataset(lbl_file, img_dir, output1)
-        
-        msg = 'Det Label JSON 파일 저장 완료: \n- {}'.format(output1)
-        QMessageBox.information(self, "Information", msg)
-
-    def exportRec(self):
         if {} in [self.PPlabelpath, self.PPlabel, self.fileStatedict]:
             QMessageBox.information(self, "Information", "이미지를 확인하세요")
             return
+        if self.exportWorker is not None and self.exportWorker.isRunning():
+            return
 
-        rec_gt_dir = os.path.dirname(self.PPlabelpath) + '/rec_label.txt'
-        crop_img_dir = os.path.dirname(self.PPlabelpath) + '/crop_img/'
-        ques_img = []
-        if not os.path.exists(crop_img_dir):
-            os.mkdir(crop_img_dir)
+        items = []
+        for key in self.fileStatedict:
+            idx = self.getImglabelidx(key)
+            items.append((key, idx, [dict(label) for label in self.PPlabel.get(idx, [])]))
 
-        with open(rec_gt_dir, 'w', encoding='utf-8') as f:
-            for key in self.fileStatedict:
-                if not os.path.isfile(key): 
-                    continue  
-                idx = self.getImglabelidx(key)
-                try:
-                    img = cv2.imread(key)
-                    for i, label in enumerate(self.PPlabel[idx]):
-                        if label['difficult']:
-                            continue
-                        img_crop = get_rotate_crop_image(img, np.array(label['points'], np.float32))
-                        img_name = os.path.splitext(os.path.basename(idx))[0] + '_crop_' + str(i) + '.jpg'
-                        cv2.imwrite(crop_img_dir + img_name, img_crop)
-                        f.write('crop_img/' + img_name + '\t')
-                        f.write(label['transcription'] + '\n')
-                except Exception as e:
-                    ques_img.append(key)
-                    print("Can not read image ", e)
-        if ques_img:
-            QMessageBox.information(self, "Information",
-                                    "아래의 이미지들은 저장될수 없습니다. 이미지 경로와 라벨을 확인해주세요.\n"
-                                    + "".join(str(i) + '\n' for i in ques_img))
-        QMessageBox.information(self, "Information", "Crop 이미지들이 저장되었습니다(디렉토리): " + str(crop_img_dir))
+        targets = self.exportTargets(formats)
+        engine = ExportEngine([target for target, _ in targets])
+        self.runInBackground(engine, items, "내보내기 중...",
+                             lambda: "\n".join(msg.format(target=target) for target, msg in targets))
 
+    def runInBackground(self, engine, items, text, message):
+        '''
+            engine.run(items, progress) on a thread behind a progress dialog
+            that can cancel it, message() is shown when it is done
+        '''
+        progress = QProgressDialog(text, "취소", 0, max(1, len(items)), self)
+        progress.setWindowTitle("Information")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(engine.cancel)
+
+        def updateProgress(done, total):
+            progress.setMaximum(max(1, total))
+            progress.setValue(done)
+
+        def finished(ques_img):
+            # closing the dialog emits canceled, read the state first
+            cancelled = engine.cancelled
+            progress.canceled.disconnect(engine.cancel)
+            progress.close()
+            self.exportWorker = None
+            if worker.error is not None:
+                QMessageBox.critical(self, "Error", "작업 중 에러가 발생했습니다: \n" + worker.error)
+                return
+            if cancelled:
+                return
+            if ques_img:
+                QMessageBox.information(self, "Information",
+                                        "아래의 이미지들은 저장될수 없습니다. 이미지 경로와 라벨을 확인해주세요.\n"
+                                        + "".join(str(i) + '\n' for i in ques_img))
+            QMessageBox.information(self, "Information", message())
 
-    # -------------------------------------------------------------- 
-    # Export into MMOCR Format 
+        worker = self.exportWorker = ExportWorker(engine, items)
+        worker.progressValue.connect(updateProgress)
+        worker.endsignal.connect(finished)
+        worker.start()
 
-    def exportKieMM(self):
-        '''
-            export Label and CSV to JSON
-        '''  
-        lbl_file = os.path.join(self.lastOpenDir, 'Label.txt') 
-        if os.name == 'nt': 
-            img_dir = ("\\").join(self.lastOpenDir.split("\\")[:-1])  
-        else: 
-            img_dir = ('/').join(self.lastOpenDir.split('/')[:-1])   
+    def exportKie(self):
+        self.runExport(['kie'])
 
-        output1 = os.path.join(self.lastOpenDir, 'kie_label.json')   
-        output2 = os.path.join(self.lastOpenDir, 'kie_label_last.json')  
+    def exportDet(self):
+        self.runExport(['det'])
 
-        if not os.path.isfile(lbl_file): 
-            QMessageBox.warning(self, "Information", "라벨파일(Label.txt)이 없습니다. 먼저 [라벨 내보내기]를 실행하세요.") 
-            return 
+    def exportRec(self):
+        self.runExport(['rec'])
 
-        # 먼저 라벨파일 저장처리 
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
+    def exportRecLmdb(self):
+        self.runExport(['recLmdb'])
 
-        # SER Dataset 생성/저장 처리 (stopword 필터 적용)
-        self.make_kie_dataset(lbl_file, img_dir, output1, output2)
-        
-        msg = 'KIE JSON 파일 저장 완료: \n- {} \n- {}'.format(output1, output2)
-        QMessageBox.information(self, "Information", msg)
+    def exportKieMM(self):
+        self.runExport(['kieMM'])
 
-    
     def exportDetMM(self):
-        '''
-            export Detection Labels to JSON
-        '''   
-        
-        lbl_file = os.path.join(self.lastOpenDir, 'Label.txt') 
-        if os.name == 'nt': 
-            img_dir = ("\\").join(self.lastOpenDir.split("\\")[:-1])  
-        else: 
-            img_dir = ('/').join(self.lastOpenDir.split('/')[:-1])   
-
-        output = os.path.join(self.lastOpenDir, 'det_label.json')  
-        if not os.path.isfile(lbl_file): 
-            QMessageBox.warning(self, "Information", "라벨파일(Label.txt)이 없습니다. 먼저 [라벨 내보내기]를 실행하세요.") 
-            return 
-
-        # 먼저 라벨파일 저장처리 
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
- 
-        output, result = self.make_det_dataset(lbl_file, img_dir, output, ocr_flag='M')
-        
-        if result:  
-            QMessageBox.information(self, "Information", 
-                                    'Detection Label 파일 저장 완료: \n- {}'.format(output))
-        else: 
-            QMessageBox.information(self, "Error", 
-                                'Detection Label 파일 저장 실패: \n- {}'.format(output))
+        self.runExport(['detMM'])
 
     def exportRecMM(self):
-        if {} in [self.PPlabelpath, self.PPlabel, self.fileStatedict]:
-            QMessageBox.information(self, "Information", "이미지를 확인하세요")
-            return
- 
-        try:  
-            rec_gt_dir = os.path.dirname(self.PPlabelpath) + '/rec_label.json'
-            crop_img_dir = os.path.dirname(self.PPlabelpath) + '/crop_img/'
-            ques_img = []
-            if not os.path.exists(crop_img_dir):
-                os.mkdir(crop_img_dir) 
-            
-            mm_parse = {
-                "metainfo":
-                    {
-                    "dataset_type": "TextRecogDataset",
-                    "task_name": "textrecog",
-                    },
-                "data_list": None 
-            }
-            
-            inst_list = []  
-            for key in self.fileStatedict:
-                if not os.path.isfile(key): 
-                    continue 
-                idx = self.getImglabelidx(key)
-                try: 
-                    img = cv2.imread(key)
-                    for i, label in enumerate(self.PPlabel[idx]):
-                        if label['difficult']:
-                            continue
-                        img_crop = get_rotate_crop_image(img, np.array(label['points'], np.float32))
-                        img_name = os.path.splitext(os.path.basename(idx))[0] + '_' + str(i) + '.jpg'
-                        cv2.imwrite(os.path.join(crop_img_dir, img_name), img_crop) 
-                        
-                        inst_list.append({
-                            "img_path": 'crop_img/' + img_name ,
-                            "instances": [
-                                {
-                                "text": label['transcription'] 
-                                }
-                            ]
-                        })  
-                        
-                        # f.write('crop_img/' + img_name + '\t')
-                        # f.write(label['transcription'] + '\n')
-                except Exception as ex:
-                    ques_img.append(key)
-                    print("Can not read image ", ex)
-                
-            mm_parse['data_list'] = inst_list 
-            json_obj = json.dumps(mm_parse, ensure_ascii=False).replace("\\", "")    
-            with open(rec_gt_dir, 'w') as f:  
-                print(json_obj, file=f) 
-                    
-            if ques_img:
-                QMessageBox.information(self, "Information",
-                                        "아래의 이미지들은 저장될수 없습니다. 이미지 경로와 라벨을 확인해주세요.\n"
-                                        + "".join(str(i) + '\n' for i in ques_img))
-            QMessageBox.information(self, "Information", "Rec. 이미지들이 저장되었습니다(디렉토리): \n" + str(crop_img_dir))
+        self.runExport(['recMM'])
 
-        except Exception as ex: 
-            print(repr(ex)) 
-
-    def make_kie_dataset(self, label_file, img_dir, output1, output2): 
-        # KIE 
-        try: 
-            if os.path.isfile(output1): os.remove(output1) 
-            if os.path.isfile(output2): os.remove(output2)  
-        
-            with open(label_file) as f: 
-                data = f.readlines() 
-            
-            results = []   
-            for d in data:  
-                bbox_info = []  
-                
-                # label = {'height':0, 'width': 0, 'ocr_info': []}  
-                img_file = d.split('\t')[0] 
-                label_list = d.split('\t')[1].strip()  
-
-                fname, ext = img_file.split('.')[0], img_file.split('.')[1]  
-                print(img_file) 
-
-                if not os.path.isfile(os.path.join(img_dir, img_file)): 
-                    print('Not found error {}: '.format(img_file))
-                    continue 
-
-                img = cv2.imread(os.path.join(img_dir, img_file))
- 
-                dics = ['{' + x for x in label_list.replace('[{', '').replace('}]', '}').split(', {')] 
-                for seq, dic in enumerate(dics):  
-                    item = json.loads(dic) 
-                    exclude = item['difficult']  
-                    text = item['transcription'] 
-                    pt = item['points'] 
-                    key = item['key_cls'].replace('None', 'other')
-                     
-                    if exclude: 
-                        continue 
-         
-                    bbox_info.append({
-                        'transcription': text, 
-                        'label': key, 
-                        'points': pt, 
-                        'id': seq, 
-                        'linking': []   
-                    }) 
-                    
-                fname = fname.split('\\')[1] if os.name=='nt' else fname.split('/')[1] 
-                # label['ocr_info'] = bbox_info 
-                label_str = json.dumps(bbox_info, ensure_ascii=False) 
-                results.append(fname + '.' + ext + '\t' + label_str)
-        
-            with open(output1, 'w') as f:  
-                for d in results: 
-                    f.write(d + '\n') 
-            return output1, output2 
-        except Exception as ex: 
-            print(repr(ex)) 
-
-    def make_det_dataset(self, label_file, img_dir, output, ocr_flag='P'): 
-        # OCR Detection dataset 생성  
-        try:  
-            if os.path.isfile(output): os.remove(output)  
-            with open(label_file) as f: 
-                data = f.readlines()  
-            mm_parse = {
-                'metainfo': {
-                    'dataset_type': 'TextDetDataset',   
-                    'task_name': 'textdet', \
-                    'category': [{'id': 0, 'name': 'text'}] 
-                }, 
-                'data_list': None 
-            }     
-            
-            results = []  
-            det_list = []   
-            for d in data:  
-                img_file = d.split('\t')[0] 
-                label_list = d.split('\t')[1].strip()  
-                if not os.path.isfile(os.path.join(img_dir, img_file)): 
-                    continue 
-                img = cv2.imread(os.path.join(img_dir, img_file))
-                h, w, c = img.shape 
-
-                fname, ext = img_file.split('.')[0], img_file.split('.')[1]  
-                print(img_file) 
-
-                if not os.path.isfile(os.path.join(img_dir, img_file)): 
-                    print('Not found error {}: '.format(img_file))
-                    continue  
-                fname = fname.split('\\')[1] if os.name=='nt' else fname.split('/')[1]
-                
-                dicts = ['{' + x for x in label_list.replace('[{', '').replace('}]', '}').split(', {')]  
-                if ocr_flag == 'P':   
-                    ano = [] 
-                    for seq, dic in enumerate(dicts):  
-                        item = json.loads(dic) 
-                        exclude = item['difficult']  
-                        if not exclude:  
-                            ano.append({
-                                'transcription': item['transcription'] , 
-                                'points': item['points'] 
-                            })
-                        else: 
-                            ano.append({
-                                'transcription': '###', 
-                                'points': item['points'] 
-                            })
-
-                    label_str = json.dumps(ano, ensure_ascii=False) 
-                    results.append(fname + '.' + ext + '\t' + label_str)
-                else:   
-                    ano = [] 
-                    for seq, dic in enumerate(dicts):  
-                        item = json.loads(dic) 
-                        exclude = item['difficult']  
-                        poly = item['points'][0] + item['points'][1] + item['points'][2] + item['points'][3]  
-                        min_x1 = float((np.array(item['points'])[:,0]).min()) 
-                        min_y1 = float((np.array(item['points'])[:,1]).min())  
-                        max_x2 = float((np.array(item['points'])[:,0]).max()) 
-                        max_y2 = float((np.array(item['points'])[:,1]).max())  
-                        # "polygon": [0, 0, 0, 10, 10, 20, 20, 0], # [x1, y1, x2, y1, x2, y2, x1, y2] 
-                        # "bbox": [0, 0, 10, 20], #  [x1, y1, x2, y2]  
-
-                        if not exclude:  
-                            ano.append({
-                                'polygon': poly,  
-                                'bbox':[min_x1, min_y1, max_x2, max_y2],  
-                                'bbox_label': int(0), 
-                                'ignore': False 
-                            })
-                        else: 
-                            ano.append({
-                                'polygon': poly,  
-                                'bbox': [min_x1, min_y1, max_x2, max_y2], 
-                                'bbox_label': int(0), 
-                                'ignore': True
-                            })
-
-                    label_str = json.dumps(ano, ensure_ascii=False)  
-                    det_list.append({
-                        "instances": label_str,  
-                        "img_path": fname + '.' + ext, 
-                        "height": h,
-                        "width": w , 
-                        "seg_map": fname + '.txt'  
-                    }) 
-            
-            if ocr_flag == 'P': 
-                with open(output, 'w') as f:  
-                    for d in results: 
-                        f.write(d + '\n')
-            else:  
-                mm_parse['data_list'] = det_list  
-                json_obj = json.dumps(mm_parse, ensure_ascii=False).replace("\\", "")    
-                with open(output, 'w') as f: 
-                    f.write(json_obj) 
-                    # json.dump(mm_parse, f, indent=4)
-    
-            print('Created Detection Json file!')  
-
-            return output, True  
-        except Exception as ex: 
-            print(repr(ex))
-            return '', False  
+    def exportAll(self):
+        # kie and kieMM are the same file, exportTargets writes it once
+        self.runExport(['det', 'detMM', 'kie', 'kieMM', 'rec', 'recMM', 'recLmdb'])
 
     # ---------------------------------------------------------------- 
     def makeRecData(self):
@@ -2649,111 +2503,31 @@ class MainWindow(QMainWindow):
             img_dir = ("\\").join(self.lastOpenDir.split("\\"))  
         else: 
             img_dir = ('/').join(self.lastOpenDir.split('/'))    
-        self.makeRecAugmentData(img_dir,  "rect_gt.txt")
+        self.makeRecAugmentData(img_dir)
         
-    def makeRecAugmentData(self, img_dir, output): 
-        try: 
-            rec_images = [] 
-            label_list = glob.glob(img_dir + "/rec_*.txt")
-            for lbl in label_list: 
-                with open(lbl, 'r') as f: 
-                    labels = f.readlines() 
-                for l in labels:  
-                    rec_images.append(l)
-                    
-            rec_img_dir = os.path.join(img_dir, 'crop_img')  
-            ret, output = self.rec_image_augment(rec_img_dir, rec_img_dir, rec_images)
-            
-            if ret:
-                QMessageBox.information(self, "Information", "Rec 학습데이터가 생성되었습니다: \n{}".format(output)) 
-            else: 
-                QMessageBox.information(self, "Error", "Rec 학습데이터 생성 에러: \n{}".format(output) ) 
-                
-        except Exception as ex: 
-            print(repr(ex))
-            
-    def rec_image_augment(self, img_dir=None, target_dir=None, label_list=None):   
-        if not os.path.exists(target_dir): 
-            os.mkdir(target_dir)
-            
-        try: 
-            labels = []  
-            for i, d in enumerate(label_list):  
-                if len(d.split('\t')) < 2: 
-                    continue 
-
-                img_file = d.split('\t')[0].strip()
-                label = d.split('\t')[1].strip()  
-                labels.append(img_file + "\t" + label.replace('\n', '') )
-
-                file_name = (img_file.split('.')[0])  
-                file_ext = img_file.split('.')[1]  
-
-                img = os.path.join(img_dir, img_file)
-                if os.path.isfile(img):  
-                    img = Image.open(img)
-                    
-                    img_aug = Contrast()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_contrast.' + file_ext))  
-                    labels.append(file_name + '_contrast.' + file_ext + "\t" + label ) 
-
-                    img_aug = Brightness()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_bright.' + file_ext))  
-                    labels.append(file_name + '_bright.' + file_ext + "\t" + label )
-
-                    img_aug = GaussianNoise()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_gnoise.' + file_ext))  
-                    labels.append(file_name + '_gnoise.' + file_ext + "\t" + label )
-
-                    img_aug = GlassBlur()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_glsblur.' + file_ext))  
-                    labels.append(file_name + '_glsblur.' + file_ext + "\t" + label )
-                    
-                    img_aug = Sharpness()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_sharp.' + file_ext))  
-                    labels.append(file_name + '_sharp.' + file_ext + "\t" + label )
-
-                    img_aug = Color()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_color.' + file_ext))  
-                    labels.append(file_name + '_color.' + file_ext + "\t" + label )
+    def makeRecAugmentData(self, img_dir): 
+        '''
+            augment the crops listed in rec_*.txt, see libs/recAugment.py
+        '''
+        if self.exportWorker is not None and self.exportWorker.isRunning():
+            return
+        rec_images = [] 
+        for lbl in glob.glob(img_dir + "/rec_*.txt"): 
+            with open(lbl, 'r', encoding='utf-8') as f: 
+                rec_images.extend(f.readlines())
 
-                    img_aug = Snow()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_snow.' + file_ext))  
-                    labels.append(file_name + '_snow.' + file_ext + "\t" + label ) 
-                    
-                    # Fog, Frost, Snow, Rain, Shadow  
-                    img_aug = Fog()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_fog.' + file_ext))  
-                    labels.append(file_name + '_fog.' + file_ext + "\t" + label )  
-
-                    img_aug = Shadow()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_shadow.' + file_ext))  
-                    labels.append(file_name + '_shadow.' + file_ext + "\t" + label ) 
-
-                    img_aug = Rain()(img)
-                    img_aug.save(os.path.join(target_dir, file_name + '_rain.' + file_ext))  
-                    labels.append(file_name + '_rain.' + file_ext + "\t" + label ) 
-
-                    img_aug = Distortion_Sin(
-                        img,
-                        vertical=False,
-                        horizontal=False
-                    )
-                    img_aug.save(os.path.join(target_dir, file_name + '_distort.' + file_ext))  
-                    labels.append(file_name + '_distort.' + file_ext + "\t" + label )  
+        rec_img_dir = os.path.join(img_dir, 'crop_img')  
+        lmdb_dir = os.path.join(img_dir, 'rec_aug_lmdb') if self.augmentOutput == 'lmdb' else None
+        try:
+            generator = RecAugmentGenerator(img_dir, rec_img_dir, recipe=self.augmentRecipe,
+                                            seed=self.augmentSeed, lmdbDir=lmdb_dir,
+                                            encoding=self.lmdbEncoding)
+        except ValueError as ex:
+            QMessageBox.information(self, "Error", "Rec 학습데이터 생성 에러: \n{}".format(ex))
+            return
+        self.runInBackground(generator, rec_images, "Rec 학습데이터 생성 중...",
+                             lambda: "Rec 학습데이터가 생성되었습니다: \n{}".format(generator.output))
 
-                else: 
-                    print('No file: {}'.format(img))  
-
-            output = os.path.join(target_dir, 'rec_label.txt') 
-            with open(output, 'w') as f: 
-                for lbl in labels: 
-                    f.write(lbl + '\n')   
-            return True, output  
-        except Exception as ex: 
-            print(repr(ex)) 
-            return False, repr(ex)   
-            
     # ------------------------------------------------------------------
     def autolcm(self):
         vbox = QVBoxLayout()
@@ -2794,12 +2568,18 @@ class MainWindow(QMainWindow):
         print(self.comboBox.currentText())
         lg_idx = {'Korean': 'korean',             
             'English': 'en' }
+        if isinstance(self.ocr, OCRClient):
+            # the server decides the model
+            print('model can not be changed while using the ocr server')
+            self.dialog.close()
+            return
         del self.ocr
         self.ocr = PaddleOCR(use_angle_cls=False, 
             det=True, 
             cls=False, 
             use_gpu=True, 
-            lang=lg_idx[self.comboBox.currentText()])
+            lang=lg_idx[self.comboBox.currentText()],
+            use_ocr_cache=True)
 
         self.dialog.close()
 
@@ -2808,76 +2588,48 @@ class MainWindow(QMainWindow):
 
     def loadFilestate(self, saveDir):
         self.fileStatepath = saveDir + '/fileState.txt'
-        self.fileStatedict = {}
-        if not os.path.exists(self.fileStatepath):
-            f = open(self.fileStatepath, 'w', encoding='utf-8')
-        else:
-            with open(self.fileStatepath, 'r', encoding='utf-8') as f:
-                states = f.readlines()
-                for each in states:
-                    file, state = each.split('\t')
-                    self.fileStatedict[file] = 1
-                self.actions.saveLabel.setEnabled(True)  
-                self.actions.exportDet.setEnabled(True) 
-                self.actions.exportRec.setEnabled(True)
-                self.actions.exportKie.setEnabled(True)
-
-                self.actions.exportDetMM.setEnabled(True) 
-                self.actions.exportRecMM.setEnabled(True)
-                self.actions.exportKieMM.setEnabled(True)
-                
-                self.actions.makeRecData.setEnabled(True)  
+        self.fileStatedict = dict.fromkeys(self.projectStore.checkedPaths(), 1)
+        if self.fileStatedict:
+            self.actions.saveLabel.setEnabled(True)  
+            self.actions.exportDet.setEnabled(True) 
+            self.actions.exportRec.setEnabled(True)
+            self.actions.exportRecLmdb.setEnabled(True)
+            self.actions.exportKie.setEnabled(True)
+
+            self.actions.exportDetMM.setEnabled(True) 
+            self.actions.exportRecMM.setEnabled(True)
+            self.actions.exportKieMM.setEnabled(True)
+            self.actions.exportAll.setEnabled(True)
+            
+            self.actions.makeRecData.setEnabled(True)  
 
     def saveFilestate(self):
-        with open(self.fileStatepath, 'w', encoding='utf-8') as f:
-            for key in self.fileStatedict:
-                f.write(key + '\t')
-                f.write(str(self.fileStatedict[key]) + '\n')
+        if self.projectStore is not None:
+            self.projectStore.exportFile('file_state')
 
-    def loadLabelFile(self, labelpath):
-        labeldict = {}
-        if not os.path.exists(labelpath):
-            f = open(labelpath, 'w', encoding='utf-8')
-
-        else:
-            with open(labelpath, 'r', encoding='utf-8') as f:
-                data = f.readlines()
-                for each in data:
-                    file, label = each.split('\t')
-                    print(file)
-                    if label:
-                        label = label.replace('false', 'False')
-                        label = label.replace('true', 'True')
-                        labeldict[file] = eval(label)
-                    else:
-                        labeldict[file] = []
-        return labeldict
+    def loadLabelFile(self, table):
+        # labels are read from project.db and parsed on first access, see libs/labelIndex.py
+        return self.projectStore.lazyLabels(table, kieMode=self.kie_mode)
 
     def savePPlabel(self, mode='Manual'):
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
-
-        # 먼저 라벨파일 저장처리 
-        savedfile = [self.getImglabelidx(i) for i in self.fileStatedict.keys()]
-        with open(self.PPlabelpath, 'w', encoding='utf-8') as f:
-            for key in self.PPlabel:
-                if key in savedfile and self.PPlabel[key] != []:
-                    f.write(key + '\t')
-                    f.write(json.dumps(self.PPlabel[key], ensure_ascii=False) + '\n')
+        if self.projectStore is None:
+            return
+        # only labels of checked images that changed since the last save
+        savedfile = set(self.getImglabelidx(i) for i in self.fileStatedict.keys())
+        dirty = self.PPlabel.popDirty(savedfile)
+        self.projectStore.putLabels('labels', [(key, self.PPlabel.get(key)) for key in dirty])
+        self.projectStore.exportFile('labels')
 
         if mode == 'Manual':
             msg = '체크된 이미지 저장: ' + self.PPlabelpath
             QMessageBox.information(self, "Information", msg)
 
     def saveCacheLabel(self):
-        with open(self.Cachelabelpath, 'w', encoding='utf-8') as f:
-            for key in self.Cachelabel:
-                f.write(key + '\t')
-                f.write(json.dumps(self.Cachelabel[key], ensure_ascii=False) + '\n')
+        if self.projectStore is None:
+            return
+        dirty = self.Cachelabel.popDirty()
+        self.projectStore.putLabels('cache', [(key, self.Cachelabel.get(key)) for key in dirty])
+        self.projectStore.exportFile('cache')
 
     def saveLabelFile(self):
         self.saveFilestate()
@@ -2902,8 +2654,12 @@ class MainWindow(QMainWindow):
                 pass
             print('The program will automatically save once after confirming an image')
         else:
-            self.autoSaveNum = 5  # Used for backup
-            print('The program will automatically save once after confirming 5 images (default)')
+            self.autoSaveNum = COMPACT_RECORDS  # Used for backup
+            print('The program will automatically save once after confirming %d images (default)'
+                  % COMPACT_RECORDS)
+        if self.projectStore is not None:
+            # Label.txt and fileState.txt are rewritten in the background
+            self.projectStore.setCompactRecords(self.autoSaveNum)
 
     def change_box_key(self):
         if not self.kie_mode:
@@ -2912,8 +2668,9 @@ class MainWindow(QMainWindow):
         if key_text is None:
             return
         self.key_previous_text = key_text
+        self.canvas.editLabels(self.canvas.selectedShapes, key_cls=key_text)
+        self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
         for shape in self.canvas.selectedShapes:
-            shape.key_cls = key_text
             if not self.keyList.findItemsByLabel(key_text):
                 item = self.keyList.createItemFromLabel(key_text)
                 self.keyList.addItem(item)
@@ -2925,10 +2682,27 @@ class MainWindow(QMainWindow):
 
     def undoShapeEdit(self):
         self.canvas.restoreShape()
+        self.refreshShapeLists()
+
+    def redoShapeEdit(self):
+        self.canvas.redoShape()
+        self.refreshShapeLists()
+
+    def refreshShapeLists(self):
+        # the canvas keeps its shapes and history, only the lists are rebuilt
         self.labelList.clear()
         self.BoxList.clear()
-        self.loadShapes(self.canvas.shapes)
+        self._noSelectionSlot = True
+        for shape in self.canvas.shapes:
+            if self.kie_mode:
+                self._update_shape_color(shape)
+            self.addLabel(shape)
+        self.labelList.clearSelection()
+        self._noSelectionSlot = False
+        self.canvas.update()
+        self.setDirty()
         self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
+        self.actions.redo.setEnabled(self.canvas.isShapeRedoable)
 
     def loadShapes(self, shapes, replace=True):
         self._noSelectionSlot = True
@@ -2962,6 +2736,7 @@ class MainWindow(QMainWindow):
             for s in self.canvas.selectedShapes:
                 s.line_color = DEFAULT_LOCK_COLOR
                 s.locked = True
+            self.canvas.invalidateLayer()
             shapes = [format_shape(shape) for shape in self.canvas.selectedShapes]
             trans_dic = []
             for box in shapes:
@@ -2976,6 +2751,7 @@ class MainWindow(QMainWindow):
         else:
             for s in self.canvas.shapes:
                 s.line_color = DEFAULT_LINE_COLOR
+            self.canvas.invalidateLayer()
             self.canvas.lockedShapes = []
             self.result_dic_locked = []
             self.setDirty()
@@ -3014,12 +2790,14 @@ def get_main_app(argv=[]):
     arg_parser.add_argument("--predefined_classes_file",
                             default=os.path.join(os.path.dirname(__file__), "data", "predefined_classes.txt"),
                             nargs="?")
+    arg_parser.add_argument("--ocr_server", type=str, default=None, nargs="?")
     args = arg_parser.parse_args(argv[1:])
 
     win = MainWindow(lang=args.lang,
                      gpu=args.gpu,
                      kie_mode=args.kie,
-                     default_predefined_class_file=args.predefined_classes_file)
+                     default_predefined_class_file=args.predefined_classes_file,
+                     ocr_server=args.ocr_server)
     win.show()
     return app, win
 
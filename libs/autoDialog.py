@@ -9,10 +9,9 @@ except ImportError:
 import time
 import datetime
 import json
-import cv2
-import numpy as np
 
 from libs.utils import newIcon
+from tools.infer.predict_pipeline import PipelineTextSystem
 
 BB = QDialogButtonBox
 
@@ -29,21 +28,24 @@ class Worker(QThread):
         self.mImgList = mImgList
         self.mainThread = mainThread
         self.model = model
+        self.pipeline = None
         self.setStackSize(1024*1024)
 
     def run(self):
         try:
             findex = 0
-            for Imgpath in self.mImgList:
+            if self.model == 'paddle' and hasattr(self.ocr, 'ocr_files'):
+                # ocr server client, several requests in flight for its batches
+                results = self.ocr.ocr_files(self.mImgList, cls=True)
+            elif self.model == 'paddle':
+                # decode, det, crop and rec run concurrently, each image is decoded once
+                self.pipeline = PipelineTextSystem(self.ocr)
+                results = self.pipeline(self.mImgList, cls=True)
+            else:
+                results = ((Imgpath, None) for Imgpath in self.mImgList)
+            for Imgpath, self.result_dic in results:
                 if self.handle == 0:
                     self.listValue.emit(Imgpath)
-                    if self.model == 'paddle':
-                        h, w, _ = cv2.imdecode(np.fromfile(Imgpath, dtype=np.uint8), 1).shape
-                        if h > 32 and w > 32:
-                            self.result_dic = self.ocr.ocr(Imgpath, cls=True, det=True)
-                        else:
-                            print('The size of', Imgpath, 'is too small to be recognised')
-                            self.result_dic = None
 
                     # 结果保存
                     if self.result_dic is None or len(self.result_dic) == 0:
@@ -66,6 +68,8 @@ class Worker(QThread):
                     findex += 1
                     self.progressBarValue.emit(findex)
                 else:
+                    if self.pipeline is not None:
+                        self.pipeline.stop()
                     break
             self.endsignal.emit(0, "readAll")
             self.exec()
@@ -11,12 +11,14 @@
 # CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import copy
-
-from PyQt5.QtCore import Qt, pyqtSignal, QPointF, QPoint
-from PyQt5.QtGui import QPainter, QBrush, QColor, QPixmap
+from PyQt5.QtCore import Qt, pyqtSignal, QPointF, QPoint, QRect, QRectF
+from PyQt5.QtGui import QPainter, QBrush, QColor, QPixmap, QFont, QFontMetricsF
 from PyQt5.QtWidgets import QWidget, QMenu, QApplication
 from libs.shape import Shape
+from libs.spatialIndex import ShapeGrid
+from libs.imagePyramid import ImagePyramid
+from libs.undoStack import UndoStack, MoveShapesCommand, AddShapesCommand, RemoveShapesCommand, \
+    EditLabelsCommand, geometryState
 from libs.utils import distance
 
 CURSOR_DEFAULT = Qt.ArrowCursor
@@ -45,7 +47,13 @@ class Canvas(QWidget):
         # Initialise local state.
         self.mode = self.EDIT
         self.shapes = []
-        self.shapesBackups = []
+        # grid over the shapes for hover and selection, see shapesAt
+        self.shapeGrid = ShapeGrid(self.epsilon)
+        # bumped whenever shapes are added to or removed from self.shapes
+        self.shapesVersion = 0
+        # edits as commands holding only what they changed, see libs/undoStack.py
+        self.undoStack = UndoStack()
+        self.moveStart = None
         self.current = None
         self.selectedShapes = []
         self.selectedShape = None  # save the selected shape here
@@ -63,6 +71,12 @@ class Canvas(QWidget):
         self.hShape = None
         self.hVertex = None
         self._painter = QPainter()
+        # cached layers of the visible area: the scaled image and the shapes
+        # that are neither selected nor hovered, see paintEvent
+        self._backgroundLayer = self._backgroundKey = None
+        self._shapeLayer = self._shapeKey = None
+        # bumped whenever a shape of the shape layer paints differently
+        self.layerVersion = 0
         self._cursor = CURSOR_DEFAULT
         # Menus:
         self.menus = (QMenu(), QMenu())
@@ -99,6 +113,29 @@ class Canvas(QWidget):
     def isVisible(self, shape):
         return self.visible.get(shape, True)
 
+    def invalidateIndex(self):
+        """call after adding shapes to or removing them from self.shapes"""
+        self.shapesVersion += 1
+        self.invalidateLayer()
+
+    def updateIndex(self, shapes):
+        for shape in shapes:
+            self.shapeGrid.update(shape)
+        self.invalidateLayer()
+
+    def invalidateLayer(self):
+        """
+        call after changing the points, label, colours, selection or
+        visibility of shapes
+        """
+        self.layerVersion += 1
+
+    def shapesAt(self, point):
+        """Visible shapes that may be under point, topmost first."""
+        if self.shapeGrid.isStale(self.shapes, self.shapesVersion):
+            self.shapeGrid.rebuild(self.shapes, self.shapesVersion)
+        return [s for s in self.shapeGrid.query(point) if self.isVisible(s)]
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -182,8 +219,9 @@ class Canvas(QWidget):
         if Qt.RightButton & ev.buttons():
             if self.selectedShapesCopy and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapesDeviceRect(self.selectedShapesCopy)
                 self.boundedMoveShape(self.selectedShapesCopy, pos)
-                self.repaint()
+                self.updateShapes(self.selectedShapesCopy, before)
             elif self.selectedShapes:
                 self.selectedShapesCopy = [
                     s.copy() for s in self.selectedShapes
@@ -193,16 +231,21 @@ class Canvas(QWidget):
 
         # Polygon/Vertex moving.
         if Qt.LeftButton & ev.buttons():
+            if not self.movingShape:
+                moving = [self.hShape] if self.selectedVertex() else list(self.selectedShapes)
+                self.moveStart = (moving, [geometryState(s) for s in moving])
             if self.selectedVertex():
+                before = self.shapeDeviceRect(self.hShape)
                 self.boundedMoveVertex(pos)
                 self.shapeMoved.emit()
-                self.repaint()
+                self.updateShapes([self.hShape], before)
                 self.movingShape = True
             elif self.selectedShapes and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapesDeviceRect(self.selectedShapes)
                 self.boundedMoveShape(self.selectedShapes, pos)
                 self.shapeMoved.emit()
-                self.repaint()
+                self.updateShapes(self.selectedShapes, before)
                 self.movingShape = True
             else:
                 #pan
@@ -218,7 +261,8 @@ class Canvas(QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip("Image")
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        previous = self.hShape
+        for shape in self.shapesAt(pos):
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
             index = shape.nearestVertex(pos, self.epsilon)
@@ -230,7 +274,7 @@ class Canvas(QWidget):
                 self.overrideCursor(CURSOR_POINT)
                 self.setToolTip("Click & drag to move point")
                 self.setStatusTip(self.toolTip())
-                self.update()
+                self.updateShapes([previous, shape])
                 break
             elif shape.containsPoint(pos):
                 if self.selectedVertex():
@@ -240,12 +284,12 @@ class Canvas(QWidget):
                     "Click & drag to move shape '%s'" % shape.label)
                 self.setStatusTip(self.toolTip())
                 self.overrideCursor(CURSOR_GRAB)
-                self.update()
+                self.updateShapes([previous, shape])
                 break
         else:  # Nothing found, clear highlights, reset state.
             if self.hShape:
                 self.hShape.highlightClear()
-                self.update()
+                self.updateShapes([self.hShape])
             self.hVertex, self.hShape = None, None
             self.overrideCursor(CURSOR_DEFAULT)
 
@@ -313,31 +357,36 @@ class Canvas(QWidget):
                 #pan
                 QApplication.restoreOverrideCursor() # ?
 
-        if self.movingShape and self.hShape:
-             index = self.shapes.index(self.hShape)
-             if (
-                 self.shapesBackups[-1][index].points
-                 != self.shapes[index].points
-             ):
-                 self.storeShapes()
-                 self.shapeMoved.emit() # connect to updateBoxlist in PPOCRLabel.py
-
-             self.movingShape = False
+        if self.movingShape and self.moveStart:
+            shapes, before = self.moveStart
+            if any(state[0] != shape.points for shape, state in zip(shapes, before)):
+                self.pushCommand(MoveShapesCommand(shapes, before, [geometryState(s) for s in shapes]))
+                self.shapeMoved.emit() # connect to updateBoxlist in PPOCRLabel.py
+            self.moveStart = None
+            self.movingShape = False
 
     def endMove(self, copy=False):
         assert self.selectedShapes and self.selectedShapesCopy
         assert len(self.selectedShapesCopy) == len(self.selectedShapes)
         if copy:
+            start = len(self.shapes)
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.shapes.append(shape)
                 self.selectedShapes[i].selected = False
                 self.selectedShapes[i] = shape
+            self.invalidateIndex()
+            self.pushCommand(AddShapesCommand(list(self.selectedShapesCopy),
+                                              list(range(start, len(self.shapes)))))
         else:
+            shapes = list(self.selectedShapes)
+            before = [geometryState(s) for s in shapes]
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.selectedShapes[i].points = shape.points
+                self.selectedShapes[i].center = shape.center
+            self.updateIndex(self.selectedShapes)
+            self.pushCommand(MoveShapesCommand(shapes, before, [geometryState(s) for s in shapes]))
         self.selectedShapesCopy = []
         self.repaint()
-        self.storeShapes()
         return True
 
     def hideBackroundShapes(self, value):
@@ -407,8 +456,8 @@ class Canvas(QWidget):
             shape.highlightVertex(index, shape.MOVE_VERTEX)
             return self.hVertex
         else:
-            for shape in reversed(self.shapes):
-                if self.isVisible(shape) and shape.containsPoint(point):
+            for shape in self.shapesAt(point):
+                if shape.containsPoint(point):
                     self.calculateOffsets(shape, point)
                     self.setHiding()
                     if multiple_selection_mode:
@@ -482,6 +531,7 @@ class Canvas(QWidget):
 
         else:
             shape.moveVertexBy(index, shiftPos)
+        self.updateIndex([shape])
 
     def boundedMoveShape(self, shapes, pos):
         if type(shapes).__name__ != 'list': shapes = [shapes]
@@ -504,6 +554,7 @@ class Canvas(QWidget):
             for shape in shapes:
                 shape.moveBy(dp)
                 shape.close()
+            self.updateIndex(shapes)
             self.prevPoint = pos
             return True
         return False
@@ -511,6 +562,7 @@ class Canvas(QWidget):
     def deSelectShape(self):
         if self.selectedShapes:
             for shape in self.selectedShapes: shape.selected=False
+            self.invalidateLayer()
             self.setHiding(False)
             self.selectionChanged.emit([])
             self.update()
@@ -518,21 +570,29 @@ class Canvas(QWidget):
     def deleteSelected(self):
         deleted_shapes = []
         if self.selectedShapes:
-            for shape in self.selectedShapes:
-                self.shapes.remove(shape)
-                deleted_shapes.append(shape)
-            self.storeShapes()
+            deleted = set(map(id, self.selectedShapes))
+            indices = [i for i, shape in enumerate(self.shapes) if id(shape) in deleted]
+            deleted_shapes = [self.shapes[i] for i in indices]
+            self.shapes[:] = [shape for shape in self.shapes if id(shape) not in deleted]
+            self.invalidateIndex()
+            self.pushCommand(RemoveShapesCommand(deleted_shapes, indices))
             self.selectedShapes = []
             self.update()
         return deleted_shapes
 
-    def storeShapes(self):
-        shapesBackup = []
-        for shape in self.shapes:
-            shapesBackup.append(shape.copy())
-        if len(self.shapesBackups) >= 10:
-            self.shapesBackups = self.shapesBackups[-9:]
-        self.shapesBackups.append(shapesBackup)
+    def pushCommand(self, command):
+        self.undoStack.push(command)
+
+    def editLabels(self, shapes, labels=None, key_cls=None):
+        """Change the label and/or key class of shapes as one undo step."""
+        before = [(s.label, s.key_cls) for s in shapes]
+        after = [(s.label if labels is None else labels[i], s.key_cls if key_cls is None else key_cls)
+                 for i, s in enumerate(shapes)]
+        if before == after:
+            return
+        command = EditLabelsCommand(list(shapes), before, after)
+        command.redo(self)
+        self.pushCommand(command)
 
     def copySelectedShape(self):
         if self.selectedShapes:
@@ -562,15 +622,20 @@ class Canvas(QWidget):
         p.setRenderHint(QPainter.HighQualityAntialiasing)
         p.setRenderHint(QPainter.SmoothPixmapTransform)
 
+        Shape.scale = self.scale
+        layerRect = self.visibleRegion().boundingRect()
+        if not layerRect.isEmpty():
+            p.drawPixmap(layerRect.topLeft(), self.backgroundLayer(layerRect))
+            p.drawPixmap(layerRect.topLeft(), self.shapeLayer(layerRect))
+
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
-        Shape.scale = self.scale
-        for shape in self.shapes:
-            if (shape.selected or not self._hideBackround) and self.isVisible(shape):
-                shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
+        # selected and hovered shapes change on every mouse move, they are
+        # painted over the layers
+        for shape in self.activeShapes():
+            shape.fill = True
+            shape.paint(p)
         if self.current:
             self.current.paint(p)
             self.line.paint(p)
@@ -621,6 +686,103 @@ class Canvas(QWidget):
 
         p.end()
 
+    def activeShapes(self):
+        shapes = [s for s in self.shapes if s.selected and self.isVisible(s)]
+        if self.hShape is not None and self.hShape not in shapes and self.hShape in self.shapes \
+                and not self._hideBackround and self.isVisible(self.hShape):
+            shapes.append(self.hShape)
+        return shapes
+
+    def _layerPainter(self, layer, rect):
+        p = QPainter(layer)
+        p.setRenderHint(QPainter.Antialiasing)
+        p.setRenderHint(QPainter.HighQualityAntialiasing)
+        p.setRenderHint(QPainter.SmoothPixmapTransform)
+        p.translate(-rect.x(), -rect.y())
+        p.scale(self.scale, self.scale)
+        p.translate(self.offsetToCenter())
+        return p
+
+    def backgroundLayer(self, rect):
+        """The image scaled to the current zoom, for the visible rect only."""
+        offset = self.offsetToCenter()
+        key = (self.pixmap.cacheKey(), self.scale, rect.getRect(), offset.x(), offset.y())
+        if key != self._backgroundKey:
+            layer = QPixmap(rect.size())
+            layer.fill(Qt.transparent)
+            p = self._layerPainter(layer, rect)
+            if isinstance(self.pixmap, ImagePyramid):
+                # only the tiles under the visible rect, at the zoom's level
+                visible = QRectF(rect.x() / self.scale - offset.x(), rect.y() / self.scale - offset.y(),
+                                 rect.width() / self.scale, rect.height() / self.scale)
+                self.pixmap.draw(p, visible, self.scale)
+            else:
+                p.drawPixmap(0, 0, self.pixmap)
+            p.end()
+            self._backgroundLayer, self._backgroundKey = layer, key
+        return self._backgroundLayer
+
+    def shapeLayer(self, rect):
+        """
+        The shapes that are not selected, redrawn only when layerVersion, the
+        zoom or the visible rect changed. Selected and hovered shapes are
+        painted over the layer, so they show on top of the others.
+        """
+        offset = self.offsetToCenter()
+        key = (self.scale, rect.getRect(), offset.x(), offset.y(), self._hideBackround, self.layerVersion)
+        if key != self._shapeKey:
+            shapes = [] if self._hideBackround else \
+                [s for s in self.shapes if not s.selected and self.isVisible(s)]
+            layer = QPixmap(rect.size())
+            layer.fill(Qt.transparent)
+            p = self._layerPainter(layer, rect)
+            for shape in shapes:
+                # hover highlights are painted over the layer
+                highlight = shape._highlightIndex
+                shape._highlightIndex = None
+                shape.fill = False
+                shape.paint(p)
+                shape._highlightIndex = highlight
+            p.end()
+            self._shapeLayer, self._shapeKey = layer, key
+        return self._shapeLayer
+
+    def shapeDeviceRect(self, shape):
+        """Widget area a shape paints on, vertices and label included."""
+        if shape is None or not shape.points:
+            return QRect()
+        xs = [pt.x() for pt in shape.points]
+        ys = [pt.y() for pt in shape.points]
+        rect = QRectF(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        if shape.paintLabel and shape.label:
+            font = QFont()
+            font.setPointSize(8)
+            font.setBold(True)
+            metrics = QFontMetricsF(font)
+            y = rect.y() + 10 if rect.y() < 10 else rect.y()
+            rect = rect.united(QRectF(rect.x(), y - metrics.ascent(),
+                                      metrics.width(shape.label), metrics.height()))
+        rect.translate(self.offsetToCenter())
+        rect = QRectF(rect.x() * self.scale, rect.y() * self.scale,
+                      rect.width() * self.scale, rect.height() * self.scale)
+        # the largest highlighted vertex is 4 * point_size wide
+        margin = 2 * Shape.point_size + 2
+        return rect.toAlignedRect().adjusted(-margin, -margin, margin, margin)
+
+    def shapesDeviceRect(self, shapes):
+        rect = QRect()
+        for shape in shapes:
+            rect = rect.united(self.shapeDeviceRect(shape))
+        return rect
+
+    def updateShapes(self, shapes, before=None):
+        """Schedule a repaint of the area of shapes, and of the rect before."""
+        rect = self.shapesDeviceRect(shapes)
+        if before is not None:
+            rect = rect.united(before)
+        if not rect.isEmpty():
+            self.update(rect)
+
     def fillDrawing(self):
         return self._fill_drawing
 
@@ -652,6 +814,10 @@ class Canvas(QWidget):
 
         self.current.close()
         self.shapes.append(self.current)
+        fresh = not self.shapeGrid.isStale(self.shapes, self.shapesVersion)
+        self.invalidateIndex()
+        if fresh:
+            self.shapeGrid.add(self.current, self.shapesVersion)
         self.current = None
         self.setHiding(False)
         self.newShape.emit()
@@ -697,11 +863,8 @@ class Canvas(QWidget):
 
     def keyPressEvent(self, ev):
         key = ev.key()
-        shapesBackup = copy.deepcopy(self.shapes)
-        if len(shapesBackup) == 0:
+        if len(self.shapes) == 0:
             return
-        self.shapesBackups.pop()
-        self.shapesBackups.append(shapesBackup)
         if key == Qt.Key_Escape and self.current:
             print('ESC press')
             self.current = None
@@ -718,20 +881,28 @@ class Canvas(QWidget):
         elif key == Qt.Key_Down and self.selectedShapes:
              self.moveOnePixel('Down')
         elif key == Qt.Key_X and self.selectedShapes:
+            before = [geometryState(s) for s in self.selectedShapes]
             for i in range(len(self.selectedShapes)):
                 self.selectedShape = self.selectedShapes[i]
                 if self.rotateOutOfBound(0.01):
                     continue
                 self.selectedShape.rotate(0.01)
+            self.updateIndex(self.selectedShapes)
+            self.pushCommand(MoveShapesCommand(list(self.selectedShapes), before,
+                                               [geometryState(s) for s in self.selectedShapes], 'rotate'))
             self.shapeMoved.emit()
             self.update()
 
         elif key == Qt.Key_C and self.selectedShapes:
+            before = [geometryState(s) for s in self.selectedShapes]
             for i in range(len(self.selectedShapes)):
                 self.selectedShape = self.selectedShapes[i]
                 if self.rotateOutOfBound(-0.01):
                     continue
                 self.selectedShape.rotate(-0.01)
+            self.updateIndex(self.selectedShapes)
+            self.pushCommand(MoveShapesCommand(list(self.selectedShapes), before,
+                                               [geometryState(s) for s in self.selectedShapes], 'rotate'))
             self.shapeMoved.emit()
             self.update()
 
@@ -747,6 +918,7 @@ class Canvas(QWidget):
         # print(self.selectedShape.points)
         self.selectCount = len(self.selectedShapes)
         self.selectCountShape = True
+        before = [geometryState(s) for s in self.selectedShapes]
         for i in range(len(self.selectedShapes)):
             self.selectedShape = self.selectedShapes[i]
             if direction == 'Left' and not self.moveOutOfBound(QPointF(-1.0, 0)):
@@ -773,9 +945,10 @@ class Canvas(QWidget):
                 self.selectedShape.points[1] += QPointF(0, 1.0)
                 self.selectedShape.points[2] += QPointF(0, 1.0)
                 self.selectedShape.points[3] += QPointF(0, 1.0)
-        shapesBackup = []
-        shapesBackup = copy.deepcopy(self.shapes)
-        self.shapesBackups.append(shapesBackup)
+        self.updateIndex(self.selectedShapes)
+        # a run of nudges on the same shapes is one undo step
+        self.pushCommand(MoveShapesCommand(list(self.selectedShapes), before,
+                                           [geometryState(s) for s in self.selectedShapes], 'nudge'))
         self.shapeMoved.emit()
         self.repaint()
 
@@ -794,14 +967,16 @@ class Canvas(QWidget):
 
         if key_cls:
             self.shapes[-1].key_cls = key_cls
+        self.invalidateLayer()
 
-        self.storeShapes()
+        self.pushCommand(AddShapesCommand([self.shapes[-1]], [len(self.shapes) - 1]))
 
         return self.shapes[-1]
 
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.invalidateIndex()
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -820,6 +995,7 @@ class Canvas(QWidget):
     def resetAllLines(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.invalidateIndex()
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -830,6 +1006,7 @@ class Canvas(QWidget):
     def loadPixmap(self, pixmap):
         self.pixmap = pixmap
         self.shapes = []
+        self.invalidateIndex()
         self.repaint()
 
     def loadShapes(self, shapes, replace=True):
@@ -837,15 +1014,20 @@ class Canvas(QWidget):
             self.shapes = list(shapes)
         else:
             self.shapes.extend(shapes)
+        self.invalidateIndex()
         self.current = None
         self.hShape = None
         self.hVertex = None
         # self.hEdge = None
-        self.storeShapes()
+        if replace:
+            self.undoStack.clear()
+        else:
+            self.pushCommand(AddShapesCommand(list(shapes), list(range(len(self.shapes) - len(shapes), len(self.shapes)))))
         self.repaint()
 
     def setShapeVisible(self, shape, value):
         self.visible[shape] = value
+        self.invalidateLayer()
         self.repaint()
 
     def currentCursor(self):
@@ -868,25 +1050,30 @@ class Canvas(QWidget):
         self.restoreCursor()
         self.pixmap = None
         self.update()
-        self.shapesBackups = []
+        self.undoStack.clear()
 
     def setDrawingShapeToSquare(self, status):
         self.drawSquare = status
 
     def restoreShape(self):
-        if not self.isShapeRestorable:
-            return
+        self._replay(self.undoStack.undo)
 
-        self.shapesBackups.pop()  # latest
-        shapesBackup = self.shapesBackups.pop()
-        self.shapes = shapesBackup
+    def redoShape(self):
+        self._replay(self.undoStack.redo)
+
+    def _replay(self, step):
+        if step(self) is None:
+            return
         self.selectedShapes = []
         for shape in self.shapes:
             shape.selected = False
+        self.invalidateLayer()
         self.repaint()
 
     @property
     def isShapeRestorable(self):
-        if len(self.shapesBackups) < 2:
-            return False
-        return True
\ No newline at end of file
+        return self.undoStack.canUndo()
+
+    @property
+    def isShapeRedoable(self):
+        return self.undoStack.canRedo()
\ No newline at end of file
@@ -0,0 +1,452 @@
+import os
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from libs.utils import get_rotate_crop_image
+from libs.lmdbWriter import LmdbWriter, encodeImage
+from libs.imageInfo import imageSize
+from ppocr.utils.reading_order import reading_order
+
+# one manifest per crop name infix, rec and recMM share crop_img/
+MANIFEST_NAME = 'export_manifest{}.json'
+
+
+def fileHash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def labelHash(labels):
+    """only what changes the crop pixels, transcriptions are not part of it"""
+    boxes = [[label['points'], bool(label.get('difficult', False))] for label in labels]
+    return hashlib.sha1(json.dumps(boxes).encode('utf-8')).hexdigest()
+
+
+def cropNames(key, labels, infix):
+    """(index, crop file name) of the labels that are exported"""
+    base = os.path.splitext(os.path.basename(key))[0]
+    return [(i, base + infix + str(i) + '.jpg') for i, label in enumerate(labels)
+            if not label.get('difficult', False)]
+
+
+class JsonListWriter(object):
+    """
+    writes {head..., name: [item, item, ...]} one item at a time, so a large
+    data_list is never held in memory
+    """
+
+    def __init__(self, path, head, name):
+        self.f = open(path, 'w', encoding='utf-8')
+        self.f.write(json.dumps(head, ensure_ascii=False)[:-1])
+        self.f.write(', ' if head else '')
+        self.f.write(json.dumps(name) + ': [')
+        self.first = True
+
+    def write(self, item):
+        if not self.first:
+            self.f.write(', ')
+        self.first = False
+        self.f.write(json.dumps(item, ensure_ascii=False))
+
+    def close(self):
+        self.f.write(']}\n')
+        self.f.close()
+
+
+# ----------------------------------------------------------------------
+# Work done in the process pool. A job is (image path, [(target number,
+# task)]); the image is decoded at most once for all tasks of all targets.
+
+def runTasks(job):
+    """
+    return:
+        ({target number: result}, error or None)
+    """
+    imagePath, tasks = job
+    state = {}
+
+    def pixels():
+        if 'img' not in state:
+            img = cv2.imdecode(np.fromfile(imagePath, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise IOError('Can not read image ' + imagePath)
+            state['img'] = img
+        return state['img']
+
+    try:
+        results = {}
+        for number, task in tasks:
+            results[number] = TASKS[task[0]](imagePath, pixels, *task[1:])
+        return results, None
+    except Exception as e:
+        return {}, str(e)
+
+
+def cropTask(imagePath, pixels, labels, names, cropDir, oldHash):
+    """crop files, skipped when the file content is the one the manifest recorded"""
+    imageHash = fileHash(imagePath)
+    if imageHash == oldHash and all(os.path.exists(os.path.join(cropDir, name)) for _, name in names):
+        return imageHash
+    img = pixels()
+    for i, name in names:
+        img_crop = get_rotate_crop_image(img, np.array(labels[i]['points'], np.float32))
+        ok, data = cv2.imencode('.jpg', img_crop)
+        if not ok:
+            raise IOError('Can not encode crop ' + name)
+        data.tofile(os.path.join(cropDir, name))
+    return imageHash
+
+
+def encodeTask(imagePath, pixels, labels, encoding):
+    """[(label index, encoded crop)] of the exported labels"""
+    img = pixels()
+    crops = []
+    for i, label in enumerate(labels):
+        if label.get('difficult', False):
+            continue
+        img_crop = get_rotate_crop_image(img, np.array(label['points'], np.float32))
+        crops.append((i, encodeImage(img_crop, encoding)))
+    return crops
+
+
+TASKS = {'crop': cropTask, 'encode': encodeTask}
+
+
+# ----------------------------------------------------------------------
+# Export targets. begin() sees all images first, prepare() runs in the main
+# process and returns the task an image needs from the pool (or None),
+# collect() gets the images in order with the task result and streams them
+# out, close(complete) finishes the files. A cancelled export is closed with
+# complete=False.
+
+class ExportTarget(object):
+
+    def begin(self, items):
+        pass
+
+    def prepare(self, imagePath, key, labels):
+        return None
+
+    def collect(self, imagePath, key, labels, result):
+        raise NotImplementedError
+
+    def fail(self, imagePath, key, labels):
+        pass
+
+    def close(self, complete):
+        pass
+
+
+class DetTarget(ExportTarget):
+    """det_label.json of PaddleOCR, difficult boxes are marked ###"""
+
+    def __init__(self, output):
+        self.output = output
+        self.f = open(output, 'w', encoding='utf-8')
+
+    def collect(self, imagePath, key, labels, result):
+        ano = [{'transcription': '###' if label.get('difficult', False) else label['transcription'],
+                'points': label['points']} for label in labels]
+        self.f.write(os.path.basename(key) + '\t' + json.dumps(ano, ensure_ascii=False) + '\n')
+
+    def close(self, complete):
+        self.f.close()
+
+
+class DetMMTarget(ExportTarget):
+    """
+    det_label.json of MMOCR (TextDetDataset). Image sizes come from the
+    file headers, imageSizes(paths) -> {path: (width, height)} can serve
+    them from a cache like ProjectStore.imageSizes.
+    """
+
+    def __init__(self, output, imageSizes=None):
+        self.output = output
+        self.imageSizes = imageSizes
+        self.sizes = {}
+        self.writer = JsonListWriter(output, {
+            'metainfo': {
+                'dataset_type': 'TextDetDataset',
+                'task_name': 'textdet',
+                'category': [{'id': 0, 'name': 'text'}]
+            }
+        }, 'data_list')
+
+    def begin(self, items):
+        paths = [imagePath for imagePath, key, labels in items]
+        if self.imageSizes is not None:
+            self.sizes = self.imageSizes(paths)
+        else:
+            self.sizes = dict((path, imageSize(path)) for path in paths)
+
+    def collect(self, imagePath, key, labels, result):
+        if self.sizes.get(imagePath) is None:
+            print('Can not read the size of', imagePath)
+            return
+        w, h = self.sizes[imagePath]
+        ano = []
+        for label in labels:
+            points = np.array(label['points'], dtype=np.float64)
+            ano.append({
+                'polygon': [coord for point in label['points'] for coord in point],
+                'bbox': [float(points[:, 0].min()), float(points[:, 1].min()),
+                         float(points[:, 0].max()), float(points[:, 1].max())],
+                'bbox_label': 0,
+                'ignore': bool(label.get('difficult', False))
+            })
+        name = os.path.basename(key)
+        self.writer.write({
+            'instances': ano,
+            'img_path': name,
+            'height': int(h),
+            'width': int(w),
+            'seg_map': os.path.splitext(name)[0] + '.txt'
+        })
+
+    def close(self, complete):
+        self.writer.close()
+
+
+class KieTarget(ExportTarget):
+    """
+    kie_label.json (SER), ids follow the reading order of the boxes. A
+    kie_label_last.json next to it is removed, as the old exporter did; it
+    was never written, so one on disk is stale.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        last = os.path.splitext(output)[0] + '_last.json'
+        if os.path.isfile(last):
+            os.remove(last)
+        self.f = open(output, 'w', encoding='utf-8')
+
+    def collect(self, imagePath, key, labels, result):
+        bbox_info = []
+        order = reading_order([label['points'] for label in labels]) if labels else []
+        for seq, i in enumerate(order):
+            label = labels[i]
+            if label.get('difficult', False):
+                continue
+            bbox_info.append({
+                'transcription': label['transcription'],
+                'label': label.get('key_cls', 'None').replace('None', 'other'),
+                'points': label['points'],
+                'id': seq,
+                'linking': []
+            })
+        self.f.write(os.path.basename(key) + '\t' + json.dumps(bbox_info, ensure_ascii=False) + '\n')
+
+    def close(self, complete):
+        self.f.close()
+
+
+class RecTarget(ExportTarget):
+    """
+    Crop images for recognition plus rec_label.txt (PaddleOCR) or
+    rec_label.json (MMOCR).
+
+    crop_img/export_manifest<infix>.json remembers for every exported image its
+    file stamp and hash, the hash of its boxes and the crops written. On a
+    re-export an image is only cropped again when its pixels or boxes
+    changed; crops an image no longer has are removed.
+    """
+
+    def __init__(self, output, cropDir, infix='_crop_', mm=False):
+        self.output = output
+        self.cropDir = cropDir
+        self.infix = infix
+        self.mm = mm
+        self.manifestPath = os.path.join(cropDir, MANIFEST_NAME.format(infix))
+        os.makedirs(cropDir, exist_ok=True)
+        self.manifest = self.loadManifest()
+        self.pending = {}
+        self.records = []
+        self.failed = []
+
+    def loadManifest(self):
+        try:
+            with open(self.manifestPath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveManifest(self):
+        tmpPath = self.manifestPath + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmpPath, self.manifestPath)
+
+    def prepare(self, imagePath, key, labels):
+        stat = os.stat(imagePath)
+        entryKey = self.infix + '\t' + key
+        old = self.manifest.get(entryKey, {})
+        names = cropNames(key, labels, self.infix)
+        entry = {
+            'stamp': [stat.st_size, stat.st_mtime_ns],
+            'labels': labelHash(labels),
+            'crops': [name for _, name in names]
+        }
+        self.pending[entryKey] = (entry, old)
+        if old.get('stamp') == entry['stamp'] and old.get('labels') == entry['labels'] \
+                and old.get('crops') == entry['crops'] \
+                and all(os.path.exists(os.path.join(self.cropDir, name)) for name in entry['crops']):
+            # same file and boxes, nothing to read at all
+            entry['image'] = old.get('image')
+            return None
+        oldHash = old.get('image') if old.get('labels') == entry['labels'] else None
+        return ('crop', labels, names, self.cropDir, oldHash)
+
+    def collect(self, imagePath, key, labels, result):
+        entryKey = self.infix + '\t' + key
+        entry, old = self.pending.pop(entryKey)
+        if result is not None:
+            entry['image'] = result
+        for name in set(old.get('crops', [])) - set(entry['crops']):
+            try:
+                os.remove(os.path.join(self.cropDir, name))
+            except OSError:
+                pass
+        self.manifest[entryKey] = entry
+        for i, name in cropNames(key, labels, self.infix):
+            self.records.append((name, labels[i]['transcription']))
+
+    def fail(self, imagePath, key, labels):
+        # forget the image, its crops are redone next time
+        self.pending.pop(self.infix + '\t' + key, None)
+        self.manifest.pop(self.infix + '\t' + key, None)
+        self.failed.append(imagePath)
+
+    def close(self, complete):
+        for entryKey in self.pending:
+            self.manifest.pop(entryKey, None)
+        self.saveManifest()
+        if not complete:
+            return
+        if self.mm:
+            writer = JsonListWriter(self.output, {
+                'metainfo': {
+                    'dataset_type': 'TextRecogDataset',
+                    'task_name': 'textrecog',
+                }
+            }, 'data_list')
+            for img_name, transcription in self.records:
+                writer.write({'img_path': 'crop_img/' + img_name,
+                              'instances': [{'text': transcription}]})
+            writer.close()
+        else:
+            with open(self.output, 'w', encoding='utf-8') as f:
+                for img_name, transcription in self.records:
+                    f.write('crop_img/' + img_name + '\t' + transcription + '\n')
+
+
+class RecLmdbTarget(ExportTarget):
+    """
+    Crops straight into an LMDB dataset for ppocr/data/lmdb_dataset.LMDBDataSet,
+    no crop files are written. Samples are numbered in image order.
+    """
+
+    def __init__(self, lmdbDir, encoding='jpg', commitNum=1000):
+        self.output = lmdbDir
+        self.encoding = encoding
+        self.writer = LmdbWriter(lmdbDir, commitNum=commitNum)
+
+    @property
+    def count(self):
+        return self.writer.count
+
+    def prepare(self, imagePath, key, labels):
+        return ('encode', labels, self.encoding)
+
+    def collect(self, imagePath, key, labels, result):
+        for i, data in result:
+            self.writer.put(data, labels[i]['transcription'])
+
+    def close(self, complete):
+        self.writer.close()
+
+
+class ExportEngine(object):
+    """
+    Export any set of targets in one pass over the checked images: labels
+    come from memory, each image is decoded at most once in a process pool
+    and every target streams its output as the images come back in order.
+    """
+
+    def __init__(self, targets, workers=None):
+        self.targets = targets
+        self.workers = workers or os.cpu_count() or 1
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self, items, progress=None):
+        """
+        items: (image path, label key, label list) of the checked images
+        progress: called with (done, total)
+        return:
+            [image paths that failed]
+        """
+        items = [item for item in items if os.path.isfile(item[0])]
+        total = len(items)
+        failed = []
+        if progress is not None:
+            progress(0, total)
+        try:
+            for target in self.targets:
+                target.begin(items)
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                window = deque()
+                pending = iter(items)
+                done = 0
+                # keep a few images per worker in flight, results are read in order
+                while not self.cancelled:
+                    while len(window) < 4 * self.workers:
+                        item = next(pending, None)
+                        if item is None:
+                            break
+                        window.append((item, self._submit(executor, item)))
+                    if not window:
+                        break
+                    (imagePath, key, labels), (future, numbers) = window.popleft()
+                    results, error = future.result() if future is not None else ({}, None)
+                    if error is not None:
+                        print('Can not export', imagePath, error)
+                        failed.append(imagePath)
+                    for number, target in enumerate(self.targets):
+                        if error is not None and number in numbers:
+                            target.fail(imagePath, key, labels)
+                        else:
+                            # targets without a task do not need the pixels
+                            target.collect(imagePath, key, labels, results.get(number))
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+                for _, (future, numbers) in window:
+                    if future is not None:
+                        future.cancel()
+        finally:
+            for target in self.targets:
+                target.close(not self.cancelled)
+        return failed
+
+    def _submit(self, executor, item):
+        imagePath, key, labels = item
+        tasks = []
+        for number, target in enumerate(self.targets):
+            task = target.prepare(imagePath, key, labels)
+            if task is not None:
+                tasks.append((number, task))
+        if not tasks:
+            return None, set()
+        return executor.submit(runTasks, (imagePath, tasks)), set(number for number, _ in tasks)
+
@@ -0,0 +1,29 @@
+import traceback
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class ExportWorker(QThread):
+    """
+    runs engine.run(items, progress) off the UI thread, for an ExportEngine
+    or a RecAugmentGenerator. endsignal is always emitted, with the failed
+    images; error holds the traceback when the run raised.
+    """
+    progressValue = pyqtSignal(int, int)
+    endsignal = pyqtSignal(list)
+
+    def __init__(self, engine, items):
+        super(ExportWorker, self).__init__()
+        self.engine = engine
+        self.items = items
+        self.error = None
+
+    def run(self):
+        failed = []
+        try:
+            failed = self.engine.run(self.items, progress=self.progressValue.emit)
+        except Exception:
+            self.error = traceback.format_exc()
+            print(self.error)
+        finally:
+            self.endsignal.emit(failed)
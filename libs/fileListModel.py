@@ -0,0 +1,64 @@
+import os
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class FileListModel(QAbstractListModel):
+    """
+    Image list of the opened directory for a QListView. Rows are only
+    rendered when they are visible, the row of a path is a dict lookup and
+    the checked state is read from the shared fileStatedict.
+    """
+
+    def __init__(self, doneIcon, closeIcon, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self.doneIcon = doneIcon
+        self.closeIcon = closeIcon
+        self.images = []
+        self.rows = {}
+        self.fileState = {}
+
+    def setImages(self, images, fileState=None):
+        self.beginResetModel()
+        self.images = images
+        self.rows = {path: row for row, path in enumerate(images)}
+        self.fileState = fileState if fileState is not None else {}
+        self.endResetModel()
+
+    def clear(self):
+        self.setImages([])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.images[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.DecorationRole:
+            return self.doneIcon if self.fileState.get(path) == 1 else self.closeIcon
+        if role in (Qt.ToolTipRole, Qt.UserRole):
+            return path
+        return None
+
+    def row(self, path):
+        """
+        row of path, -1 if it is not listed
+        """
+        return self.rows.get(path, -1)
+
+    def path(self, row):
+        return self.images[row]
+
+    def updateState(self, path):
+        """
+        repaint the status icon of one image after its state changed
+        """
+        row = self.row(path)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
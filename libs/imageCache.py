@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage
+
+
+def fileStamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def decodeImage(path):
+    """
+    BGR array and a QImage over it. QImage is safe to build off the GUI
+    thread, only QPixmap is not.
+    return:
+        (cvimg, QImage, nbytes) or None when the file can not be decoded
+    """
+    cvimg = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if cvimg is None:
+        return None
+    height, width, depth = cvimg.shape
+    if hasattr(QImage, 'Format_BGR888'):
+        # Qt >= 5.14 reads BGR directly, the QImage shares the array
+        image = QImage(cvimg.data, width, height, width * depth, QImage.Format_BGR888)
+        buffer = cvimg
+    else:
+        buffer = cv2.cvtColor(cvimg, cv2.COLOR_BGR2RGB)
+        image = QImage(buffer.data, width, height, width * depth, QImage.Format_RGB888)
+    # the QImage does not own its pixels, keep the array with it
+    image.buffer = buffer
+    nbytes = cvimg.nbytes + (buffer.nbytes if buffer is not cvimg else 0)
+    return cvimg, image, nbytes
+
+
+class ImageCache(object):
+    """
+    Decoded images in a memory bounded LRU, filled ahead of navigation by
+    background threads. get() returns a cached image at once, waits for one
+    that is being decoded and decodes anything else on the calling thread.
+    Entries are dropped when the file changed on disk.
+    """
+
+    def __init__(self, maxBytes=512 * 1024 * 1024, workers=2):
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # path -> (stamp, cvimg, QImage, nbytes)
+        self.pending = {}  # path -> future
+        self.bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _decode(self, path):
+        try:
+            stamp = fileStamp(path)
+            decoded = decodeImage(path)
+        except (OSError, cv2.error):
+            decoded = None
+        with self.lock:
+            self.pending.pop(path, None)
+            if decoded is None:
+                return None
+            self._put(path, (stamp, ) + decoded)
+        return decoded[:2]
+
+    def _put(self, path, entry):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.bytes -= old[3]
+        self.entries[path] = entry
+        self.bytes += entry[3]
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            _, dropped = self.entries.popitem(last=False)
+            self.bytes -= dropped[3]
+
+    def get(self, path):
+        """
+        return:
+            (BGR array, QImage) or None when the file can not be decoded
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                try:
+                    fresh = entry[0] == fileStamp(path)
+                except OSError:
+                    fresh = False
+                if fresh:
+                    self.entries.move_to_end(path)
+                    return entry[1], entry[2]
+                del self.entries[path]
+                self.bytes -= entry[3]
+            future = self.pending.get(path)
+        if future is not None and not future.cancel():
+            result = future.result()
+            if result is not None:
+                return result
+        return self._decode(path)
+
+    def prefetch(self, paths):
+        """
+        decode paths in the background, in the given order. Queued decodes of
+        images that are no longer wanted are cancelled.
+        """
+        wanted = set(paths)
+        with self.lock:
+            for path, future in list(self.pending.items()):
+                if path not in wanted and future.cancel():
+                    del self.pending[path]
+            for path in paths:
+                if path in self.entries or path in self.pending:
+                    continue
+                self.pending[path] = self.executor.submit(self._decode, path)
+
+    def discard(self, path):
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.bytes -= entry[3]
+
+    def clear(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+            self.entries.clear()
+            self.bytes = 0
+
+    def close(self):
+        self.clear()
+        self.executor.shutdown(wait=False)
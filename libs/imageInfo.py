@@ -0,0 +1,132 @@
+import struct
+
+import cv2
+import numpy as np
+
+# JPEG start of frame markers, the others (DHT, JPG, DAC) share the range
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# markers without a length field
+STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+
+
+def tiffTags(data, tags):
+    """
+    values of the wanted tags in IFD0 of a TIFF structure (a TIFF file or
+    the payload of a JPEG EXIF segment)
+    """
+    if data[:2] == b'II':
+        order = '<'
+    elif data[:2] == b'MM':
+        order = '>'
+    else:
+        return {}
+    offset = struct.unpack(order + 'I', data[4:8])[0]
+    if offset + 2 > len(data):
+        return {}
+    count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+    values = {}
+    for i in range(count):
+        entry = data[offset + 2 + 12 * i:offset + 14 + 12 * i]
+        if len(entry) < 12:
+            break
+        tag, kind = struct.unpack(order + 'HH', entry[:4])
+        if tag not in tags:
+            continue
+        if kind == 3:  # SHORT
+            values[tag] = struct.unpack(order + 'H', entry[8:10])[0]
+        elif kind == 4:  # LONG
+            values[tag] = struct.unpack(order + 'I', entry[8:12])[0]
+    return values
+
+
+def oriented(width, height, orientation):
+    """EXIF orientations 5 to 8 are rotated by 90 degrees when decoded"""
+    if orientation in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def jpegSize(f):
+    orientation = 1
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker in STANDALONE_MARKERS:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return oriented(width, height, orientation)
+        if marker == 0xE1:
+            segment = f.read(length - 2)
+            if segment[:6] == b'Exif\x00\x00':
+                orientation = tiffTags(segment[6:], {274}).get(274, 1)
+            continue
+        if marker == 0xDA:  # start of scan before any frame header
+            return None
+        f.seek(length - 2, 1)
+
+
+def probeSize(path):
+    """
+    (width, height) of an image as cv2.imread returns it, read from the file
+    header only: JPEG SOF (with the EXIF orientation), PNG IHDR, TIFF tags,
+    GIF and BMP. None when the format is not one of these or the header is
+    broken.
+    """
+    try:
+        return _probeSize(path)
+    except struct.error:
+        return None
+
+
+def _probeSize(path):
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        if head[:2] == b'\xff\xd8':
+            return jpegSize(f)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head[:2] == b'BM':
+            width, height = struct.unpack('<ii', head[18:26])
+            return abs(width), abs(height)
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            # IFD0 is often written after the pixel data, read only it
+            order = '<' if head[:2] == b'II' else '>'
+            f.seek(struct.unpack(order + 'I', head[4:8])[0])
+            count = f.read(2)
+            ifd = count + f.read(12 * struct.unpack(order + 'H', count)[0])
+            tags = tiffTags(head[:4] + struct.pack(order + 'I', 8) + ifd, {256, 257, 274})
+            if 256 in tags and 257 in tags:
+                return oriented(tags[256], tags[257], tags.get(274, 1))
+    return None
+
+
+def imageSize(path):
+    """
+    (width, height) from the header, decoding the image only for formats
+    probeSize does not know. None if it can not be read at all.
+    """
+    try:
+        size = probeSize(path)
+    except OSError as e:
+        print('Can not read the header of', path, e)
+        size = None
+    if size is not None:
+        return size
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return img.shape[1], img.shape[0]
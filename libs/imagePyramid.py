@@ -0,0 +1,250 @@
+import os
+import math
+import shutil
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QSize, QRectF
+from PyQt5.QtGui import QImage, QPixmap
+
+# images above this many pixels are shown through a pyramid
+PYRAMID_PIXELS = 4096 * 4096
+
+_cacheKeys = itertools.count(1 << 48)
+
+# one build at a time, a huge page already takes a lot of memory and disk
+_builder = ThreadPoolExecutor(max_workers=1)
+
+
+def pyramidDir(path, cacheDir=None):
+    """
+    cache directory of an image, named after its path, size and mtime so a
+    changed image gets a new pyramid; None if the image can not be read
+    """
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.expanduser('~'), '.autoOCRPyramids')
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    return os.path.join(cacheDir, hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+
+def prune(cacheDir, maxDiskBytes, keep=None):
+    """
+    remove the least recently used pyramids (by the mtime of their
+    directory, touched on every cache hit) until the cache is down to 3/4 of
+    maxDiskBytes when it is over it; keep is never removed
+    """
+    entries = []
+    try:
+        names = os.listdir(cacheDir)
+    except OSError:
+        return
+    for name in names:
+        dirpath = os.path.join(cacheDir, name)
+        size = 0
+        try:
+            for file in os.listdir(dirpath):
+                size += os.path.getsize(os.path.join(dirpath, file))
+            entries.append((os.path.getmtime(dirpath), size, dirpath))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    if total <= maxDiskBytes:
+        return
+    entries.sort()
+    for _, size, dirpath in entries:
+        if total <= maxDiskBytes * 3 // 4:
+            break
+        if dirpath == keep:
+            continue
+        shutil.rmtree(dirpath, True)
+        total -= size
+
+
+class ImagePyramid(object):
+    """
+    Stand-in for the canvas QPixmap of a huge image. The BGR page and its
+    halved copies are kept as .npy files in a cache directory per image (see
+    pyramidDir) and read through memory maps, so a level costs page cache
+    only for the tiles that are read, and opening the image again needs no
+    decode at all (see cached()). Only the tiles of the level that matches
+    the zoom are turned into QPixmaps, kept in a bounded LRU. Sizes and
+    coordinates are those of the full resolution image.
+
+    On a cache miss the levels are written by a background thread; until it
+    is done the decoded page stays in memory and coarser levels are made
+    from it on first use. The caller should drop its own copy of cvimg;
+    level(0) gives the page back when the pixels are needed. close() stops
+    an unfinished build.
+    """
+
+    def __init__(self, path, cvimg=None, tileSize=512, maxTiles=128, cacheDir=None,
+                 maxDiskBytes=4 << 30):
+        self.dirpath = pyramidDir(path, cacheDir)
+        self.tileSize = tileSize
+        self.maxTiles = maxTiles
+        self.maxDiskBytes = maxDiskBytes
+        self.lock = threading.Lock()
+        self.closed = False
+        self.tiles = OrderedDict()  # (level, col, row) -> QPixmap
+        self._cacheKey = next(_cacheKeys)
+        levels = self._open()
+        if levels is None and cvimg is None:
+            raise ValueError('no cached pyramid for %s' % path)
+        self.levels = levels or [cvimg]
+        self._height, self._width = self.levels[0].shape[:2]
+        if levels is None and self.dirpath is not None:
+            _builder.submit(self._build, cvimg)
+
+    @classmethod
+    def cached(cls, path, **kwargs):
+        """the pyramid of path if its cache is complete, otherwise None"""
+        try:
+            return cls(path, **kwargs)
+        except ValueError:
+            return None
+
+    def _levelPath(self, index):
+        return os.path.join(self.dirpath, 'level%d.npy' % index)
+
+    def _open(self):
+        """map the cached levels read only, None unless the build finished"""
+        if self.dirpath is None:
+            return None
+        try:
+            with open(os.path.join(self.dirpath, 'levels')) as f:
+                count = int(f.read())
+            levels = [np.load(self._levelPath(i), mmap_mode='r') for i in range(count)]
+            # recently used pyramids survive prune()
+            os.utime(self.dirpath)
+        except (OSError, ValueError):
+            return None
+        return levels
+
+    def _write(self, index, img):
+        mapped = np.lib.format.open_memmap(self._levelPath(index), mode='w+',
+                                           dtype=img.dtype, shape=img.shape)
+        # in slices, so the UI thread gets the GIL between them
+        for row in range(0, img.shape[0], 256):
+            mapped[row:row + 256] = img[row:row + 256]
+        mapped.flush()
+
+    def _build(self, img):
+        """write every level to the cache, then read them from there"""
+        if self.closed:
+            return
+        levels = self._open()
+        if levels is None:
+            count = self.maxLevel() + 1
+            try:
+                os.makedirs(self.dirpath, exist_ok=True)
+                for index in range(count):
+                    if index:
+                        height, width = img.shape[:2]
+                        img = cv2.resize(img, (max(1, width // 2), max(1, height // 2)),
+                                         interpolation=cv2.INTER_AREA)
+                    self._write(index, img)
+                    if self.closed:
+                        return
+                with open(os.path.join(self.dirpath, 'levels'), 'w') as f:
+                    f.write(str(count))
+            except OSError as e:
+                print('Can not cache the pyramid in', self.dirpath, e)
+                return
+            levels = self._open()
+            prune(os.path.dirname(self.dirpath), self.maxDiskBytes, keep=self.dirpath)
+        with self.lock:
+            # the same pixels as the levels made in memory, tiles stay valid
+            if not self.closed and levels is not None:
+                self.levels = levels
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            self.levels = []
+            self.tiles.clear()
+
+    # the part of the QPixmap interface the canvas and main window use
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def size(self):
+        return QSize(self.width(), self.height())
+
+    def isNull(self):
+        return False
+
+    def __bool__(self):
+        return True
+
+    def cacheKey(self):
+        return self._cacheKey
+
+    def maxLevel(self):
+        # stop before the page gets smaller than a tile
+        return max(0, int(math.log2(max(self.width(), self.height()) / self.tileSize)))
+
+    def level(self, index):
+        with self.lock:
+            while len(self.levels) <= index:
+                prev = self.levels[-1]
+                height, width = prev.shape[:2]
+                self.levels.append(cv2.resize(prev, (max(1, width // 2), max(1, height // 2)),
+                                              interpolation=cv2.INTER_AREA))
+            return self.levels[index]
+
+    def levelFor(self, scale):
+        """coarsest level that still has at least one pixel per screen pixel"""
+        if scale >= 1:
+            return 0
+        index = int(math.floor(math.log2(1.0 / scale)))
+        return min(index, self.maxLevel())
+
+    def tile(self, index, col, row):
+        key = (index, col, row)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+        img = self.level(index)
+        t = self.tileSize
+        part = img[row * t:(row + 1) * t, col * t:(col + 1) * t]
+        part = cv2.cvtColor(part, cv2.COLOR_BGR2RGB)
+        height, width = part.shape[:2]
+        pixmap = QPixmap.fromImage(QImage(part.data, width, height, width * 3, QImage.Format_RGB888))
+        self.tiles[key] = pixmap
+        while len(self.tiles) > self.maxTiles:
+            self.tiles.popitem(last=False)
+        return pixmap
+
+    def draw(self, painter, rect, scale):
+        """
+        paint the part of the image in rect (full resolution coordinates) on
+        a painter that maps full resolution coordinates to the screen
+        """
+        index = self.levelFor(scale)
+        factor = 2 ** index
+        img = self.level(index)
+        height, width = img.shape[:2]
+        t = self.tileSize
+        col0 = max(0, int(rect.left() / factor) // t)
+        row0 = max(0, int(rect.top() / factor) // t)
+        col1 = min((width - 1) // t, int(rect.right() / factor) // t)
+        row1 = min((height - 1) // t, int(rect.bottom() / factor) // t)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                pixmap = self.tile(index, col, row)
+                target = QRectF(col * t * factor, row * t * factor,
+                                pixmap.width() * factor, pixmap.height() * factor)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
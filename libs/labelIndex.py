@@ -0,0 +1,155 @@
+import os
+import re
+import ast
+import json
+from collections.abc import Mapping, MutableMapping
+
+try:
+    import orjson
+
+    def loads(text):
+        return orjson.loads(text)
+except ImportError:
+    loads = json.loads
+
+KEY_CLS_PATTERN = re.compile(rb'"key_cls": "((?:[^"\\]|\\.)*)"')
+
+
+def parseLabel(raw):
+    """
+    one label of a Label.txt line, old files written with python literals
+    are read with ast.literal_eval, never eval
+    """
+    raw = raw.strip()
+    if not raw:
+        return []
+    try:
+        return loads(raw)
+    except ValueError:
+        raw = raw.replace('false', 'False').replace('true', 'True')
+        return ast.literal_eval(raw)
+
+
+def lineKeyClasses(line, keyClasses):
+    for match in KEY_CLS_PATTERN.findall(line):
+        keyClasses.add(json.loads(b'"' + match + b'"'))
+    if line.count(b'"points"') > line.count(b'"key_cls"'):
+        # boxes without a key get "None" on load
+        keyClasses.add('None')
+
+
+def fileStamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class LabelReader(object):
+    """
+    where LazyLabels reads labels it has not parsed yet
+    """
+    keyClasses = frozenset()
+
+    def read(self, key):
+        """
+        label json string of key
+        """
+        raise NotImplementedError
+
+
+def writeLabelLines(path, items):
+    """
+    write (key, label json string) pairs as a label file through a temporary
+    file and an atomic replace
+    """
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        for key, label in items:
+            f.write((key + '\t' + label + '\n').encode('utf-8'))
+    os.replace(tmpPath, path)
+
+
+class LazyLabels(MutableMapping):
+    """
+    dict of image key -> label list over a LabelReader, e.g. a table of
+    project.db. A label is only read and parsed when it is first accessed.
+    Keys set or deleted since the last popDirty() are tracked.
+    """
+
+    def __init__(self, kieMode=False, reader=None, keys=()):
+        self.kieMode = kieMode
+        self.dirty = set()
+        self.entries = dict.fromkeys(keys, reader)
+
+    @classmethod
+    def merge(cls, base, top):
+        """
+        labels of both, top wins, like dict(base, **top)
+        """
+        merged = cls(kieMode=top.kieMode)
+        merged.entries = dict(base.entries)
+        merged.entries.update(top.entries)
+        return merged
+
+    def popDirty(self, keys=None):
+        """
+        keys set or deleted since they were last popped, only those among
+        keys if it is given; the others stay dirty
+        """
+        if keys is None:
+            dirty, self.dirty = self.dirty, set()
+        else:
+            dirty = self.dirty & set(keys)
+            self.dirty -= dirty
+        return dirty
+
+    def _parse(self, key, source):
+        label = parseLabel(source.read(key))
+        if self.kieMode:
+            for box in label:
+                box.setdefault('key_cls', 'None')
+        return label
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        if isinstance(value, LabelReader):
+            value = self._parse(key, value)
+            self.entries[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        del self.entries[key]
+        self.dirty.add(key)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __eq__(self, other):
+        # `{} in [...]` checks must not parse the whole file
+        if isinstance(other, Mapping) and len(self) != len(other):
+            return False
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def keyClasses(self):
+        keyClasses = set()
+        sources = set()
+        for value in self.entries.values():
+            if isinstance(value, LabelReader):
+                sources.add(value)
+            else:
+                for box in value:
+                    keyClasses.add(box.get('key_cls', 'None'))
+        for source in sources:
+            keyClasses.update(source.keyClasses)
+        return keyClasses
@@ -0,0 +1,106 @@
+import os
+import json
+import threading
+
+
+def readLabelLines(path, labels=None):
+    """
+    Label.txt style lines into {key: label json string}, later lines win and
+    an empty list removes the key
+    """
+    if labels is None:
+        labels = {}
+    if not os.path.exists(path):
+        return labels
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if '\t' not in line:
+                continue
+            key, label = line.split('\t', 1)
+            if label.strip() == '[]':
+                labels.pop(key, None)
+            else:
+                labels[key] = label
+    return labels
+
+
+# journal lines after which Label.txt is rewritten in the background
+COMPACT_RECORDS = 1000
+
+
+class LabelJournal(object):
+    """
+    Append-only journal in front of Label.txt (or fileState.txt) whose
+    records are already in an authoritative store, see libs/projectStore.py.
+
+    Every confirmed image appends one line to Label.txt.journal, so the text
+    file read with its journal is always complete. After compactRecords
+    lines compact() renames the journal to Label.txt.compacting, so new
+    confirmations go to a fresh journal, and rewrites Label.txt with write()
+    on a background thread; compactRecords=None only compacts when asked.
+    export() does the same on the calling thread.
+    """
+
+    def __init__(self, labelPath, write, compactRecords=COMPACT_RECORDS):
+        self.labelPath = labelPath
+        self.journalPath = labelPath + '.journal'
+        self.compactingPath = labelPath + '.compacting'
+        self.write = write
+        self.compactRecords = compactRecords
+        self.lock = threading.Lock()
+        self.thread = None
+        self.records = 0
+
+    def append(self, key, label):
+        line = key + '\t' + json.dumps(label, ensure_ascii=False) + '\n'
+        with self.lock:
+            with open(self.journalPath, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.records += 1
+            compact = self.compactRecords is not None and self.records >= self.compactRecords
+        if compact:
+            self.compact()
+
+    def compact(self, wait=False):
+        """
+        rewrite Label.txt in the background, wait blocks until it is done
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                # a leftover .compacting from an interrupted rewrite goes first
+                if os.path.exists(self.journalPath) and \
+                        not os.path.exists(self.compactingPath):
+                    os.replace(self.journalPath, self.compactingPath)
+                    self.records = 0
+                if os.path.exists(self.compactingPath):
+                    self.thread = threading.Thread(target=self._compact)
+                    self.thread.start()
+        if wait:
+            self.wait()
+
+    def _compact(self):
+        try:
+            self.write()
+            os.remove(self.compactingPath)
+        except OSError as e:
+            # the .compacting file stays and is retried by the next compact()
+            print('Can not compact', self.labelPath, e)
+
+    def wait(self):
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def export(self):
+        """
+        rewrite the text file now; appends wait meanwhile and the journal is
+        dropped afterwards
+        """
+        with self.lock:
+            self.wait()
+            self.write()
+            for path in [self.journalPath, self.compactingPath]:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.records = 0
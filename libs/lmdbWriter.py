@@ -0,0 +1,72 @@
+import os
+
+import cv2
+import lmdb
+
+# encodings cv2.imdecode in ppocr/data/lmdb_dataset.py can read back,
+# bmp stores the pixels uncompressed
+ENCODINGS = {
+    'jpg': ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 95]),
+    'png': ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+    'raw': ('.bmp', []),
+}
+
+
+def encodeImage(img, encoding='jpg'):
+    ext, params = ENCODINGS[encoding]
+    ok, data = cv2.imencode(ext, img, params)
+    if not ok:
+        raise IOError('Can not encode image as ' + encoding)
+    return data.tobytes()
+
+
+class LmdbWriter(object):
+    """
+    Recognition samples in the layout LMDBDataSet reads: image-%09d,
+    label-%09d (indices from 1) and num-samples. Samples are buffered and
+    written commitNum at a time in one transaction; when the map is full it
+    is doubled and the transaction retried.
+
+    count continues an existing dataset after its first count samples,
+    otherwise the dataset is replaced.
+    """
+
+    def __init__(self, dirpath, commitNum=1000, mapSize=1 << 30, count=None):
+        os.makedirs(dirpath, exist_ok=True)
+        if count is None:
+            for name in ('data.mdb', 'lock.mdb'):
+                path = os.path.join(dirpath, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        self.dirpath = dirpath
+        self.commitNum = commitNum
+        self.env = lmdb.open(dirpath, map_size=mapSize, subdir=True, lock=True)
+        self.buffer = []
+        self.count = count or 0
+
+    def put(self, imageBytes, label):
+        self.count += 1
+        self.buffer.append((b'image-%09d' % self.count, imageBytes))
+        self.buffer.append((b'label-%09d' % self.count, label.encode('utf-8')))
+        if len(self.buffer) >= 2 * self.commitNum:
+            self.flush()
+
+    def _write(self, items):
+        while True:
+            try:
+                with self.env.begin(write=True) as txn:
+                    for key, value in items:
+                        txn.put(key, value)
+                return
+            except lmdb.MapFullError:
+                self.env.set_mapsize(self.env.info()['map_size'] * 2)
+
+    def flush(self):
+        if self.buffer:
+            self._write(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self._write([(b'num-samples', str(self.count).encode())])
+        self.env.close()
@@ -0,0 +1,299 @@
+import os
+import json
+import sqlite3
+import threading
+from functools import partial
+
+from libs.labelIndex import LabelReader, LazyLabels, fileStamp, lineKeyClasses, \
+    writeLabelLines
+from libs.imageInfo import imageSize
+from libs.labelJournal import LabelJournal, readLabelLines, COMPACT_RECORDS
+
+# table -> text file kept next to it for the export functions and scripts
+PROJECT_FILES = {
+    'labels': 'Label.txt',
+    'cache': 'Cache.cach',
+    'file_state': 'fileState.txt'
+}
+
+
+class StoreReader(LabelReader):
+    def __init__(self, store, table):
+        self.store = store
+        self.table = table
+
+    def read(self, key):
+        label = self.store.getLabel(self.table, key)
+        if label is None:
+            raise KeyError(key)
+        return label
+
+    @property
+    def keyClasses(self):
+        return self.store.keyClasses(self.table)
+
+
+class ProjectStore(object):
+    """
+    Labels, auto recognition cache and checked state of one image directory
+    in a single SQLite database (project.db), indexed on the image key and
+    updated one image at a time. It runs in WAL mode so export scripts can
+    read while annotators work.
+
+    Label.txt, Cache.cach and fileState.txt are still written for other
+    tools with exportFile(), on an explicit save and on close. In between
+    confirm() appends to the journals of Label.txt and fileState.txt
+    (libs/labelJournal.py), so a save costs one line per file instead of a
+    rewrite, and every compactRecords confirmations the journals rewrite
+    their file from the database on a background thread. A text file that
+    changed since its last export, e.g. by tools/auto_label.py or an older
+    version, is imported again when the project is opened, with its journal
+    on top.
+    """
+
+    def __init__(self, dirpath, compactRecords=COMPACT_RECORDS):
+        self.dirpath = dirpath
+        self.path = os.path.join(dirpath, 'project.db')
+        self.lock = threading.RLock()
+        self.exportLock = threading.Lock()
+        self.journals = dict((table, LabelJournal(self.filePath(table), partial(self._writeFile, table),
+                                                  compactRecords))
+                             for table in ['labels', 'file_state'])
+        self.conn = sqlite3.connect(self.path, timeout=30,
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            for table in ['labels', 'cache']:
+                self.conn.execute('CREATE TABLE IF NOT EXISTS {} ('
+                                  'key TEXT PRIMARY KEY, label TEXT NOT NULL)'
+                                  .format(table))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS file_state ('
+                              'path TEXT PRIMARY KEY, state INTEGER NOT NULL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS key_classes ('
+                              'tbl TEXT NOT NULL, name TEXT NOT NULL, '
+                              'PRIMARY KEY (tbl, name))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                              'name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS image_size ('
+                              'path TEXT PRIMARY KEY, stamp TEXT NOT NULL, '
+                              'width INTEGER NOT NULL, height INTEGER NOT NULL)')
+        self.syncFiles()
+
+    def filePath(self, table):
+        return os.path.join(self.dirpath, PROJECT_FILES[table])
+
+    def _getMeta(self, name):
+        row = self.conn.execute('SELECT value FROM meta WHERE name=?',
+                                (name, )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _setMeta(self, name, value):
+        self.conn.execute(
+            'INSERT INTO meta (name, value) VALUES (?, ?) ON CONFLICT(name) '
+            'DO UPDATE SET value=excluded.value', (name, json.dumps(value)))
+
+    def syncFiles(self):
+        for table in PROJECT_FILES:
+            path = self.filePath(table)
+            if not os.path.exists(path):
+                continue
+            with self.lock:
+                stamp = self._getMeta(table + '_stamp')
+            if stamp != fileStamp(path):
+                self.importFile(table)
+
+    def importFile(self, table):
+        """
+        replace a table by the content of its text file
+        """
+        path = self.filePath(table)
+        rows, keyClasses = {}, set()
+        with open(path, 'rb') as f:
+            for line in f:
+                line = line.rstrip(b'\r\n')
+                if b'\t' not in line:
+                    continue
+                key, value = line.split(b'\t', 1)
+                key = key.decode('utf-8')
+                if table == 'file_state':
+                    rows[key] = 1
+                    continue
+                lineKeyClasses(value, keyClasses)
+                value = value.decode('utf-8').strip()
+                if value == '[]':
+                    rows.pop(key, None)
+                else:
+                    rows[key] = value
+        journal = self.journals.get(table)
+        if journal is not None:
+            # confirmations newer than the file
+            for journalPath in [journal.compactingPath, journal.journalPath]:
+                readLabelLines(journalPath, rows)
+        column = 'path, state' if table == 'file_state' else 'key, label'
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM {}'.format(table))
+            self.conn.executemany(
+                'INSERT INTO {} ({}) VALUES (?, ?)'.format(table, column),
+                rows.items())
+            if table != 'file_state':
+                self.conn.execute('DELETE FROM key_classes WHERE tbl=?',
+                                  (table, ))
+                self._addKeyClasses(table, keyClasses)
+            self._setMeta(table + '_stamp', fileStamp(path))
+
+    def _addKeyClasses(self, table, keyClasses):
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO key_classes (tbl, name) VALUES (?, ?)',
+            [(table, name) for name in keyClasses])
+
+    def keys(self, table):
+        with self.lock:
+            return [
+                row[0]
+                for row in self.conn.execute(
+                    'SELECT key FROM {} ORDER BY rowid'.format(table))
+            ]
+
+    def getLabel(self, table, key):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT label FROM {} WHERE key=?'.format(table),
+                (key, )).fetchone()
+        return row[0] if row else None
+
+    def keyClasses(self, table):
+        with self.lock:
+            return set(row[0] for row in self.conn.execute(
+                'SELECT name FROM key_classes WHERE tbl=?', (table, )))
+
+    def lazyLabels(self, table, kieMode=False):
+        """
+        LazyLabels over a table, labels are fetched on first access
+        """
+        return LazyLabels(
+            kieMode=kieMode,
+            reader=StoreReader(self, table),
+            keys=self.keys(table))
+
+    def _putLabels(self, table, items):
+        keyClasses = set()
+        for key, label in items:
+            if not label:
+                self.conn.execute(
+                    'DELETE FROM {} WHERE key=?'.format(table), (key, ))
+                continue
+            for box in label:
+                keyClasses.add(box.get('key_cls', 'None'))
+            self.conn.execute(
+                'INSERT INTO {} (key, label) VALUES (?, ?) ON CONFLICT(key) '
+                'DO UPDATE SET label=excluded.label'.format(table),
+                (key, json.dumps(label, ensure_ascii=False)))
+        self._addKeyClasses(table, keyClasses)
+
+    def putLabels(self, table, items):
+        """
+        upsert (key, label list) pairs, None or an empty list deletes
+        """
+        with self.lock, self.conn:
+            self._putLabels(table, items)
+
+    def confirm(self, imagePath, key, label):
+        """
+        store the label of a checked image and its state in one transaction
+        """
+        with self.lock, self.conn:
+            self._putLabels('labels', [(key, label)])
+            self.conn.execute(
+                'INSERT INTO file_state (path, state) VALUES (?, 1) '
+                'ON CONFLICT(path) DO UPDATE SET state=1', (imagePath, ))
+        self.journals['labels'].append(key, label or [])
+        self.journals['file_state'].append(imagePath, 1)
+
+    def checkedPaths(self):
+        with self.lock:
+            return set(row[0] for row in self.conn.execute(
+                'SELECT path FROM file_state WHERE state=1'))
+
+    def uncheckedImages(self, imagePaths):
+        checked = self.checkedPaths()
+        return [path for path in imagePaths if path not in checked]
+
+    def imageSizes(self, imagePaths):
+        """
+        {path: (width, height)} of the images, read from the file headers
+        and kept per path and mtime, so only new or changed images are
+        opened. Images that can not be read are left out.
+        """
+        with self.lock:
+            known = dict((row[0], (row[1], (row[2], row[3]))) for row in self.conn.execute(
+                'SELECT path, stamp, width, height FROM image_size'))
+        sizes, probed = {}, []
+        for path in imagePaths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamp = '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+            if path in known and known[path][0] == stamp:
+                sizes[path] = known[path][1]
+                continue
+            size = imageSize(path)
+            if size is None:
+                continue
+            sizes[path] = size
+            probed.append((path, stamp, size[0], size[1]))
+        if probed:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO image_size (path, stamp, width, height) '
+                    'VALUES (?, ?, ?, ?)', probed)
+        return sizes
+
+    def exportFile(self, table):
+        """
+        write the text file of a table and remember its stamp, so it is not
+        imported back on the next open
+        """
+        with self.exportLock:
+            journal = self.journals.get(table)
+            if journal is not None:
+                # the journal is complete in the file once it is written
+                journal.export()
+            else:
+                self._writeFile(table)
+
+    def _writeFile(self, table):
+        with self.lock:
+            if table == 'file_state':
+                rows = self.conn.execute(
+                    'SELECT path, state FROM file_state ORDER BY rowid'
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    'SELECT key, label FROM {} ORDER BY rowid'.format(
+                        table)).fetchall()
+        path = self.filePath(table)
+        if table == 'file_state':
+            tmpPath = path + '.tmp'
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                for imagePath, state in rows:
+                    f.write(imagePath + '\t' + str(state) + '\n')
+            os.replace(tmpPath, path)
+        else:
+            writeLabelLines(path, rows)
+        with self.lock, self.conn:
+            self._setMeta(table + '_stamp', fileStamp(path))
+
+    def setCompactRecords(self, compactRecords):
+        """confirmations after which the text files are rewritten in the background"""
+        for journal in self.journals.values():
+            journal.compactRecords = compactRecords
+
+    def close(self):
+        for table, journal in self.journals.items():
+            journal.wait()
+            if os.path.exists(journal.journalPath) or os.path.exists(journal.compactingPath):
+                self.exportFile(table)
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,227 @@
+import os
+import json
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from libs.augment import Contrast, Brightness, GaussianNoise, GlassBlur, Sharpness, Color, \
+    Snow, Fog, Shadow, Rain, Distortion_Sin
+from libs.lmdbWriter import LmdbWriter, encodeImage
+
+# op name -> factory(rng) of a PIL image transform; the name is also the file
+# name suffix of its outputs
+OPS = {
+    'contrast': lambda rng: Contrast(rng),
+    'bright': lambda rng: Brightness(rng),
+    'gnoise': lambda rng: GaussianNoise(rng),
+    'glsblur': lambda rng: GlassBlur(rng),
+    'sharp': lambda rng: Sharpness(rng),
+    'color': lambda rng: Color(rng),
+    'snow': lambda rng: Snow(rng),
+    'fog': lambda rng: Fog(rng),
+    'shadow': lambda rng: Shadow(rng),
+    'rain': lambda rng: Rain(rng),
+    'distort': lambda rng: (lambda img: Distortion_Sin(img, vertical=False, horizontal=False)),
+}
+
+# (op name, outputs per crop) in the order of the former rec_image_augment
+DEFAULT_RECIPE = [(name, 1) for name in ['contrast', 'bright', 'gnoise', 'glsblur', 'sharp', 'color',
+                                         'snow', 'fog', 'shadow', 'rain', 'distort']]
+
+JOURNAL_NAME = 'augment_journal.jsonl'
+
+
+def sampleRng(seed, imgName, opName, copy):
+    """
+    generator of one output, derived from the master seed and the names only,
+    so the result does not depend on the worker, the order or a resume
+    """
+    key = (zlib.crc32(imgName.encode('utf-8')), zlib.crc32(opName.encode('utf-8')), copy)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+
+def outputName(imgName, opName, copy):
+    base, ext = os.path.splitext(os.path.basename(imgName))
+    return base + '_' + opName + (str(copy + 1) if copy else '') + ext
+
+
+def augmentCrop(job):
+    """
+    process pool task: all recipe outputs of one crop. Files are saved in
+    the worker, for LMDB the encoded images are returned.
+    return:
+        (image name, [(output name, bytes or None)], error or None)
+    """
+    imgPath, imgName, recipe, seed, targetDir, encoding = job
+    try:
+        img = Image.open(imgPath)
+        img.load()
+        outputs = []
+        for opName, count in recipe:
+            for copy in range(count):
+                name = outputName(imgName, opName, copy)
+                img_aug = OPS[opName](sampleRng(seed, imgName, opName, copy))(img)
+                if targetDir is not None:
+                    if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg') and img_aug.mode != 'RGB':
+                        img_aug = img_aug.convert('RGB')
+                    img_aug.save(os.path.join(targetDir, name))
+                    outputs.append((name, None))
+                else:
+                    # same encodings as the export's LMDB, 'raw' is lossless
+                    pixels = cv2.cvtColor(np.asarray(img_aug.convert('RGB')), cv2.COLOR_RGB2BGR)
+                    outputs.append((name, encodeImage(pixels, encoding)))
+        return imgName, outputs, None
+    except Exception as e:
+        return imgName, [], str(e)
+
+
+class RecAugmentGenerator(object):
+    """
+    Augmented recognition samples from crop label lines ("name\\tlabel"),
+    made in a process pool. Every output has its own generator derived from
+    seed and the crop and op names, so a run is reproducible whatever the
+    number of workers. Outputs go to files next to the crops plus
+    rec_label.txt, or to an LMDB dataset (lmdbDir).
+
+    augment_journal.jsonl in targetDir records each finished crop; a run
+    with the same settings skips those and appends to the LMDB, so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, imgDir, targetDir, recipe=None, seed=0, lmdbDir=None, encoding='jpg',
+                 workers=None):
+        self.imgDir = imgDir
+        self.targetDir = targetDir
+        self.recipe = [list(op) for op in (recipe or DEFAULT_RECIPE)]
+        self.seed = seed
+        self.lmdbDir = lmdbDir
+        self.encoding = encoding
+        self.workers = workers or os.cpu_count() or 1
+        self.journalPath = os.path.join(targetDir, JOURNAL_NAME)
+        self.output = lmdbDir if lmdbDir is not None else os.path.join(targetDir, 'rec_label.txt')
+        self.cancelled = False
+        for opName, count in self.recipe:
+            if opName not in OPS:
+                raise ValueError('Unknown augmentation: ' + opName)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def settings(self):
+        return {'recipe': self.recipe, 'seed': self.seed, 'lmdb': self.lmdbDir,
+                'encoding': self.encoding}
+
+    def loadJournal(self):
+        """finished crops {name: [(name, label)]} of a run with the same settings"""
+        done = {}
+        try:
+            with open(self.journalPath, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return done
+        if not lines or json.loads(lines[0]) != self.settings():
+            return done
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # torn last line
+                break
+            done[entry['src']] = [tuple(record) for record in entry['records']]
+        return done
+
+    def run(self, items, progress=None):
+        """
+        items: crop label lines "name\\tlabel", names relative to imgDir
+        progress: called with (done, total)
+        return:
+            [names of crops that failed]
+        """
+        os.makedirs(self.targetDir, exist_ok=True)
+        samples, names = [], set()
+        for line in items:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 2:
+                continue
+            imgPath = os.path.join(self.imgDir, parts[0].strip())
+            if not os.path.isfile(imgPath):
+                print('No file: {}'.format(imgPath))
+                continue
+            if os.path.basename(imgPath) in names:
+                continue
+            names.add(os.path.basename(imgPath))
+            samples.append((imgPath, os.path.basename(parts[0].strip()), parts[1].strip()))
+
+        done = self.loadJournal()
+        journal = open(self.journalPath, 'a' if done else 'w', encoding='utf-8')
+        if not done:
+            journal.write(json.dumps(self.settings()) + '\n')
+            journal.flush()
+        writer = None
+        if self.lmdbDir is not None:
+            # samples of journaled crops are committed, later ones are rewritten
+            writer = LmdbWriter(self.lmdbDir, count=sum(len(r) for r in done.values()) if done else None)
+
+        todo = [sample for sample in samples if sample[1] not in done]
+        total, finished = len(samples), len(samples) - len(todo)
+        failed, pending = [], []
+        if progress is not None:
+            progress(finished, total)
+        targetDir = self.targetDir if writer is None else None
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                window = deque()
+                queue = iter(todo)
+                while not self.cancelled:
+                    while len(window) < 4 * self.workers:
+                        sample = next(queue, None)
+                        if sample is None:
+                            break
+                        job = (sample[0], sample[1], self.recipe, self.seed, targetDir, self.encoding)
+                        window.append((sample, executor.submit(augmentCrop, job)))
+                    if not window:
+                        break
+                    (imgPath, imgName, label), future = window.popleft()
+                    _, outputs, error = future.result()
+                    if error is not None:
+                        print('Can not augment', imgPath, error)
+                        failed.append(imgName)
+                    else:
+                        records = [(imgName, label)] + [(name, label) for name, _ in outputs]
+                        if writer is not None:
+                            with open(imgPath, 'rb') as f:
+                                writer.put(f.read(), label)
+                            for name, data in outputs:
+                                writer.put(data, label)
+                        pending.append({'src': imgName, 'records': records})
+                        done[imgName] = records
+                        if writer is None or not writer.buffer:
+                            # only what is committed is journaled
+                            self._journal(journal, pending)
+                    finished += 1
+                    if progress is not None:
+                        progress(finished, total)
+                for _, future in window:
+                    future.cancel()
+        finally:
+            if writer is not None:
+                writer.close()
+            self._journal(journal, pending)
+            journal.close()
+
+        if writer is None and not self.cancelled:
+            with open(self.output, 'w', encoding='utf-8') as f:
+                for imgPath, imgName, label in samples:
+                    for name, lbl in done.get(imgName, []):
+                        f.write(name + '\t' + lbl + '\n')
+        return failed
+
+    def _journal(self, journal, pending):
+        for entry in pending:
+            journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        journal.flush()
+        del pending[:]
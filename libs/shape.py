@@ -218,8 +218,8 @@ class Shape(object):
 
     def copy(self):
         shape = Shape("%s" % self.label)
-        shape.points = [p for p in self.points]
-        shape.center = self.center
+        shape.points = [QPointF(p) for p in self.points]
+        shape.center = QPointF(self.center) if self.center is not None else None
         shape.direction = self.direction
         shape.fill = self.fill
         shape.selected = self.selected
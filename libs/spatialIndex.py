@@ -0,0 +1,108 @@
+import math
+
+
+class ShapeGrid(object):
+    """
+    Uniform grid over the bounding rects of the canvas shapes, grown by a
+    margin so that vertex picking within epsilon finds the shape too.
+    query() only tests the shapes registered in the cell under the point, so
+    hovering costs the same with 10 or 5000 boxes on a page.
+
+    The owner passes a version it bumps whenever shapes are added or
+    removed; the grid is stale when the version it was built for differs.
+    """
+
+    def __init__(self, margin=5.0, cellSize=64):
+        self.margin = margin
+        self.cellSize = cellSize
+        self.cells = {}  # (col, row) -> set of shapes
+        self.shapeCells = {}  # shape -> cells it is registered in
+        self.order = {}  # shape -> z order, later shapes are on top
+        self.shapes = None
+        self.version = None
+        self.nextZ = 0
+
+    def rebuild(self, shapes, version):
+        self.cells.clear()
+        self.shapeCells.clear()
+        self.order.clear()
+        self.shapes = shapes
+        self.version = version
+        self.nextZ = len(shapes)
+        sizes = []
+        for shape in shapes:
+            rect = self.rect(shape)
+            if rect is not None:
+                sizes.append(max(rect[2] - rect[0], rect[3] - rect[1]))
+        if sizes:
+            # about one cell per box keeps both cell lists and the number of
+            # cells per box small
+            sizes.sort()
+            self.cellSize = max(16.0, sizes[len(sizes) // 2])
+        for z, shape in enumerate(shapes):
+            self.order[shape] = z
+            self._insert(shape)
+
+    def isStale(self, shapes, version):
+        return shapes is not self.shapes or version != self.version
+
+    def rect(self, shape):
+        if not shape.points:
+            return None
+        xs = [p.x() for p in shape.points]
+        ys = [p.y() for p in shape.points]
+        m = self.margin
+        return min(xs) - m, min(ys) - m, max(xs) + m, max(ys) + m
+
+    def _cellRange(self, rect):
+        s = self.cellSize
+        return (int(math.floor(rect[0] / s)), int(math.floor(rect[1] / s)),
+                int(math.floor(rect[2] / s)), int(math.floor(rect[3] / s)))
+
+    def _insert(self, shape):
+        rect = self.rect(shape)
+        keys = []
+        if rect is not None:
+            c0, r0, c1, r1 = self._cellRange(rect)
+            for col in range(c0, c1 + 1):
+                for row in range(r0, r1 + 1):
+                    key = (col, row)
+                    self.cells.setdefault(key, set()).add(shape)
+                    keys.append(key)
+        self.shapeCells[shape] = keys
+
+    def _remove(self, shape):
+        for key in self.shapeCells.pop(shape, []):
+            cell = self.cells.get(key)
+            if cell is not None:
+                cell.discard(shape)
+                if not cell:
+                    del self.cells[key]
+
+    def add(self, shape, version):
+        """
+        register a shape appended on top of the others, the only change
+        between the version the grid was built for and version
+        """
+        self.order[shape] = self.nextZ
+        self.nextZ += 1
+        self.version = version
+        self._insert(shape)
+
+    def update(self, shape):
+        """
+        re-register a shape after its points moved
+        """
+        if shape in self.order:
+            self._remove(shape)
+            self._insert(shape)
+
+    def query(self, point):
+        """
+        shapes whose grown bounding rect may contain point, topmost first
+        """
+        s = self.cellSize
+        cell = self.cells.get((int(math.floor(point.x() / s)), int(math.floor(point.y() / s))))
+        if not cell:
+            return []
+        return sorted(cell, key=self.order.get, reverse=True)
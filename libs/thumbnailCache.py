@@ -0,0 +1,171 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from libs.imageInfo import probeSize
+
+# decode flags by downscale factor, JPEG uses DCT scaling for these
+REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
+
+def reducedFlag(path, size):
+    """
+    largest reduced decode that still leaves size pixels on each side, the
+    image size comes from the file header
+    """
+    header = probeSize(path)
+    if header is None:
+        return cv2.IMREAD_COLOR
+    for factor, flag in REDUCED_FLAGS:
+        if header[0] >= size * factor and header[1] >= size * factor:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+class ThumbnailCache(QObject):
+    """
+    Icon strip thumbnails. request() answers from memory, otherwise a worker
+    thread loads the thumbnail from the disk cache or makes it with a reduced
+    decode, stores it and emits thumbnailReady(path, QImage). Disk entries are
+    named after the path, size and mtime of the image, so a changed image
+    gets a new thumbnail.
+
+    The disk cache is kept under maxDiskBytes: when it grows past the limit,
+    the least recently used entries (by file mtime, touched on every disk
+    hit) are removed until it is down to 3/4 of the limit.
+    """
+    thumbnailReady = pyqtSignal(str, QImage)
+
+    def __init__(self, cacheDir=None, size=100, memoryNum=512, workers=2, maxDiskBytes=256 << 20,
+                 parent=None):
+        super(ThumbnailCache, self).__init__(parent)
+        if cacheDir is None:
+            cacheDir = os.path.join(os.path.expanduser('~'), '.autoOCRThumbnails')
+        self.cacheDir = cacheDir
+        self.size = size
+        self.memoryNum = memoryNum
+        self.maxDiskBytes = maxDiskBytes
+        self.diskBytes = None  # size of the disk cache, None until prune() measured it
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # (path, stamp) -> QImage
+        self.pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.executor.submit(self.prune)
+
+    def prune(self):
+        """
+        measure the disk cache and, if it is over maxDiskBytes, remove the
+        least recently used entries down to 3/4 of it
+        """
+        entries = []
+        for root, dirs, files in os.walk(self.cacheDir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.maxDiskBytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.maxDiskBytes * 3 // 4:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+        with self.lock:
+            self.diskBytes = total
+
+    def _key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def diskPath(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir, name[:2], name + '.jpg')
+
+    def request(self, path):
+        """
+        return the thumbnail if it is in memory, otherwise queue it and
+        return None
+        """
+        key = self._key(path)
+        if key is None:
+            return None
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+                return image
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        self.executor.submit(self._load, key)
+        return None
+
+    def _load(self, key):
+        try:
+            image = self._thumbnail(key)
+        except (OSError, cv2.error) as e:
+            print('Can not make the thumbnail of', key[0], e)
+            image = None
+        with self.lock:
+            self.pending.discard(key)
+            if image is None:
+                return
+            self.memory[key] = image
+            while len(self.memory) > self.memoryNum:
+                self.memory.popitem(last=False)
+        self.thumbnailReady.emit(key[0], image)
+
+    def _thumbnail(self, key):
+        path = key[0]
+        diskPath = self.diskPath(key)
+        thumb = None
+        if os.path.exists(diskPath):
+            thumb = cv2.imdecode(np.fromfile(diskPath, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if thumb is not None:
+                # recently used entries survive prune()
+                os.utime(diskPath)
+        if thumb is None:
+            img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), reducedFlag(path, self.size))
+            if img is None:
+                return None
+            thumb = cv2.resize(img, (self.size, self.size), interpolation=cv2.INTER_AREA)
+            os.makedirs(os.path.dirname(diskPath), exist_ok=True)
+            ok, data = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if ok:
+                tmpPath = diskPath + '.tmp%d' % threading.get_ident()
+                data.tofile(tmpPath)
+                os.replace(tmpPath, diskPath)
+                full = False
+                with self.lock:
+                    if self.diskBytes is not None:
+                        self.diskBytes += data.size
+                        full = self.diskBytes > self.maxDiskBytes
+                        if full:
+                            # measured again by prune()
+                            self.diskBytes = None
+                if full:
+                    self.prune()
+        thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB)
+        height, width = thumb.shape[:2]
+        return QImage(thumb.data, width, height, width * 3, QImage.Format_RGB888).copy()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
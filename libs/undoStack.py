@@ -0,0 +1,155 @@
+from PyQt5.QtCore import QPointF
+
+
+class UndoCommand(object):
+    """
+    One canvas edit, stored as the state it changed and nothing else.
+    Commands with the same mergeKey pushed one after another become one
+    undo step, e.g. a series of arrow key nudges.
+    """
+    mergeKey = None
+
+    def undo(self, canvas):
+        raise NotImplementedError
+
+    def redo(self, canvas):
+        raise NotImplementedError
+
+    def mergeWith(self, other):
+        return False
+
+
+def copyPoint(point):
+    # QPointF += changes the point in place, states must not share them
+    return QPointF(point) if point is not None else None
+
+
+def geometryState(shape):
+    return [QPointF(p) for p in shape.points], copyPoint(shape.center), shape.direction
+
+
+def setGeometryState(shape, state):
+    points, center, direction = state
+    shape.points = [QPointF(p) for p in points]
+    shape.center = copyPoint(center)
+    shape.direction = direction
+
+
+class MoveShapesCommand(UndoCommand):
+    """moved vertices, moved or rotated shapes"""
+
+    def __init__(self, shapes, before, after, mergeKey=None):
+        self.shapes = shapes
+        self.before = before
+        self.after = after
+        if mergeKey is not None:
+            self.mergeKey = (mergeKey, tuple(id(shape) for shape in shapes))
+
+    def undo(self, canvas):
+        for shape, state in zip(self.shapes, self.before):
+            setGeometryState(shape, state)
+        canvas.updateIndex(self.shapes)
+
+    def redo(self, canvas):
+        for shape, state in zip(self.shapes, self.after):
+            setGeometryState(shape, state)
+        canvas.updateIndex(self.shapes)
+
+    def mergeWith(self, other):
+        self.after = other.after
+        return True
+
+
+class AddShapesCommand(UndoCommand):
+    """shapes inserted at the given indices of canvas.shapes"""
+
+    def __init__(self, shapes, indices):
+        self.shapes = shapes
+        self.indices = indices
+
+    def undo(self, canvas):
+        removed = set(map(id, self.shapes))
+        canvas.shapes[:] = [s for s in canvas.shapes if id(s) not in removed]
+        canvas.selectedShapes = [s for s in canvas.selectedShapes if id(s) not in removed]
+        if canvas.hShape is not None and id(canvas.hShape) in removed:
+            canvas.hShape = canvas.hVertex = None
+        canvas.invalidateIndex()
+
+    def redo(self, canvas):
+        for index, shape in sorted(zip(self.indices, self.shapes), key=lambda x: x[0]):
+            canvas.shapes.insert(index, shape)
+        canvas.invalidateIndex()
+
+
+class RemoveShapesCommand(AddShapesCommand):
+    """shapes deleted from the given indices of canvas.shapes"""
+
+    def undo(self, canvas):
+        AddShapesCommand.redo(self, canvas)
+
+    def redo(self, canvas):
+        AddShapesCommand.undo(self, canvas)
+
+
+class EditLabelsCommand(UndoCommand):
+    """label and key class changes"""
+
+    def __init__(self, shapes, before, after):
+        self.shapes = shapes
+        self.before = before
+        self.after = after
+
+    def undo(self, canvas):
+        for shape, (label, key_cls) in zip(self.shapes, self.before):
+            shape.label, shape.key_cls = label, key_cls
+        canvas.invalidateLayer()
+
+    def redo(self, canvas):
+        for shape, (label, key_cls) in zip(self.shapes, self.after):
+            shape.label, shape.key_cls = label, key_cls
+        canvas.invalidateLayer()
+
+
+class UndoStack(object):
+    """
+    Unbounded undo/redo history of canvas commands. Pushing a new command
+    drops the redo history.
+    """
+
+    def __init__(self):
+        self.done = []
+        self.undone = []
+
+    def push(self, command):
+        self.undone = []
+        last = self.done[-1] if self.done else None
+        if last is not None and command.mergeKey is not None \
+                and last.mergeKey == command.mergeKey and last.mergeWith(command):
+            return
+        self.done.append(command)
+
+    def canUndo(self):
+        return bool(self.done)
+
+    def canRedo(self):
+        return bool(self.undone)
+
+    def undo(self, canvas):
+        if not self.done:
+            return None
+        command = self.done.pop()
+        command.undo(canvas)
+        self.undone.append(command)
+        return command
+
+    def redo(self, canvas):
+        if not self.undone:
+            return None
+        command = self.undone.pop()
+        command.redo(canvas)
+        self.done.append(command)
+        return command
+
+    def clear(self):
+        self.done = []
+        self.undone = []
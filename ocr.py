@@ -9,6 +9,7 @@ import numpy as np
 tools = importlib.import_module('.', 'tools')
 ppocr = importlib.import_module('.', 'ppocr')
 from tools.infer import predict_system
+from tools.infer.ocr_cache import OCRCache, config_fingerprint
 from tools.kie_utility import init_args  
 from tools.infer.utility import draw_ocr, str2bool, check_gpu 
 from ppocr.utils.logging import get_logger 
@@ -25,10 +26,8 @@ SUPPORT_OCR_MODEL_VERSION = ['OCR', 'OCRv2', 'OCRv3']
 SUPPORT_DET_MODEL = ['DB', 'DB++']
 SUPPORT_REC_MODEL = ['CRNN', 'SVTR', 'SVTR_LCNet', 'ABINet'] 
 
-def parse_args(mMain=True):
-    import argparse
+def init_ocr_args():
     parser = init_args()
-    parser.add_help = mMain
     parser.add_argument("--lang", type=str, default='korean')
     parser.add_argument("--det", type=str2bool, default=True)
     parser.add_argument("--rec", type=str2bool, default=True)
@@ -41,7 +40,19 @@ def parse_args(mMain=True):
     parser.add_argument("--structure_version", type=str, 
         default='STRUCTURE',
         help='Structure Model version')
- 
+    # result cache, off unless asked for; kept in the user's home so it does
+    # not depend on the working directory
+    parser.add_argument("--use_ocr_cache", type=str2bool, default=False)
+    parser.add_argument("--ocr_cache_path", type=str,
+        default=os.path.join(os.path.expanduser('~'), '.autoOCRCache', 'ocr_cache.db'))
+    parser.add_argument("--ocr_cache_max_size_mb", type=int, default=1024)
+    return parser
+
+
+def parse_args(mMain=True):
+    import argparse
+    parser = init_ocr_args()
+    parser.add_help = mMain
     if mMain:
         return parser.parse_args()
     else:
@@ -97,6 +108,21 @@ class PaddleOCR(predict_system.TextSystem):
             
         super().__init__(params)
 
+        self.ocr_cache = None
+        if params.use_ocr_cache:
+            self.ocr_cache = OCRCache(params.ocr_cache_path,
+                                      params.ocr_cache_max_size_mb,
+                                      config_fingerprint(params))
+
+    def cache_key(self, data, det=True, rec=True, cls=False):
+        """
+        key of the ocr result for encoded image bytes or an ndarray, None when
+        the cache is disabled
+        """
+        if self.ocr_cache is None:
+            return None
+        return self.ocr_cache.make_key(data, det, rec, cls and self.use_angle_cls)
+
     def ocr(self, img, det=True, rec=True, cls=False):
         """
         ocr model 
@@ -118,6 +144,7 @@ class PaddleOCR(predict_system.TextSystem):
                 'Since the angle classifier is not initialized, the angle classifier will not be uesd during the forward process'
             )
 
+        key = None
         if isinstance(img, str):
             # download net image
             if img.startswith('http'):
@@ -127,16 +154,35 @@ class PaddleOCR(predict_system.TextSystem):
             img, flag, _ = check_and_read(image_file)
             if not flag:
                 with open(image_file, 'rb') as f:
-                    np_arr = np.frombuffer(f.read(), dtype=np.uint8)
-                    img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                    data = f.read()
+                # same file content, same result: skip decoding and inference
+                key = self.cache_key(data, det, rec, cls)
+                if key is not None:
+                    result = self.ocr_cache.get(key)
+                    if result is not None:
+                        return result
+                img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
             if img is None:
                 logger.error("error in loading image:{}".format(image_file))
                 return None
+        elif isinstance(img, np.ndarray):
+            key = self.cache_key(img, det, rec, cls)
+            if key is not None:
+                result = self.ocr_cache.get(key)
+                if result is not None:
+                    return result
         if isinstance(img, np.ndarray) and len(img.shape) == 2:
             img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        result = self._ocr(img, det, rec, cls)
+        if key is not None and result is not None:
+            self.ocr_cache.put(key, result)
+        return result
+
+    def _ocr(self, img, det=True, rec=True, cls=False):
         if det and rec:
             dt_boxes, rec_res, time_dict = self.__call__(img, cls)
-            print(time_dict)
+            if dt_boxes is None:
+                return None
             return [[box.tolist(), res] for box, res in zip(dt_boxes, rec_res)]
         elif det and not rec:
             dt_boxes, elapse = self.text_detector(img)
@@ -117,36 +117,114 @@ class DBPostProcess(object):
         elif len(outs) == 2:
             contours, _ = outs[0], outs[1]
 
-        num_contours = min(len(contours), self.max_candidates)
-
-        boxes = []
-        scores = []
-        for index in range(num_contours):
-            contour = contours[index]
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
-                continue
-            points = np.array(points)
-            if self.score_mode == "fast":
-                score = self.box_score_fast(pred, points.reshape(-1, 2))
-            else:
-                score = self.box_score_slow(pred, contour)
-            if self.box_thresh > score:
-                continue
-
-            box = self.unclip(points, self.unclip_ratio).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
-                continue
-            box = np.array(box)
-
-            box[:, 0] = np.clip(
-                np.round(box[:, 0] / width * dest_width), 0, dest_width)
-            box[:, 1] = np.clip(
-                np.round(box[:, 1] / height * dest_height), 0, dest_height)
-            boxes.append(box.astype(np.int16))
-            scores.append(score)
-        return np.array(boxes, dtype=np.int16), scores
+        contours = contours[:self.max_candidates]
+        rects = [cv2.minAreaRect(contour) for contour in contours]
+        keep = [i for i, rect in enumerate(rects) if min(rect[1]) >= self.min_size]
+        if len(keep) == 0:
+            return np.zeros((0, 4, 2), dtype=np.int16), []
+
+        # corners in cyclic order, (N, 4, 2)
+        points = np.array([cv2.boxPoints(rects[i]) for i in keep])
+        if self.score_mode == "fast":
+            scores = self.polygons_score(pred, points)
+        else:
+            scores = self.polygons_score(
+                pred, [contours[i].reshape(-1, 2) for i in keep])
+        valid = scores >= self.box_thresh
+        points, scores = points[valid], scores[valid]
+
+        boxes, sside = self.unclip_boxes(points, self.unclip_ratio)
+        valid = sside >= self.min_size + 2
+        boxes, scores = boxes[valid], scores[valid]
+
+        boxes[:, :, 0] = np.clip(
+            np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width)
+        boxes[:, :, 1] = np.clip(
+            np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height)
+        return boxes.astype(np.int16), scores.tolist()
+
+    def polygons_score(self, bitmap, polygons):
+        '''
+        mean score inside every polygon, the value box_score_fast gives for
+        each of them. The clipped bounding rects and the polygons shifted
+        into them are computed for all polygons at once, the loop only fills
+        one small mask per polygon.
+        '''
+        h, w = bitmap.shape[:2]
+        num = len(polygons)
+        scores = np.zeros(num, dtype=np.float64)
+        if num == 0:
+            return scores
+        if isinstance(polygons, np.ndarray):
+            mins, maxs = polygons.min(axis=1), polygons.max(axis=1)
+        else:
+            mins = np.array([p.min(axis=0) for p in polygons])
+            maxs = np.array([p.max(axis=0) for p in polygons])
+        lows = np.stack(
+            [
+                np.clip(np.floor(mins[:, 0]), 0, w - 1),
+                np.clip(np.floor(mins[:, 1]), 0, h - 1)
+            ],
+            axis=1).astype(np.int32)
+        highs = np.stack(
+            [
+                np.clip(np.ceil(maxs[:, 0]), 0, w - 1),
+                np.clip(np.ceil(maxs[:, 1]), 0, h - 1)
+            ],
+            axis=1).astype(np.int32)
+        if isinstance(polygons, np.ndarray):
+            shifted = (polygons - lows[:, None, :]).astype(np.int32)
+        else:
+            shifted = [(p - low).astype(np.int32)
+                       for p, low in zip(polygons, lows)]
+        for index, ((xmin, ymin), (xmax, ymax)) in enumerate(
+                zip(lows.tolist(), highs.tolist())):
+            mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+            cv2.fillPoly(mask, shifted[index].reshape(1, -1, 2), 1)
+            scores[index] = cv2.mean(bitmap[ymin:ymax + 1, xmin:xmax + 1],
+                                     mask)[0]
+        return scores
+
+    def unclip_boxes(self, boxes, unclip_ratio):
+        '''
+        unclip followed by get_mini_boxes for (N, 4, 2) boxes. The offset
+        distances (area * unclip_ratio / perimeter) are computed for all
+        boxes at once; pyclipper still makes the round offset polygon of
+        every box, since its integer vertices decide the minimum area box,
+        so the result is the one of the per box path.
+        return: expanded boxes in get_mini_boxes order and their short sides
+        '''
+        x = boxes[:, :, 0].astype(np.float64)
+        y = boxes[:, :, 1].astype(np.float64)
+        area = np.abs(
+            np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y,
+                   axis=1)) / 2
+        length = np.hypot(x - np.roll(x, -1, axis=1),
+                          y - np.roll(y, -1, axis=1)).sum(axis=1)
+        distances = area * unclip_ratio / length
+        offset = pyclipper.PyclipperOffset()
+        expanded = np.zeros((len(boxes), 4, 2), dtype=np.float32)
+        sside = np.zeros(len(boxes), dtype=np.float64)
+        for index, distance in enumerate(distances.tolist()):
+            offset.Clear()
+            offset.AddPath(boxes[index], pyclipper.JT_ROUND,
+                           pyclipper.ET_CLOSEDPOLYGON)
+            path = np.array(offset.Execute(distance), dtype=np.int32)
+            rect = cv2.minAreaRect(path.reshape(-1, 1, 2))
+            expanded[index] = cv2.boxPoints(rect)
+            sside[index] = min(rect[1])
+        return self.order_mini_boxes(expanded), sside
+
+    def order_mini_boxes(self, boxes):
+        '''
+        the corner order of get_mini_boxes for (N, 4, 2) boxes
+        '''
+        order = np.argsort(boxes[:, :, 0], axis=1, kind='stable')
+        points = np.take_along_axis(boxes, order[:, :, None], axis=1)
+        index_1 = np.where(points[:, 1, 1] > points[:, 0, 1], 0, 1)
+        index_2 = np.where(points[:, 3, 1] > points[:, 2, 1], 2, 3)
+        index = np.stack([index_1, index_2, 5 - index_2, 1 - index_1], axis=1)
+        return np.take_along_axis(points, index[:, :, None], axis=1)
 
     def unclip(self, box, unclip_ratio):
         poly = Polygon(box)
@@ -185,10 +263,10 @@ class DBPostProcess(object):
         '''
         h, w = bitmap.shape[:2]
         box = _box.copy()
-        xmin = np.clip(np.floor(box[:, 0].min()).astype(np.int), 0, w - 1)
-        xmax = np.clip(np.ceil(box[:, 0].max()).astype(np.int), 0, w - 1)
-        ymin = np.clip(np.floor(box[:, 1].min()).astype(np.int), 0, h - 1)
-        ymax = np.clip(np.ceil(box[:, 1].max()).astype(np.int), 0, h - 1)
+        xmin = np.clip(np.floor(box[:, 0].min()).astype(np.int32), 0, w - 1)
+        xmax = np.clip(np.ceil(box[:, 0].max()).astype(np.int32), 0, w - 1)
+        ymin = np.clip(np.floor(box[:, 1].min()).astype(np.int32), 0, h - 1)
+        ymax = np.clip(np.ceil(box[:, 1].max()).astype(np.int32), 0, h - 1)
 
         mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
         box[:, 0] = box[:, 0] - xmin
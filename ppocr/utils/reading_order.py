@@ -0,0 +1,80 @@
+# Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+__all__ = ['reading_order', 'sort_reading_order']
+
+
+def _extents(boxes):
+    if isinstance(boxes, np.ndarray) and boxes.ndim == 3:
+        return boxes[:, :, 0].min(axis=1), boxes[:, :, 1].min(
+            axis=1), boxes[:, :, 1].max(axis=1)
+    xmin, ymin, ymax = [], [], []
+    for box in boxes:
+        box = np.asarray(box, dtype=np.float32).reshape(-1, 2)
+        xmin.append(box[:, 0].min())
+        ymin.append(box[:, 1].min())
+        ymax.append(box[:, 1].max())
+    return np.array(xmin), np.array(ymin), np.array(ymax)
+
+
+def reading_order(boxes, overlap_ratio=0.5):
+    """
+    Indices of text boxes in reading order, line by line from top to bottom
+    and from left to right within a line.
+    args:
+        boxes: (N, k, 2) array or list of polygons with any number of points
+        overlap_ratio: a box joins the current line when their vertical
+            overlap covers this fraction of the smaller height, so the
+            grouping follows the text size rather than a pixel threshold
+    return:
+        list of indices into boxes
+    """
+    num_boxes = len(boxes)
+    if num_boxes == 0:
+        return []
+    xmin, ymin, ymax = _extents(boxes)
+
+    # one sweep over the boxes sorted by their top edge
+    lines = []
+    line, line_top, line_bottom = [], 0., 0.
+    for idx in np.argsort(ymin, kind='stable').tolist():
+        top, bottom = ymin[idx], ymax[idx]
+        if line:
+            overlap = min(bottom, line_bottom) - max(top, line_top)
+            height = max(min(bottom - top, line_bottom - line_top), 1e-6)
+            if overlap >= overlap_ratio * height:
+                # the line band is the mean extent of its boxes so a long
+                # skewed line does not swallow the next one
+                num = len(line)
+                line_top = (line_top * num + top) / (num + 1)
+                line_bottom = (line_bottom * num + bottom) / (num + 1)
+                line.append(idx)
+                continue
+            lines.append(line)
+        line, line_top, line_bottom = [idx], top, bottom
+    lines.append(line)
+
+    order = []
+    for line in lines:
+        order.extend(sorted(line, key=lambda i: xmin[i]))
+    return order
+
+
+def sort_reading_order(boxes, overlap_ratio=0.5):
+    """
+    boxes sorted in reading order, see reading_order
+    """
+    return [boxes[i] for i in reading_order(boxes, overlap_ratio)]
@@ -0,0 +1,190 @@
+"""
+Headless auto labeling.
+
+Runs PaddleOCR over every unchecked image of a labelMaker project directory
+and merges the results into its Cache.cach, exactly like the Auto
+Recognition dialog does. The work is sharded over --total_process_num worker
+processes, every finished image is appended to a per-worker journal and an
+interrupted run resumes from the journals.
+
+    python tools/auto_label.py --image_dir ./train_data/imgs --use_mp true --total_process_num 8
+"""
+import os
+import sys
+import json
+import subprocess
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, '..')))
+
+from ocr import PaddleOCR, init_ocr_args
+from tools.infer.utility import str2bool
+from tools.infer.predict_pipeline import PipelineTextSystem
+from ppocr.utils.utility import get_image_file_list
+from ppocr.utils.logging import get_logger
+logger = get_logger()
+
+JOURNAL_DIR = '.auto_label'
+
+
+def parse_args():
+    parser = init_ocr_args()
+    parser.add_argument("--kie_mode", type=str2bool, default=True)
+    parser.add_argument("--merge_cache", type=str2bool, default=True)
+    parser.set_defaults(lang='ko')
+    return parser.parse_args()
+
+
+def get_label_key(image_file):
+    # same key as MainWindow.getImglabelidx
+    return os.path.basename(os.path.dirname(image_file)) + '/' + \
+        os.path.basename(image_file)
+
+
+def load_file_state(image_dir):
+    checked = set()
+    state_path = os.path.join(image_dir, 'fileState.txt')
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    checked.add(line.split('\t')[0])
+    return checked
+
+
+def read_label_lines(label_path, labels=None):
+    """
+    read a Label.txt style file into {key: json string} without parsing the
+    labels, later lines win
+    """
+    if labels is None:
+        labels = {}
+    if not os.path.exists(label_path):
+        return labels
+    with open(label_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if '\t' not in line:
+                continue
+            key, label = line.split('\t', 1)
+            labels[key] = label
+    return labels
+
+
+def list_journals(image_dir):
+    journal_dir = os.path.join(image_dir, JOURNAL_DIR)
+    if not os.path.isdir(journal_dir):
+        return []
+    return sorted(
+        os.path.join(journal_dir, name) for name in os.listdir(journal_dir)
+        if name.startswith('journal_') and name.endswith('.txt'))
+
+
+def get_shard(args):
+    image_dir = os.path.abspath(args.image_dir)
+    checked = load_file_state(image_dir)
+    image_list = [
+        os.path.abspath(image_file)
+        for image_file in get_image_file_list(image_dir)
+    ]
+    # shard before dropping finished images so every worker sees the same split
+    image_list = [i for i in image_list if i not in checked]
+    return image_list[args.process_id::args.total_process_num]
+
+
+def format_result(result, kie_mode):
+    # same layout as MainWindow.saveLabels(mode='Auto')
+    labels = []
+    for box in result or []:
+        if box[1][0] == "":
+            continue
+        label = {"transcription": box[1][0], "points": box[0],
+                 "difficult": False}
+        if kie_mode:
+            label["key_cls"] = "None"
+        labels.append(label)
+    return labels
+
+
+def run_shard(args):
+    image_dir = os.path.abspath(args.image_dir)
+    shard = get_shard(args)
+    done = {}
+    for journal in list_journals(image_dir):
+        read_label_lines(journal, done)
+    todo = [i for i in shard if get_label_key(i) not in done]
+    logger.info("worker {}: {} images, {} already done".format(
+        args.process_id, len(shard), len(shard) - len(todo)))
+    if not todo:
+        return
+
+    os.makedirs(os.path.join(image_dir, JOURNAL_DIR), exist_ok=True)
+    journal_path = os.path.join(image_dir, JOURNAL_DIR,
+                                'journal_{}.txt'.format(args.process_id))
+    ocr = PaddleOCR(**vars(args))
+    pipeline = PipelineTextSystem(ocr)
+    with open(journal_path, 'a', encoding='utf-8') as journal:
+        for idx, (image_file, result) in enumerate(pipeline(todo, cls=True)):
+            labels = format_result(result, args.kie_mode)
+            journal.write(get_label_key(image_file) + '\t' + json.dumps(
+                labels, ensure_ascii=False) + '\n')
+            journal.flush()
+            logger.info("worker {}: [{}/{}] {}, {} boxes".format(
+                args.process_id, idx + 1, len(todo), image_file, len(labels)))
+
+
+def merge_cache(image_dir):
+    """
+    fold the worker journals into Cache.cach and remove them. Images without
+    text are left out, as the GUI does.
+    """
+    image_dir = os.path.abspath(image_dir)
+    journals = list_journals(image_dir)
+    if not journals:
+        return
+    cache_path = os.path.join(image_dir, 'Cache.cach')
+    cache = read_label_lines(cache_path)
+    results = {}
+    for journal in journals:
+        read_label_lines(journal, results)
+    for key, label in results.items():
+        if label != '[]':
+            cache[key] = label
+
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for key, label in cache.items():
+            f.write(key + '\t' + label + '\n')
+    os.replace(tmp_path, cache_path)
+    for journal in journals:
+        os.remove(journal)
+    logger.info("merged {} images into {}".format(len(results), cache_path))
+
+
+def main(args):
+    run_shard(args)
+    if args.merge_cache:
+        merge_cache(args.image_dir)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.use_mp:
+        p_list = []
+        total_process_num = args.total_process_num
+        for process_id in range(total_process_num):
+            cmd = [sys.executable, "-u"] + sys.argv + [
+                "--process_id={}".format(process_id),
+                "--use_mp={}".format(False),
+                "--merge_cache={}".format(False)
+            ]
+            p = subprocess.Popen(cmd, stdout=sys.stdout, stderr=sys.stdout)
+            p_list.append(p)
+        for p in p_list:
+            p.wait()
+        if args.merge_cache and all(p.returncode == 0 for p in p_list):
+            merge_cache(args.image_dir)
+    else:
+        main(args)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from ppocr.utils.logging import get_logger
+logger = get_logger()
+
+# every argument that changes what det, cls or rec return for the same pixels
+FINGERPRINT_ARGS = [
+    'det_algorithm', 'det_model_dir', 'det_limit_side_len', 'det_limit_type',
+    'det_tile_size', 'det_tile_overlap', 'det_tile_scale',
+    'det_tile_merge_thresh',
+    'det_db_thresh', 'det_db_box_thresh', 'det_db_unclip_ratio',
+    'use_dilation', 'det_db_score_mode', 'det_box_type', 'rec_algorithm',
+    'rec_model_dir', 'rec_image_shape', 'rec_char_dict_path',
+    'use_fused_rec', 'use_space_char', 'max_text_length', 'drop_score',
+    'use_angle_cls', 'cls_model_dir', 'cls_image_shape', 'label_list',
+    'cls_thresh'
+]
+
+
+def _model_signature(model_dir):
+    # retraining into the same directory must not hit old results
+    signature = []
+    if model_dir and os.path.isdir(model_dir):
+        for name in sorted(os.listdir(model_dir)):
+            path = os.path.join(model_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                signature.append([name, stat.st_size, int(stat.st_mtime)])
+    return signature
+
+
+def _to_builtin(obj):
+    # numpy scalars and arrays in det/rec results
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError('{} is not JSON serializable'.format(type(obj)))
+
+
+def config_fingerprint(args):
+    config = {}
+    for name in FINGERPRINT_ARGS:
+        if hasattr(args, name):
+            config[name] = str(getattr(args, name))
+    for name in ['det_model_dir', 'rec_model_dir', 'cls_model_dir']:
+        config[name + '_files'] = _model_signature(getattr(args, name, None))
+    return hashlib.sha1(
+        json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class OCRCache(object):
+    """
+    Content addressed on-disk cache of ocr results, stored in SQLite and
+    evicted least recently used first once it grows over max_size_mb.
+    """
+
+    def __init__(self, cache_path, max_size_mb=1024, fingerprint=''):
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.fingerprint = fingerprint
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            cache_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                          'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                          'size INTEGER NOT NULL, atime REAL NOT NULL)')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS results_atime ON results (atime)')
+        self.conn.commit()
+        self.total_size = self._query_size()
+
+    def _query_size(self):
+        return self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def make_key(self, data, *options):
+        """
+        data: encoded image file bytes or a decoded ndarray
+        options: anything else the result depends on, e.g. det/rec/cls flags
+        """
+        h = hashlib.sha1()
+        if hasattr(data, 'tobytes'):
+            h.update('{}{}'.format(data.shape, data.dtype).encode('utf-8'))
+            data = data.tobytes()
+        h.update(data)
+        h.update(json.dumps([self.fingerprint] + list(options)).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM results WHERE key=?',
+                                    (key, )).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE results SET atime=? WHERE key=?',
+                              (time.time(), key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value, ensure_ascii=False, default=_to_builtin)
+        size = len(value.encode('utf-8'))
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM results WHERE key=?',
+                                    (key, )).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (key, value, size, atime) '
+                'VALUES (?, ?, ?, ?)', (key, value, size, time.time()))
+            self.conn.commit()
+            self.total_size += size - (old[0] if old else 0)
+            if self.total_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # other processes may share the file, recount before deleting
+        self.total_size = self._query_size()
+        target = self.max_size * 0.9
+        while self.total_size > target:
+            rows = self.conn.execute(
+                'SELECT key, size FROM results ORDER BY atime LIMIT 256'
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_size <= target:
+                    break
+                self.conn.execute('DELETE FROM results WHERE key=?', (key, ))
+                self.total_size -= size
+            self.conn.commit()
+        logger.debug("ocr cache evicted down to {} bytes".format(
+            self.total_size))
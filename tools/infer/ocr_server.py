@@ -0,0 +1,439 @@
+"""
+Local OCR inference server.
+
+Loads one PaddleOCR instance and serves it over HTTP, so several labelMaker
+windows or scripts on the same machine share one warm set of det/rec
+predictors. Concurrent requests are coalesced into det and rec micro-batches
+of at most --server_max_batch requests, a batch waits at most
+--server_max_wait_ms for more requests to arrive.
+
+    python tools/infer/ocr_server.py --lang ko --port 8866
+    python labelMaker.py --ocr_server http://127.0.0.1:8866
+
+POST /ocr   {"image": base64 file content, "det": true, "rec": true,
+             "cls": false} or {"images": [base64, ...], "det": false}
+            -> {"result": same layout as PaddleOCR.ocr}
+GET /stats  -> queue length, batch sizes and latencies per stage
+"""
+import os
+import sys
+import json
+import time
+import queue
+import base64
+import threading
+import collections
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, '../..')))
+
+import cv2
+import numpy as np
+from tools.infer.predict_pipeline import decode_image, read_image_bytes
+from ppocr.utils.logging import get_logger
+logger = get_logger()
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.
+    return float(np.percentile(np.array(values), q))
+
+
+class StageStats(object):
+    """
+    counters and recent latencies of one stage, latencies in milliseconds
+    """
+
+    def __init__(self, window=1024):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.wait_ms = collections.deque(maxlen=window)
+        self.run_ms = collections.deque(maxlen=window)
+
+    def add(self, batch_size, wait_ms, run_ms):
+        with self.lock:
+            self.batches += 1
+            self.items += batch_size
+            self.batch_sizes.append(batch_size)
+            self.wait_ms.extend(wait_ms)
+            self.run_ms.append(run_ms)
+
+    def summary(self):
+        with self.lock:
+            batch_sizes = list(self.batch_sizes)
+            wait_ms = list(self.wait_ms)
+            run_ms = list(self.run_ms)
+            batches, items = self.batches, self.items
+        return {
+            'batches': batches,
+            'items': items,
+            'mean_batch_size': float(np.mean(batch_sizes))
+            if batch_sizes else 0.,
+            'wait_ms': {
+                'p50': _percentile(wait_ms, 50),
+                'p95': _percentile(wait_ms, 95)
+            },
+            'run_ms': {
+                'p50': _percentile(run_ms, 50),
+                'p95': _percentile(run_ms, 95)
+            }
+        }
+
+
+class OCRRequest(object):
+    def __init__(self, img=None, images=None, det=True, rec=True, cls=False):
+        self.img = img
+        self.images = images
+        self.det = det
+        self.rec = rec
+        self.cls = cls
+        self.dt_boxes = None
+        self.crops = None
+        self.future = Future()
+        self.enqueue_time = 0.
+
+
+class MicroBatchStage(object):
+    """
+    one worker thread that takes up to max_batch queued requests, waiting
+    at most max_wait_ms after the first one, and hands them to func
+    together
+    """
+
+    def __init__(self, name, func, max_batch, max_wait_ms):
+        self.name = name
+        self.func = func
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0., max_wait_ms) / 1000.
+        self.queue = queue.Queue()
+        self.stats = StageStats()
+        self.thread = threading.Thread(target=self._run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, request):
+        request.enqueue_time = time.time()
+        self.queue.put(request)
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.time()
+            wait_ms = [(start - r.enqueue_time) * 1000. for r in batch]
+            try:
+                self.func(batch)
+            except Exception as e:
+                logger.error("ocr server {} stage failed: {}".format(
+                    self.name, e))
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            self.stats.add(len(batch), wait_ms, (time.time() - start) * 1000.)
+
+
+class OCRServer(object):
+    """
+    det and rec micro-batching around one PaddleOCR instance. Only the det
+    stage thread touches the detector and only the rec stage thread touches
+    the classifier and recognizer.
+    """
+
+    def __init__(self, ocr, max_batch=8, max_wait_ms=10.):
+        self.ocr = ocr
+        self.ocr_cache = getattr(ocr, 'ocr_cache', None)
+        self.rec_stage = MicroBatchStage('rec', self._rec_batch, max_batch,
+                                         max_wait_ms)
+        self.det_stage = MicroBatchStage('det', self._det_batch, max_batch,
+                                         max_wait_ms)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latency_ms = collections.deque(maxlen=1024)
+
+    def submit(self, request):
+        if request.det:
+            self.det_stage.put(request)
+        else:
+            self.rec_stage.put(request)
+        return request.future
+
+    def _det_batch(self, requests):
+        dt_boxes_list = self.ocr.detect_batch([r.img for r in requests])
+        for request, dt_boxes in zip(requests, dt_boxes_list):
+            if dt_boxes is None:
+                request.future.set_result(None)
+            elif not request.rec:
+                request.future.set_result([box.tolist() for box in dt_boxes])
+            elif len(dt_boxes) == 0:
+                request.future.set_result([])
+            else:
+                request.dt_boxes = dt_boxes
+                request.crops = self.ocr.crop(request.img, dt_boxes,
+                                              request.cls)
+                self.rec_stage.put(request)
+
+    def _rec_batch(self, requests):
+        for cls in [False, True]:
+            det_requests = [r for r in requests if r.det and r.cls == cls]
+            if det_requests:
+                rec_res_list = self.ocr.recognize_pooled(
+                    [r.crops for r in det_requests], cls)
+                for request, rec_res in zip(det_requests, rec_res_list):
+                    boxes, rec_res = self.ocr.filter_rec_res(
+                        request.dt_boxes, rec_res)
+                    request.future.set_result(
+                        [[box.tolist(), res]
+                         for box, res in zip(boxes, rec_res)])
+
+            img_requests = [r for r in requests if not r.det and r.cls == cls]
+            if img_requests:
+                # text line images, recognized like PaddleOCR.ocr(det=False)
+                img_list = [img for r in img_requests for img in r.images]
+                if self.ocr.use_angle_cls and cls:
+                    img_list, _, _ = self.ocr.text_classifier(img_list)
+                rec_res, _ = self.ocr.text_recognizer(img_list)
+                beg = 0
+                for request in img_requests:
+                    num = len(request.images)
+                    request.future.set_result(
+                        [list(res) for res in rec_res[beg:beg + num]])
+                    beg += num
+
+    def run(self, body):
+        """
+        answer one decoded /ocr request body
+        """
+        start = time.time()
+        det = bool(body.get('det', True))
+        rec = bool(body.get('rec', True))
+        cls = bool(body.get('cls', False)) and self.ocr.use_angle_cls
+        if not det and not rec:
+            raise ValueError('det or rec must be set')
+        if det:
+            data = base64.b64decode(body['image'])
+            key = None
+            if self.ocr_cache is not None:
+                key = self.ocr.cache_key(data, det, rec, cls)
+                result = self.ocr_cache.get(key)
+                if result is not None:
+                    return result
+            img = decode_image('', data)
+            if img is None:
+                raise ValueError('can not decode the image')
+            result = self.submit(OCRRequest(img=img, det=det, rec=rec,
+                                            cls=cls)).result()
+            if key is not None and result is not None:
+                self.ocr_cache.put(key, result)
+        else:
+            images = []
+            for image in body['images']:
+                img = decode_image('', base64.b64decode(image))
+                if img is None:
+                    raise ValueError('can not decode the image')
+                images.append(img)
+            if not images:
+                return []
+            result = self.submit(OCRRequest(images=images, det=det, rec=rec,
+                                            cls=cls)).result()
+        with self.lock:
+            self.requests += 1
+            self.latency_ms.append((time.time() - start) * 1000.)
+        return result
+
+    def stats(self):
+        with self.lock:
+            latency_ms = list(self.latency_ms)
+            requests = self.requests
+        stages = {}
+        for stage in [self.det_stage, self.rec_stage]:
+            stages[stage.name] = stage.stats.summary()
+            stages[stage.name]['queue'] = stage.queue.qsize()
+        return {
+            'requests': requests,
+            'latency_ms': {
+                'p50': _percentile(latency_ms, 50),
+                'p95': _percentile(latency_ms, 95)
+            },
+            'stages': stages
+        }
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'labelMakerOCR/1.0'
+
+    def _reply(self, code, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.ocr_server.stats())
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/ocr':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        except Exception as e:
+            self._reply(400, {'error': 'bad request: {}'.format(e)})
+            return
+        try:
+            result = self.server.ocr_server.run(body)
+        except (KeyError, ValueError) as e:
+            self._reply(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.error("ocr request failed: {}".format(e))
+            self._reply(500, {'error': str(e)})
+            return
+        self._reply(200, {'result': result})
+
+    def log_message(self, format, *args):
+        logger.debug("ocr server: " + format % args)
+
+
+class OCRClient(object):
+    """
+    client for the ocr server with the ocr() interface of PaddleOCR, so it
+    can stand in for it in labelMaker
+    """
+
+    def __init__(self, url, timeout=600):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, body):
+        request = urllib.request.Request(
+            self.url + '/ocr',
+            data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(
+                    request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))['result']
+        except urllib.error.HTTPError as e:
+            message = e.read().decode('utf-8', 'replace')
+            raise RuntimeError('ocr server error {}: {}'.format(e.code,
+                                                               message))
+
+    @staticmethod
+    def _encode(img):
+        if isinstance(img, str):
+            data = read_image_bytes(img)
+            if data is None:
+                # gif and pdf are decoded here
+                img = decode_image(img)
+                if img is None:
+                    return None
+            else:
+                return base64.b64encode(data).decode('ascii')
+        ok, buf = cv2.imencode('.png', img)
+        return base64.b64encode(buf.tobytes()).decode('ascii') if ok else None
+
+    def stats(self):
+        with urllib.request.urlopen(
+                self.url + '/stats', timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def ocr(self, img, det=True, rec=True, cls=False):
+        """
+        same arguments and result as PaddleOCR.ocr
+        """
+        assert isinstance(img, (np.ndarray, list, str))
+        body = {'det': det, 'rec': rec, 'cls': cls}
+        if det:
+            if isinstance(img, list):
+                logger.error('When input a list of images, det must be false')
+                return None
+            body['image'] = self._encode(img)
+            if body['image'] is None:
+                logger.error("error in loading image:{}".format(img))
+                return None
+        else:
+            if not isinstance(img, list):
+                img = [img]
+            body['images'] = [self._encode(i) for i in img]
+        return self._post(body)
+
+    def ocr_files(self, image_list, cls=True, workers=4):
+        """
+        ocr image files with several requests in flight, so the server can
+        batch them. Yields (image_file, result) in input order.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = collections.deque()
+            for image_file in image_list:
+                futures.append((image_file, executor.submit(
+                    self.ocr, image_file, True, True, cls)))
+                if len(futures) >= workers * 2:
+                    image_file, future = futures.popleft()
+                    yield image_file, future.result()
+            while futures:
+                image_file, future = futures.popleft()
+                yield image_file, future.result()
+        finally:
+            for _, future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+def parse_args():
+    from ocr import init_ocr_args
+    parser = init_ocr_args()
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8866)
+    parser.add_argument("--server_max_batch", type=int, default=8)
+    parser.add_argument("--server_max_wait_ms", type=float, default=10.)
+    parser.set_defaults(lang='ko')
+    return parser.parse_args()
+
+
+def main(args):
+    from ocr import PaddleOCR
+    ocr = PaddleOCR(**vars(args))
+    httpd = ThreadingHTTPServer((args.host, args.port), OCRRequestHandler)
+    httpd.daemon_threads = True
+    httpd.ocr_server = OCRServer(ocr, args.server_max_batch,
+                                 args.server_max_wait_ms)
+    logger.info("ocr server listening on http://{}:{}".format(args.host,
+                                                              args.port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main(parse_args())
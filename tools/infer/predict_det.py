@@ -17,6 +17,7 @@ from ppocr.utils.logging import get_logger
 from ppocr.utils.utility import get_image_file_list, check_and_read
 from ppocr.data import create_operators, transform
 from ppocr.postprocess import build_post_process
+from shapely.geometry import Polygon, box as shapely_box
 import json
 logger = get_logger()
 
@@ -132,6 +133,22 @@ class TextDetector(object):
                     }
                 }
         self.preprocess_op = create_operators(pre_process_list)
+        # tiles are cut at the page resolution, only normalized
+        self.tile_preprocess_op = create_operators(pre_process_list[1:3])
+        self.tile_size = int(getattr(args, 'det_tile_size', 0) or 0)
+        if self.tile_size > 0:
+            # the det backbones downsample by 32
+            self.tile_size = max(32, self.tile_size // 32 * 32)
+            if self.det_algorithm not in ['DB', 'DB++']:
+                logger.warning("tiled detection supports DB and DB++ only, "
+                               "det_tile_size is ignored for {}".format(
+                                   self.det_algorithm))
+                self.tile_size = 0
+        self.tile_overlap = min(
+            int(getattr(args, 'det_tile_overlap', 128)), self.tile_size // 2)
+        self.tile_scale = getattr(args, 'det_tile_scale', 1.0)
+        self.tile_batch_num = max(1, getattr(args, 'det_tile_batch_num', 4))
+        self.tile_merge_thresh = getattr(args, 'det_tile_merge_thresh', 0.5)
 
         if args.benchmark:
             import auto_log
@@ -193,25 +210,11 @@ class TextDetector(object):
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def __call__(self, img):
-        ori_im = img.copy()
-        data = {'image': img}
-
-        st = time.time()
-
-        if self.args.benchmark:
-            self.autolog.times.start()
-
-        data = transform(data, self.preprocess_op)
-        img, shape_list = data
-        if img is None:
-            return None, 0
-        img = np.expand_dims(img, axis=0)
-        shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
-
-        if self.args.benchmark:
-            self.autolog.times.stamp()
+    def run_predictor(self, img):
+        """
+        run the det predictor on a normalized NCHW batch and name its outputs
+        for the postprocess op
+        """
         if self.use_onnx:
             input_dict = {}
             input_dict[self.input_tensor.name] = img
@@ -242,6 +245,158 @@ class TextDetector(object):
                 preds['level_{}'.format(i)] = output
         else:
             raise NotImplementedError
+        return preds
+
+    def use_tiles(self, img):
+        if self.tile_size <= 0:
+            return False
+        return max(img.shape[:2]) * self.tile_scale > self.tile_size
+
+    def tile_layout(self, height, width):
+        """
+        top left corners of overlapping tiles covering the page, the last
+        tile of a row or column is moved back to end at the page border so
+        only pages smaller than a tile get padded
+        """
+        stride = self.tile_size - self.tile_overlap
+
+        def starts(length):
+            if length <= self.tile_size:
+                return [0]
+            pos = list(range(0, length - self.tile_size, stride))
+            return pos + [length - self.tile_size]
+
+        return [(x, y) for y in starts(height) for x in starts(width)]
+
+    def detect_tiles(self, img):
+        """
+        detect text on overlapping tiles at page resolution, a batch of
+        det_tile_batch_num tiles at a time, so memory depends on the tile
+        size only and time grows linearly with the page area. Boxes are
+        mapped back to the page and merged across the tile seams.
+        """
+        st = time.time()
+        page = img
+        if self.tile_scale != 1.0:
+            page = cv2.resize(
+                img, (max(1, int(round(img.shape[1] * self.tile_scale))),
+                      max(1, int(round(img.shape[0] * self.tile_scale)))))
+        height, width = page.shape[:2]
+        size = self.tile_size
+        tiles = self.tile_layout(height, width)
+        shape_list = np.array(
+            [[size, size, 1., 1.]] * self.tile_batch_num, dtype=np.float32)
+
+        boxes, tile_ids = [], []
+        for beg in range(0, len(tiles), self.tile_batch_num):
+            batch_tiles = tiles[beg:beg + self.tile_batch_num]
+            norm_tiles = []
+            for x, y in batch_tiles:
+                tile = page[y:y + size, x:x + size]
+                if tile.shape[0] < size or tile.shape[1] < size:
+                    tile = cv2.copyMakeBorder(
+                        tile, 0, size - tile.shape[0], 0,
+                        size - tile.shape[1], cv2.BORDER_CONSTANT)
+                norm_tiles.append(
+                    transform({
+                        'image': tile
+                    }, self.tile_preprocess_op)['image'])
+            preds = self.run_predictor(np.stack(norm_tiles))
+            post_result = self.postprocess_op(preds,
+                                              shape_list[:len(batch_tiles)])
+            for tno, (x, y) in enumerate(batch_tiles):
+                for points in post_result[tno]['points']:
+                    boxes.append(
+                        np.array(points, dtype=np.float32) + [x, y])
+                    tile_ids.append(beg + tno)
+
+        tile_rects = [(x, y, min(x + size, width), min(y + size, height))
+                      for x, y in tiles]
+        dt_boxes = self.merge_tile_boxes(boxes, tile_ids, tile_rects)
+        if self.tile_scale != 1.0 and len(dt_boxes) > 0:
+            dt_boxes = [b / self.tile_scale for b in dt_boxes]
+        dt_boxes = self.filter_tag_det_res(dt_boxes, img.shape)
+        logger.debug("tiled det: {} tiles, {} boxes, elapse : {}".format(
+            len(tiles), len(dt_boxes), time.time() - st))
+        return dt_boxes, time.time() - st
+
+    def merge_tile_boxes(self, boxes, tile_ids, tile_rects):
+        """
+        polygon NMS across tile seams. Two boxes of different tiles are the
+        same text when their intersection covers det_tile_merge_thresh of
+        the smaller of their parts inside the region both tiles saw. This
+        catches a word seen whole by one tile and cut by the other, as well
+        as a line longer than the overlap cut by both. Merged boxes become
+        the minimum area rectangle of the group.
+        """
+        num = len(boxes)
+        if num == 0:
+            return []
+        boxes = np.array(boxes, dtype=np.float32)
+        tile_ids = np.array(tile_ids)
+        xmin, ymin = boxes[:, :, 0].min(axis=1), boxes[:, :, 1].min(axis=1)
+        xmax, ymax = boxes[:, :, 0].max(axis=1), boxes[:, :, 1].max(axis=1)
+        polys = [Polygon(b).buffer(0) for b in boxes]
+        tile_polys = [shapely_box(*rect) for rect in tile_rects]
+
+        parent = list(range(num))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i in range(num):
+            cand = np.where((xmin < xmax[i]) & (xmax > xmin[i]) &
+                            (ymin < ymax[i]) & (ymax > ymin[i]) &
+                            (tile_ids != tile_ids[i]))[0]
+            for j in cand[cand > i]:
+                inter = polys[i].intersection(polys[j]).area
+                if inter <= 0:
+                    continue
+                common = tile_polys[tile_ids[i]].intersection(tile_polys[
+                    tile_ids[j]])
+                seen = min(polys[i].intersection(common).area,
+                           polys[j].intersection(common).area)
+                if inter >= self.tile_merge_thresh * seen:
+                    parent[find(j)] = find(i)
+
+        groups = {}
+        for i in range(num):
+            groups.setdefault(find(i), []).append(i)
+        dt_boxes = []
+        for group in groups.values():
+            if len(group) == 1:
+                dt_boxes.append(boxes[group[0]])
+                continue
+            points = boxes[group].reshape(-1, 2)
+            dt_boxes.append(
+                cv2.boxPoints(cv2.minAreaRect(points)).astype(np.float32))
+        return dt_boxes
+
+    def __call__(self, img):
+        if self.use_tiles(img):
+            return self.detect_tiles(img)
+        ori_im = img.copy()
+        data = {'image': img}
+
+        st = time.time()
+
+        if self.args.benchmark:
+            self.autolog.times.start()
+
+        data = transform(data, self.preprocess_op)
+        img, shape_list = data
+        if img is None:
+            return None, 0
+        img = np.expand_dims(img, axis=0)
+        shape_list = np.expand_dims(shape_list, axis=0)
+        img = img.copy()
+
+        if self.args.benchmark:
+            self.autolog.times.stamp()
+        preds = self.run_predictor(img)
 
         #self.predictor.try_shrink_memory()
         post_result = self.postprocess_op(preds, shape_list)
@@ -258,6 +413,48 @@ class TextDetector(object):
         et = time.time()
         return dt_boxes, et - st
 
+    def detect_batch(self, img_list):
+        """
+        detect text on several images with one predictor call. The resized
+        images are padded to a common size and every score map is cut back
+        to its own image before the postprocess. Only the DB family runs
+        batched, other algorithms and tiled pages run one by one.
+        return:
+            list of dt_boxes, None where the image could not be processed
+        """
+        results = [None] * len(img_list)
+        batch_ids, batch_imgs, batch_shapes = [], [], []
+        for ino, img in enumerate(img_list):
+            if self.det_algorithm not in ['DB', 'DB++'] or self.use_tiles(
+                    img):
+                results[ino] = self(img)[0]
+                continue
+            data = transform({'image': img}, self.preprocess_op)
+            if data is None or data[0] is None:
+                continue
+            batch_ids.append(ino)
+            batch_imgs.append(data[0])
+            batch_shapes.append(data[1])
+        if not batch_ids:
+            return results
+
+        max_h = max(img.shape[1] for img in batch_imgs)
+        max_w = max(img.shape[2] for img in batch_imgs)
+        norm_img_batch = np.zeros(
+            (len(batch_imgs), batch_imgs[0].shape[0], max_h, max_w),
+            dtype=np.float32)
+        for bno, img in enumerate(batch_imgs):
+            norm_img_batch[bno, :, :img.shape[1], :img.shape[2]] = img
+        preds = self.run_predictor(norm_img_batch)
+        for bno, ino in enumerate(batch_ids):
+            h, w = batch_imgs[bno].shape[1:]
+            post_result = self.postprocess_op({
+                'maps': preds['maps'][bno:bno + 1, :, :h, :w]
+            }, np.expand_dims(batch_shapes[bno], axis=0))
+            results[ino] = self.filter_tag_det_res(post_result[0]['points'],
+                                                   img_list[ino].shape)
+        return results
+
 
 if __name__ == "__main__":
     args = utility.parse_args()
@@ -0,0 +1,244 @@
+import os
+import sys
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, '../..')))
+
+import cv2
+import numpy as np
+from ppocr.utils.utility import check_and_read
+from ppocr.utils.logging import get_logger
+logger = get_logger()
+
+_END = object()
+
+
+def read_image_bytes(image_file):
+    """
+    raw file content for images cv2.imdecode can read, None for gif/pdf
+    """
+    if os.path.basename(image_file)[-3:].lower() in ['gif', 'pdf']:
+        return None
+    try:
+        with open(image_file, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def decode_image(image_file, data=None):
+    """
+    decode an image file once into a BGR ndarray, None if it can not be read.
+    data is the already read file content, if any
+    """
+    try:
+        if data is not None:
+            img, flag = None, False
+        else:
+            img, flag, _ = check_and_read(image_file)
+        if not flag:
+            if data is not None:
+                buf = np.frombuffer(data, dtype=np.uint8)
+            else:
+                buf = np.fromfile(image_file, dtype=np.uint8)
+            img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        elif isinstance(img, list):
+            img = img[0] if len(img) > 0 else None
+    except Exception as e:
+        logger.warning("error in loading image:{}, {}".format(image_file, e))
+        return None
+    if img is None:
+        logger.warning("error in loading image:{}".format(image_file))
+    elif len(img.shape) == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return img
+
+
+class PipelineTextSystem(object):
+    """
+    Run a TextSystem as decode -> det -> crop -> rec stages connected by
+    bounded queues, so every stage works on a different image at the same
+    time. Pages waiting in front of the rec stage share recognizer batches
+    through TextSystem.recognize_pooled. When text_sys has an ocr_cache
+    (PaddleOCR), cached images skip det and rec. Results are yielded in
+    input order as (image_file, result) where result has the same layout as
+    PaddleOCR.ocr(det=True, rec=True), or None when the image can not be
+    read, is too small or has no text.
+    """
+
+    def __init__(self, text_sys, decode_workers=None, queue_size=None,
+                 min_side=32):
+        args = getattr(text_sys, 'args', None)
+        if decode_workers is None:
+            decode_workers = getattr(args, 'decode_workers', 4)
+        if queue_size is None:
+            queue_size = getattr(args, 'pipeline_queue_size', 8)
+        self.text_sys = text_sys
+        self.decode_workers = max(1, decode_workers)
+        self.queue_size = max(1, queue_size)
+        self.min_side = min_side
+        self.rec_pool_size = getattr(args, 'rec_batch_num', 6) * 4
+        self.ocr_cache = getattr(text_sys, 'ocr_cache', None)
+        self._stop = threading.Event()
+        self._error = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _stage(self, func, in_q, out_q):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END:
+                    break
+                if not self._put(out_q, func(item)):
+                    break
+        except Exception as e:
+            logger.error("auto labeling pipeline failed: {}".format(e))
+            self._error = e
+            self._stop.set()
+        finally:
+            self._put(out_q, _END)
+
+    def _decode(self, image_file, cls):
+        data, key = None, None
+        if self.ocr_cache is not None:
+            data = read_image_bytes(image_file)
+            if data is not None:
+                key = self.text_sys.cache_key(data, True, True, cls)
+                result = self.ocr_cache.get(key)
+                if result is not None:
+                    return image_file, None, key, result
+        img = decode_image(image_file, data)
+        if img is not None and min(img.shape[:2]) <= self.min_side:
+            logger.info("The size of {} is too small to be recognised".format(
+                image_file))
+            img = None
+        return image_file, img, key, None
+
+    def _feed(self, image_list, executor, decode_q, cls):
+        try:
+            for image_file in image_list:
+                if not self._put(decode_q,
+                                 executor.submit(self._decode, image_file,
+                                                 cls)):
+                    break
+        finally:
+            self._put(decode_q, _END)
+
+    def _det(self, future):
+        image_file, img, key, cached = future.result()
+        if img is None:
+            return image_file, None, None, key, cached
+        dt_boxes, _ = self.text_sys.detect(img)
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return image_file, None, None, key, None
+        return image_file, img, dt_boxes, key, None
+
+    def _crop(self, item, cls):
+        image_file, img, dt_boxes, key, cached = item
+        if img is None:
+            return image_file, None, None, key, cached
+        return image_file, dt_boxes, self.text_sys.crop(img, dt_boxes,
+                                                        cls), key, None
+
+    def _rec_stage(self, in_q, out_q, cls):
+        try:
+            end = False
+            while not end:
+                item = self._get(in_q)
+                if item is _END:
+                    break
+                # pool the pages that are already waiting so that sparse pages
+                # share full rec batches, never wait for more
+                items = [item]
+                num_crops = len(item[2] or [])
+                while num_crops < self.rec_pool_size:
+                    try:
+                        item = in_q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        end = True
+                        break
+                    items.append(item)
+                    num_crops += len(item[2] or [])
+
+                rec_res_list = self.text_sys.recognize_pooled(
+                    [item[2] or [] for item in items], cls)
+                for (image_file, dt_boxes, _, key, result), rec_res in zip(
+                        items, rec_res_list):
+                    if dt_boxes is not None:
+                        boxes, rec_res = self.text_sys.filter_rec_res(
+                            dt_boxes, rec_res)
+                        result = [[box.tolist(), res]
+                                  for box, res in zip(boxes, rec_res)]
+                        if key is not None:
+                            self.ocr_cache.put(key, result)
+                    if not self._put(out_q, (image_file, result)):
+                        return
+        except Exception as e:
+            logger.error("auto labeling pipeline failed: {}".format(e))
+            self._error = e
+            self._stop.set()
+        finally:
+            self._put(out_q, _END)
+
+    def __call__(self, image_list, cls=True):
+        self._stop.clear()
+        self._error = None
+        decode_q = queue.Queue(self.queue_size)
+        det_q = queue.Queue(self.queue_size)
+        crop_q = queue.Queue(self.queue_size)
+        out_q = queue.Queue(self.queue_size)
+
+        executor = ThreadPoolExecutor(max_workers=self.decode_workers)
+        threads = [
+            threading.Thread(
+                target=self._feed,
+                args=(image_list, executor, decode_q, cls)),
+            threading.Thread(
+                target=self._stage, args=(self._det, decode_q, det_q)),
+            threading.Thread(
+                target=self._stage,
+                args=(lambda item: self._crop(item, cls), det_q, crop_q)),
+            threading.Thread(
+                target=self._rec_stage, args=(crop_q, out_q, cls)),
+        ]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        try:
+            while True:
+                item = self._get(out_q)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            executor.shutdown(wait=False)
+        if self._error is not None:
+            raise self._error
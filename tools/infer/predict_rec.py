@@ -11,6 +11,7 @@ import cv2
 import numpy as np
 import math
 import time
+import threading
 import traceback
 import paddle
 
@@ -96,6 +97,19 @@ class TextRecognizer(object):
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.input_tensor, self.output_tensors, self.config = \
             utility.create_predictor(args, 'rec', logger)
+        # preprocessing recognize_quads can fuse with the crop warp, 'stretch'
+        # for resize_norm_img_svtr and 'pad' for resize_norm_img
+        if self.rec_algorithm in ['SVTR', 'SEED']:
+            self.fused_mode = 'stretch'
+        elif self.rec_algorithm in [
+                'SRN', 'SAR', 'VisionLAN', 'SPIN', 'ABINet', 'RobustScanner',
+                'NRTR', 'ViTSTR', 'RARE'
+        ]:
+            self.fused_mode = None
+        else:
+            self.fused_mode = 'pad'
+        # per thread, recognize_quads may run in several threads at once
+        self.fused_local = threading.local()
         self.benchmark = args.benchmark
         self.use_onnx = args.use_onnx
         if args.benchmark:
@@ -327,6 +341,148 @@ class TextRecognizer(object):
 
         return resized_image
 
+    def predict(self, norm_img_batch):
+        """
+        run the predictor on a batch of a single input tensor
+        """
+        if self.use_onnx:
+            input_dict = {}
+            input_dict[self.input_tensor.name] = norm_img_batch
+            outputs = self.predictor.run(self.output_tensors, input_dict)
+            return outputs[0]
+        self.input_tensor.copy_from_cpu(norm_img_batch)
+        self.predictor.run()
+        outputs = []
+        for output_tensor in self.output_tensors:
+            output = output_tensor.copy_to_cpu()
+            outputs.append(output)
+        if self.benchmark:
+            self.autolog.times.stamp()
+        if len(outputs) != 1:
+            return outputs
+        return outputs[0]
+
+    def fused_buffers(self, num, imgH, imgW):
+        """
+        uint8 (num, imgH, imgW, 3) warp targets and the float32
+        (num, 3, imgH, imgW) batch, both views of buffers kept across calls
+        of the calling thread
+        """
+        size = num * imgH * imgW * 3
+        local = self.fused_local
+        if getattr(local, 'warp_buffer', None) is None or \
+                local.warp_buffer.size < size:
+            local.warp_buffer = np.empty(size, dtype=np.uint8)
+            local.batch_buffer = np.empty(size, dtype=np.float32)
+        return (local.warp_buffer[:size].reshape(num, imgH, imgW, 3),
+                local.batch_buffer[:size].reshape(num, 3, imgH, imgW))
+
+    def recognize_quads(self, items):
+        """
+        recognize text quadrilaterals without cutting them out first. Every
+        quad is mapped by one perspective warp straight to its slot of a
+        preallocated batch and the batch is normalized in place, instead of
+        get_rotate_crop_image, resize, astype, normalize, pad and concatenate
+        per crop. The geometry follows get_rotate_crop_image, tall crops are
+        turned by 90 degrees the same way.
+        args:
+            items: list of (img, quad), img the BGR image and quad its 4x2
+                points
+        return:
+            rec_res, elapse like __call__
+        """
+        if self.fused_mode is None:
+            return self([
+                utility.get_rotate_crop_image(img,
+                                              np.array(quad, np.float32))
+                for img, quad in items
+            ])
+        img_num = len(items)
+        rec_res = [['', 0.0]] * img_num
+        st = time.time()
+        if img_num == 0:
+            return rec_res, 0.
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        assert imgC == 3
+
+        quads = np.array(
+            [quad for _, quad in items], dtype=np.float32).reshape(-1, 4, 2)
+        crop_w = np.maximum(
+            np.linalg.norm(quads[:, 0] - quads[:, 1], axis=1),
+            np.linalg.norm(quads[:, 2] - quads[:, 3], axis=1)).astype(np.int64)
+        crop_h = np.maximum(
+            np.linalg.norm(quads[:, 0] - quads[:, 3], axis=1),
+            np.linalg.norm(quads[:, 1] - quads[:, 2], axis=1)).astype(np.int64)
+        crop_w = np.maximum(crop_w, 1)
+        crop_h = np.maximum(crop_h, 1)
+        # np.rot90 of the crop is the crop of the quad starting at its
+        # second point
+        rotate = crop_h >= 1.5 * crop_w
+        quads[rotate] = quads[rotate][:, [1, 2, 3, 0]]
+        crop_w, crop_h = np.where(rotate, crop_h, crop_w), np.where(
+            rotate, crop_w, crop_h)
+        width_list = crop_w / crop_h.astype(np.float64)
+        indices = np.argsort(width_list)
+
+        batch_num = self.rec_batch_num
+        if self.benchmark:
+            self.autolog.times.start()
+        for beg_img_no in range(0, img_num, batch_num):
+            end_img_no = min(img_num, beg_img_no + batch_num)
+            batch_indices = indices[beg_img_no:end_img_no]
+            batch_w = imgW
+            if self.fused_mode == 'pad':
+                max_wh_ratio = max(imgW / imgH,
+                                   float(width_list[batch_indices].max()))
+                batch_w = int(imgH * max_wh_ratio)
+                if self.use_onnx:
+                    w = self.input_tensor.shape[3:][0]
+                    if w is not None and w > 0:
+                        batch_w = w
+            warp_batch, norm_img_batch = self.fused_buffers(
+                len(batch_indices), imgH, batch_w)
+            resized_ws = []
+            for slot, ino in enumerate(batch_indices):
+                img, _ = items[ino]
+                cw, ch = int(crop_w[ino]), int(crop_h[ino])
+                resized_w = batch_w
+                if self.fused_mode == 'pad':
+                    resized_w = min(batch_w,
+                                    int(math.ceil(imgH * width_list[ino])))
+                pts_std = np.float32([[0, 0], [cw, 0], [cw, ch], [0, ch]])
+                M = cv2.getPerspectiveTransform(quads[ino], pts_std)
+                # followed by the pixel center aligned cv2.resize to the slot
+                sx, sy = resized_w / cw, imgH / ch
+                S = np.array(
+                    [[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5],
+                     [0, 0, 1]],
+                    dtype=np.float64)
+                cv2.warpPerspective(
+                    img,
+                    S.dot(M), (resized_w, imgH),
+                    dst=warp_batch[slot, :, :resized_w],
+                    borderMode=cv2.BORDER_REPLICATE,
+                    flags=cv2.INTER_LINEAR)
+                resized_ws.append(resized_w)
+            np.multiply(
+                warp_batch.transpose((0, 3, 1, 2)),
+                np.float32(2. / 255),
+                out=norm_img_batch,
+                casting='unsafe')
+            norm_img_batch -= 1.
+            for slot, resized_w in enumerate(resized_ws):
+                norm_img_batch[slot, :, :, resized_w:] = 0.
+            if self.benchmark:
+                self.autolog.times.stamp()
+
+            preds = self.predict(norm_img_batch)
+            rec_result = self.postprocess_op(preds)
+            for rno in range(len(rec_result)):
+                rec_res[batch_indices[rno]] = rec_result[rno]
+            if self.benchmark:
+                self.autolog.times.end(stamp=True)
+        return rec_res, time.time() - st
+
     def __call__(self, img_list):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
@@ -499,24 +655,7 @@ class TextRecognizer(object):
                         self.autolog.times.stamp()
                     preds = outputs[0]
             else:
-                if self.use_onnx:
-                    input_dict = {}
-                    input_dict[self.input_tensor.name] = norm_img_batch
-                    outputs = self.predictor.run(self.output_tensors, input_dict)
-                    preds = outputs[0]
-                else:
-                    self.input_tensor.copy_from_cpu(norm_img_batch)
-                    self.predictor.run()
-                    outputs = []
-                    for output_tensor in self.output_tensors:
-                        output = output_tensor.copy_to_cpu()
-                        outputs.append(output)
-                    if self.benchmark:
-                        self.autolog.times.stamp()
-                    if len(outputs) != 1:
-                        preds = outputs
-                    else:
-                        preds = outputs[0]
+                preds = self.predict(norm_img_batch)
             rec_result = self.postprocess_op(preds)
             for rno in range(len(rec_result)):
                 rec_res[indices[beg_img_no + rno]] = rec_result[rno]
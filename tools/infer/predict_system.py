@@ -21,6 +21,7 @@ import tools.infer.predict_det as predict_det
 import tools.infer.predict_cls as predict_cls
 from ppocr.utils.utility import get_image_file_list, check_and_read
 from ppocr.utils.logging import get_logger
+from ppocr.utils.reading_order import sort_reading_order
 from tools.infer.utility import draw_ocr_box_txt, get_rotate_crop_image
 logger = get_logger()
 
@@ -39,6 +40,8 @@ class TextSystem(object):
 
         self.args = args
         self.crop_image_res_index = 0
+        # images with a side of at most this many pixels are not detected
+        self.min_side = 32
 
     def draw_crop_rec_res(self, output_dir, img_crop_list, rec_res):
         os.makedirs(output_dir, exist_ok=True)
@@ -52,24 +55,68 @@ class TextSystem(object):
         self.crop_image_res_index += bbox_num
         
      
-    def __call__(self, img, cls=True):
-        time_dict = {'det': 0, 'rec': 0, 'csl': 0, 'all': 0}
-        start = time.time()
-        ori_im = img.copy()
+    def detect(self, img):
+        """
+        run text detection on one image and return the boxes in reading order
+        """
         dt_boxes, elapse = self.text_detector(img)
-        time_dict['det'] = elapse
+        if dt_boxes is None:
+            return None, elapse
         logger.debug("dt_boxes num : {}, elapse : {}".format(
             len(dt_boxes), elapse))
-        if dt_boxes is None:
-            return None, None
-        img_crop_list = []
+        return sorted_boxes(dt_boxes), elapse
+
+    def fused_rec(self, cls=True):
+        """
+        whether the recognizer cuts the boxes itself, see
+        TextRecognizer.recognize_quads. The angle classifier and
+        save_crop_res need the crops as images.
+        """
+        return self.args.use_fused_rec and \
+            self.text_recognizer.fused_mode is not None and \
+            not (self.use_angle_cls and cls) and not self.args.save_crop_res
 
-        dt_boxes = sorted_boxes(dt_boxes)
+    def detect_batch(self, images):
+        """
+        detect text on several images with one det predictor call, boxes in
+        reading order or None per image. Images too small to be recognised
+        are left out of the batch and get None.
+        """
+        dt_boxes_list = [None] * len(images)
+        keep = []
+        for ino, img in enumerate(images):
+            if min(img.shape[:2]) <= self.min_side:
+                logger.info("The size of image {} is too small to be "
+                            "recognised".format(ino))
+            else:
+                keep.append(ino)
+        if keep:
+            for ino, dt_boxes in zip(keep, self.text_detector.detect_batch(
+                    [images[ino] for ino in keep])):
+                if dt_boxes is not None:
+                    dt_boxes_list[ino] = sorted_boxes(dt_boxes)
+        return dt_boxes_list
 
+    def crop(self, ori_im, dt_boxes, cls=True):
+        """
+        cut the boxes out of the image, or only pair them with it as
+        (img, quad) when recognize will use the fused recognizer path
+        """
+        if self.fused_rec(cls):
+            return [(ori_im, box) for box in dt_boxes]
+        img_crop_list = []
         for bno in range(len(dt_boxes)):
             tmp_box = copy.deepcopy(dt_boxes[bno])
             img_crop = get_rotate_crop_image(ori_im, tmp_box)
             img_crop_list.append(img_crop)
+        return img_crop_list
+
+    def recognize(self, img_crop_list, cls=True, time_dict=None):
+        """
+        run the optional angle classifier and the recognizer on a crop list
+        """
+        if time_dict is None:
+            time_dict = {}
         if self.use_angle_cls and cls:
             img_crop_list, angle_list, elapse = self.text_classifier(
                 img_crop_list)
@@ -77,19 +124,77 @@ class TextSystem(object):
             logger.debug("cls num  : {}, elapse : {}".format(
                 len(img_crop_list), elapse))
 
-        rec_res, elapse = self.text_recognizer(img_crop_list)
+        if self.fused_rec(cls):
+            rec_res, elapse = self.text_recognizer.recognize_quads(
+                img_crop_list)
+        else:
+            rec_res, elapse = self.text_recognizer(img_crop_list)
         time_dict['rec'] = elapse
         logger.debug("rec_res num  : {}, elapse : {}".format(
             len(rec_res), elapse))
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
-    
+        return rec_res
+
+    def recognize_pooled(self, crop_lists, cls=True):
+        """
+        recognize the crops of several images in one recognizer call, so the
+        aspect ratio sort and the rec batches span all of them, and split the
+        results back per image
+        """
+        img_crop_list = [img_crop for crops in crop_lists for img_crop in crops]
+        rec_res = self.recognize(img_crop_list, cls) if img_crop_list else []
+        rec_res_list = []
+        beg = 0
+        for crops in crop_lists:
+            rec_res_list.append(rec_res[beg:beg + len(crops)])
+            beg += len(crops)
+        return rec_res_list
+
+    def batch(self, images, cls=True):
+        """
+        run the system on a list of images with batched det and cross-image
+        rec batching
+        return:
+            a (filter_boxes, filter_rec_res) tuple per image, (None, None)
+            when detection fails
+        """
+        dt_boxes_list = self.detect_batch(images)
+        crop_lists = []
+        for img, dt_boxes in zip(images, dt_boxes_list):
+            crop_lists.append(
+                self.crop(img, dt_boxes, cls) if dt_boxes is not None else [])
+
+        rec_res_list = self.recognize_pooled(crop_lists, cls)
+        results = []
+        for dt_boxes, rec_res in zip(dt_boxes_list, rec_res_list):
+            if dt_boxes is None:
+                results.append((None, None))
+            else:
+                results.append(self.filter_rec_res(dt_boxes, rec_res))
+        return results
+
+    def filter_rec_res(self, dt_boxes, rec_res):
         filter_boxes, filter_rec_res = [], [] 
         for box, rec_result in zip(dt_boxes, rec_res): 
             text, score = rec_result 
             if score >= self.drop_score:
                 filter_boxes.append(box)
                 filter_rec_res.append(rec_result)
+        return filter_boxes, filter_rec_res
+
+    def __call__(self, img, cls=True):
+        time_dict = {'det': 0, 'rec': 0, 'csl': 0, 'all': 0}
+        start = time.time()
+        ori_im = img.copy()
+        dt_boxes, elapse = self.detect(img)
+        time_dict['det'] = elapse
+        if dt_boxes is None:
+            return None, None, time_dict
+
+        img_crop_list = self.crop(ori_im, dt_boxes, cls)
+        rec_res = self.recognize(img_crop_list, cls, time_dict)
+        filter_boxes, filter_rec_res = self.filter_rec_res(dt_boxes, rec_res)
         end = time.time()
         time_dict['all'] = end - start 
         return filter_boxes, filter_rec_res, time_dict 
@@ -104,23 +209,7 @@ def sorted_boxes(dt_boxes):
     return:
         sorted boxes(array) with shape [4, 2]
     """
-    num_boxes = dt_boxes.shape[0]
-    if abs(num_boxes - 2) < 1e-4:
-        sorted_boxes = sorted(dt_boxes, key=lambda x: (x[1], x[0]))
-    else:
-        sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-    _boxes = list(sorted_boxes)
-
-    for i in range(num_boxes - 1):
-        for j in range(i, 0, -1):
-            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and \
-                    (_boxes[j + 1][0][0] < _boxes[j][0][0]):
-                tmp = _boxes[j]
-                _boxes[j] = _boxes[j + 1]
-                _boxes[j + 1] = tmp
-            else:
-                break
-    return _boxes
+    return sort_reading_order(dt_boxes)
 
 
 def main(args):
@@ -33,6 +33,12 @@ def init_args():
     parser.add_argument("--det_model_dir", type=str, default='./saved_model/det/')
     parser.add_argument("--det_limit_side_len", type=float, default=960)
     parser.add_argument("--det_limit_type", type=str, default='max')
+    # tiled detection for large scans, 0 disables
+    parser.add_argument("--det_tile_size", type=int, default=0)
+    parser.add_argument("--det_tile_overlap", type=int, default=128)
+    parser.add_argument("--det_tile_scale", type=float, default=1.0)
+    parser.add_argument("--det_tile_batch_num", type=int, default=4)
+    parser.add_argument("--det_tile_merge_thresh", type=float, default=0.5)
 
     # DB parmas
     parser.add_argument("--det_db_thresh", type=float, default=0.015) # 0.3
@@ -72,6 +78,7 @@ def init_args():
     parser.add_argument("--rec_model_dir", type=str, default='./saved_model/rec/')
     parser.add_argument("--rec_image_shape", type=str, default="3, 48, 320")
     parser.add_argument("--rec_batch_num", type=int, default=6)
+    parser.add_argument("--use_fused_rec", type=str2bool, default=True)
     parser.add_argument("--max_text_length", type=int, default=40)
     parser.add_argument("--rec_char_dict_path",type=str, default="./config/rec/korean_dict.txt")
     parser.add_argument("--use_space_char", type=str2bool, default=True)
@@ -118,6 +125,10 @@ def init_args():
     parser.add_argument("--total_process_num", type=int, default=1)
     parser.add_argument("--process_id", type=int, default=0)
 
+    # pipelined auto labeling
+    parser.add_argument("--decode_workers", type=int, default=4)
+    parser.add_argument("--pipeline_queue_size", type=int, default=8)
+
     parser.add_argument("--benchmark", type=str2bool, default=False)
     parser.add_argument("--save_log_path", type=str, default="./log/")
 